@@ -14,6 +14,26 @@ CXX_FLAGS_ASAN="$CXX_FLAGS -O2 -g -fno-omit-frame-pointer -fsanitize=address,lea
 # LINK_FLAGS="-Wl,-z,stack-size=268435456"
 LINK_FLAGS=""
 
+# Name of the namespace in the test sources which is replaced with a random
+# one, so that the solution can't refer to it
+HIDDEN_NAMESPACE="randomized_namespace_name"
+
+function list_test_srcs {
+    echo $1/*.cc $1/utils/utils.cc
+}
+
+# Cache of the test objects shared by the builds on the grading host, set in
+# the environment of the build (disabled by default). The entries are signed
+# with the key from OBJECT_CACHE_KEY_FILE, which must be readable only by the
+# builds; the cache directory should be read-only for the tests (owned by
+# another user or not mounted into their sandbox).
+OBJECT_CACHE_DIR=${OBJECT_CACHE_DIR:-}
+OBJECT_CACHE_KEY_FILE=${OBJECT_CACHE_KEY_FILE:-}
+OBJECT_CACHE_SIZE_MB=${OBJECT_CACHE_SIZE_MB:-2048}
+# Unity build of the test sources, enabled if set to non-empty value in the
+# environment of the build. Solution sources are always compiled separately.
+UNITY_BUILD=${UNITY_BUILD:-}
+
 function build_solution {
     SOLUTION_FILE=${1:-SOLUTION_FILE}
     TEST_ZIP=${2:-TEST_ZIP}
@@ -39,8 +59,8 @@ function build_solution {
     fi
 
     TEST_SRC_DIR=$TEMP_DIR/tests_src
-    TEST_SRCS="$TEST_SRC_DIR/*.cc $TEST_SRC_DIR/utils/utils.cc"
     unzip -qq -DD -o -d $TEST_SRC_DIR $TEST_ZIP &>/dev/null
+    TEST_SRCS=$(list_test_srcs $TEST_SRC_DIR)
 
     # Source code pre-compile check
 
@@ -54,83 +74,65 @@ function build_solution {
 
     # Randomization
 
-    set +o pipefail
-    HIDDEN_NAMESPACE="randomized_namespace_name"
-    randomized_namespace=$(cat /dev/urandom | tr -dc '[:alpha:]' | fold -w 30 | head -n 1)
-    set -o pipefail
+    if [[ -s $TEST_SRC_DIR/namespace_variants.txt ]]; then
+        # One of the names generated by make_package.sh, the test objects
+        # which don't depend on the solution are precompiled for each of them.
+        # The file is removed, so that the solution can't read it, and all
+        # the names are hidden from the output.
+        randomized_namespace=$(shuf -n 1 $TEST_SRC_DIR/namespace_variants.txt)
+        namespace_variants=$(cat $TEST_SRC_DIR/namespace_variants.txt)
+        rm -f $TEST_SRC_DIR/namespace_variants.txt
+    else
+        set +o pipefail
+        randomized_namespace=$(cat /dev/urandom | tr -dc '[:alpha:]' | fold -w 30 | head -n 1)
+        set -o pipefail
+        namespace_variants=$randomized_namespace
+    fi
     sed -i "s|${HIDDEN_NAMESPACE}|${randomized_namespace}|g" $TEST_SRCS $TEST_HDRS || true
 
     # Compilation
-
-    function remove_paths_from_log {
-        sed -i "s|$SOLUTION_SRC_DIR/||g" $1
-        sed -i "s|$TEST_SRC_DIR/||g" $1
-        sed -i "s|$HIDDEN_NAMESPACE|HIDDEN|g" $1 || true
-        sed -i "s|$randomized_namespace|HIDDEN|g" $1 || true
-        perl -i -ne 'print if not (/gtest/ or /gmock/)' $1
-    }
-
-    function compile_tests {
-        local CXX_CMD="$CXX -I$TEST_SRC_DIR -I$SOLUTION_SRC_DIR -I$TEMP_DIR $1"
-        local COMPILE_DIR=$TEMP_DIR/$2
-        local PRECOMPILED_OBJ_DIR=$TEST_SRC_DIR/$2
-        local OUT_EXE=$3
-
-        mkdir -p $COMPILE_DIR
-        cd $COMPILE_DIR
-
-        if [[ -n "$SOLUTION_SRCS" ]]; then
-          touch solution_compiler_output.log
-          exitcode=`$CXX_CMD -c $SOLUTION_SRCS &> solution_compiler_output.log || echo $?`
-          remove_paths_from_log solution_compiler_output.log
-          grep -e note -e warning -e error  solution_compiler_output.log || true
-          if [[ -n $exitcode ]]; then
-              false;
-          fi;
-        fi;
-
-        touch tests_compiler_output.log
-        exitcode=`$CXX_CMD -c $TEST_SRCS &> tests_compiler_output.log || echo $?`
-        remove_paths_from_log tests_compiler_output.log
-        grep -e note -e warning -e error  tests_compiler_output.log || true
-        if [[ -n $exitcode ]]; then
-            false;
-        fi;
-
-        if [[ -d $PRECOMPILED_OBJ_DIR ]]; then
-            cp $PRECOMPILED_OBJ_DIR/* ./
-        fi
-        function compile_if_missing {
-            if [[ ! -f $2 ]]; then
-                $CXX_CMD -c $TEST_SRC_DIR/$1 -o $2 &> tests_compiler_output.log
-            fi
-        }
-
-        compile_if_missing gtest/gtest-all.cc gtest.o
-        compile_if_missing gmock/gmock-all.cc gmock.o
-        compile_if_missing gmock/gmock_main.cc gmock_main.o
-
-        touch linker_output.log
-        if [[ -n `( \
-                    $CXX_CMD $LINK_FLAGS *.o -o $OUT_EXE 2>&1 \
-                    | perl -ne 'print if not (/gtest/ or /[a-zA-Z0-9_]+[.]o[:]/)' \
-                  ) &>linker_output.log || echo $?` ]]; then
-            remove_paths_from_log linker_output.log;
-            cat linker_output.log && false;
-        fi;
-
-        cd - &>/dev/null
-    }
-
-    compile_tests "$CXX_FLAGS_DBG" obj_dbg "$OUTPUT_DIR"/tests_dbg
-    compile_tests "$CXX_FLAGS_OPT" obj_opt "$OUTPUT_DIR"/tests_opt
-    compile_tests "$CXX_FLAGS_ASAN" obj_asan "$OUTPUT_DIR"/tests_asan
-    # compile_tests "$CXX_FLAGS_MSAN" obj_msan "$OUTPUT_DIR"/tests_msan
+    # Every translation unit of every edition is compiled as a separate job
+    # in parallel, each edition is linked as soon as its objects are ready.
+    # Diagnostics are printed without the paths and the hidden namespace.
+    # MSan edition: --edition="obj_msan:$OUTPUT_DIR/tests_msan:$CXX_FLAGS_MSAN"
+
+    python3 "$TEST_SRC_DIR"/testerlib/build.py \
+      --cxx="$CXX -I$TEST_SRC_DIR -I$SOLUTION_SRC_DIR -I$TEMP_DIR" \
+      --link-flags="$LINK_FLAGS" \
+      --test-src-dir="$TEST_SRC_DIR" \
+      --temp-dir="$TEMP_DIR" \
+      --solution-srcs $SOLUTION_SRCS \
+      --test-srcs $TEST_SRCS \
+      --strip-paths "$SOLUTION_SRC_DIR/" "$TEST_SRC_DIR/" \
+      --hidden-names "$HIDDEN_NAMESPACE" $namespace_variants \
+      --precompiled-variant="ns_$randomized_namespace" \
+      --cache-dir="$OBJECT_CACHE_DIR" \
+      --cache-key-file="$OBJECT_CACHE_KEY_FILE" \
+      --cache-size-mb="$OBJECT_CACHE_SIZE_MB" \
+      ${UNITY_BUILD:+--unity} \
+      --edition="obj_dbg:$OUTPUT_DIR/tests_dbg:$CXX_FLAGS_DBG" \
+      --edition="obj_opt:$OUTPUT_DIR/tests_opt:$CXX_FLAGS_OPT" \
+      --edition="obj_asan:$OUTPUT_DIR/tests_asan:$CXX_FLAGS_ASAN"
+    # Precompiled test objects are named after the namespace variants
+    rm -rf "$TEST_SRC_DIR"/obj_*/ns_*/
 
     # Copy helper scripts
 
-    cp "$TEST_SRC_DIR"/tester_config.py "$OUTPUT_DIR"/
     cp "$TEST_SRC_DIR"/testerlib/*.py "$OUTPUT_DIR"/
+    # Hidden names and paths removed from the output of the tests shown to
+    # the students, like from the compiler output above
+    {
+        printf 'hidden %s\n' "$HIDDEN_NAMESPACE" $namespace_variants
+        printf 'path %s\n' "$SOLUTION_SRC_DIR/" "$TEST_SRC_DIR/" "$TEMP_DIR/"
+    } > "$OUTPUT_DIR"/output_filter.txt
+    if [[ -f "$TEST_SRC_DIR"/tester_config.json ]]; then
+        # Declarative config is resolved into test_plan.json once, so the
+        # configuration errors fail the build
+        python3 "$OUTPUT_DIR"/test_plan.py \
+          --config "$TEST_SRC_DIR"/tester_config.json --build-dir "$OUTPUT_DIR"
+    else
+        cp "$TEST_SRC_DIR"/tester_config.py "$OUTPUT_DIR"/
+    fi
 }
 
 function precompile_libs {
@@ -152,6 +154,15 @@ function precompile_libs {
         $CXX_CMD -c "$LIBS_DIR/gmock/gmock-all.cc" -o gmock.o
         $CXX_CMD -c "$LIBS_DIR/gmock/gmock_main.cc" -o gmock_main.o
 
+        # Precompiled gtest/gmock and utils.h headers, used by the build only
+        # with the same compiler (see build.py). The headers are extracted
+        # without their timestamps, so only their sizes are validated.
+        if $CXX --version | grep -q clang; then
+            $CXX_CMD -Xclang -fno-pch-timestamp \
+              -x c++-header "$LIBS_DIR/utils/tests_pch.h" -o tests.pch
+            $CXX --version &> tests.pch.version
+        fi
+
         cd - &>/dev/null
 
         zip -r "$PACKAGE_ZIP" "$2"/
@@ -162,6 +173,44 @@ function precompile_libs {
     precompile "$CXX_FLAGS_OPT" obj_opt
     precompile "$CXX_FLAGS_ASAN" obj_asan
     # precompile "$CXX_FLAGS_MSAN" obj_msan
+
+    # Test objects for each of the hidden namespace variants. Only the
+    # translation units which compile without the solution are kept.
+
+    local NAMESPACE_VARIANTS_FILE=$TEMP_DIR/namespace_variants.txt
+    unzip -qq -o -d $TEMP_DIR $PACKAGE_ZIP namespace_variants.txt \
+        &>/dev/null || true
+    if [[ ! -s $NAMESPACE_VARIANTS_FILE ]]; then
+        return 0
+    fi
+
+    function precompile_tests {
+        local CXX_CMD="$CXX -I$VARIANT_DIR $1"
+        local COMPILE_DIR=$TEMP_DIR/$2/ns_$namespace
+
+        mkdir -p "$COMPILE_DIR"
+        for src in $(list_test_srcs $VARIANT_DIR); do
+            local obj=$COMPILE_DIR/$(basename "${src%.*}").o
+            $CXX_CMD -c "$src" -o "$obj" &>/dev/null || rm -f "$obj"
+        done
+    }
+
+    local VARIANT_DIR=$TEMP_DIR/tests_variant
+    for namespace in $(cat $NAMESPACE_VARIANTS_FILE); do
+        rm -rf "$VARIANT_DIR"
+        unzip -qq -o -d "$VARIANT_DIR" $PACKAGE_ZIP -x 'obj_*' &>/dev/null
+        sed -i "s|${HIDDEN_NAMESPACE}|${namespace}|g" \
+            $(list_test_srcs $VARIANT_DIR) || true
+
+        precompile_tests "$CXX_FLAGS_DBG" obj_dbg
+        precompile_tests "$CXX_FLAGS_OPT" obj_opt
+        precompile_tests "$CXX_FLAGS_ASAN" obj_asan
+        # precompile_tests "$CXX_FLAGS_MSAN" obj_msan
+    done
+    rm -rf "$VARIANT_DIR" "$NAMESPACE_VARIANTS_FILE"
+
+    zip -r "$PACKAGE_ZIP" obj_*/ns_*/
+    rm -rf obj_*/
 }
 
 if [[ $1 == "--precompile" ]]; then
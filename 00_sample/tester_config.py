@@ -1,5 +1,6 @@
 import os
 
+from base import TimeLimitMode
 from configurator import Configurator
 from gtest import prepare_google_test_runner
 from fake_test import FakeTestRunner
@@ -15,6 +16,11 @@ def configure(build_dir, dry_run):
         # Для более длительных тестов лимит по времени можно задать с помощью
         # `override_time_limit`.
         default_time_limit_sec=1,
+        # Какое время сравнивается с лимитом по умолчанию: астрономическое
+        # (`TimeLimitMode.WALL`), процессорное (`TimeLimitMode.CPU`, не зависит
+        # от нагрузки на проверяющую машину) или оба (`TimeLimitMode.BOTH`).
+        # Для отдельных тестов задаётся с помощью `override_time_limit_mode`.
+        default_time_limit_mode=TimeLimitMode.WALL,
         # Ограничение по памяти по умолчанию. Лимиты для определённых тестов
         # задаются с помощью `override_memory_limit`.
         # !!! ВАЖНО !!! Ограничения по памяти носят статус экспериментальных,
@@ -28,6 +28,10 @@
 from enum import Enum
 
 
+class ConfigurationError(Exception):
+    pass
+
+
 class Verdict(Enum):
     CHECK_FAILED = 0,
     ACCEPTED = 1,
@@ -44,10 +48,21 @@ class TestType(Enum):
     PRIVATE = 3,
 
 
+class TimeLimitMode(Enum):
+    # Wall clock time
+    WALL = 0,
+    # User + system CPU time
+    CPU = 1,
+    # Both wall clock and CPU time
+    BOTH = 2,
+
+
 class ResourceLimits:
-    def __init__(self, time_sec, memory_kb):
+    def __init__(self, time_sec, memory_kb,
+                 time_limit_mode: TimeLimitMode = TimeLimitMode.WALL):
         self.time_sec = time_sec
         self.memory_kb = memory_kb
+        self.time_limit_mode = time_limit_mode
 
 
 class TestDescription:
@@ -59,7 +74,6 @@ class TestDescription:
         self.test_name = test_name
         self.max_score = max_score
         self.type = type
-        self.dependencies = []
         self.resource_limits = resource_limits
         self.exclude_from_aggregation = exclude_from_aggregation
 
@@ -68,10 +82,44 @@ class TestDescription:
 
 
 class TestResult:
-    def __init__(self, verdict, score, time_sec):
+    def __init__(self, verdict, score, time_sec, peak_memory_kb=None,
+                 cpu_time_sec=None):
         self.verdict = verdict
         self.score = score
+        # Wall clock time
         self.time_sec = time_sec
+        # Peak resident memory of the processes, None if unknown
+        self.peak_memory_kb = peak_memory_kb
+        # User + system CPU time, None if unknown
+        self.cpu_time_sec = cpu_time_sec
+        # Last bytes of the output of a failed test, if it was captured
+        self.stdout_tail = None
+        self.stderr_tail = None
+
+    def update_peak_memory(self, peak_memory_kb):
+        if peak_memory_kb is not None:
+            self.peak_memory_kb = max(self.peak_memory_kb or 0, peak_memory_kb)
+
+
+class RunnerOptions:
+    def __init__(self, gtest_batch_size=None, gtest_shards_count=None,
+                 gtest_repeat_in_process=None, gtest_random_seed=None,
+                 gtest_editions_concurrency=None,
+                 gtest_edition_stats_path=None, output_tail_kb=None):
+        # Number of Google Test cases executed in a single process
+        self.gtest_batch_size = gtest_batch_size
+        # Number of concurrent processes each batch is spread across
+        self.gtest_shards_count = gtest_shards_count
+        # Whether repeated runs are done by --gtest_repeat in a single process
+        self.gtest_repeat_in_process = gtest_repeat_in_process
+        # Seed for --gtest_shuffle of the repeated runs
+        self.gtest_random_seed = gtest_random_seed
+        # Number of editions of a test binary executed concurrently
+        self.gtest_editions_concurrency = gtest_editions_concurrency
+        # File with statistics used to choose the order of editions
+        self.gtest_edition_stats_path = gtest_edition_stats_path
+        # Size (in KB) of the output kept for failed tests, 0 to disable
+        self.output_tail_kb = output_tail_kb
 
 
 class TestRunner:
@@ -79,6 +127,33 @@ class TestRunner:
     def run(self, description: TestDescription):
         raise NotImplementedError('TestRunner.run(...)')
 
+    # Called before the testing with descriptions of all the tests which are
+    # going to be run
+    def prepare(self, descriptions):
+        pass
+
+    # Called after the testing is finished
+    def finalize(self):
+        pass
+
+    # Returns the key of the batch the test is executed in together with
+    # the other tests with the same key, or None if it's executed alone
+    def get_batch(self, description: TestDescription):
+        return None
+
+    # Executes the tests of one batch (which are ready to run) and returns
+    # the list of their TestResult
+    def run_batch(self, descriptions):
+        raise NotImplementedError('TestRunner.run_batch(...)')
+
+    # Returns list of lines with runner-specific test configuration
+    def describe(self, description: TestDescription):
+        return []
+
+    # Overrides runner settings with the command line ones
+    def apply_options(self, options: RunnerOptions):
+        pass
+
     # returns list of Test
     def get_tests(self):
         raise NotImplementedError('TestRunner.get_tests()')
@@ -112,6 +187,7 @@ class TestGroup:
 
         self.result.score += test.result.score
         self.result.time_sec += test.result.time_sec
+        self.result.update_peak_memory(test.result.peak_memory_kb)
         if test.result.verdict == Verdict.ACCEPTED:
             self.passed_tests_count += 1
         else:
@@ -132,6 +208,7 @@ class TestingReport:
 
         self.result.score += group.result.score
         self.result.time_sec += group.result.time_sec
+        self.result.update_peak_memory(group.result.peak_memory_kb)
         if group.result.score > 0:
             self.result.verdict = Verdict.ACCEPTED
 
@@ -25,15 +25,19 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import math
 import os
 import platform
-import subprocess
 import sys
+import tempfile
 import threading
 
-from tempfile import TemporaryDirectory
+from timeit import default_timer as timer
 
-from base import Verdict
+from base import TimeLimitMode, Verdict
+from execution_backend import ProcessLimits, get_execution_backend
+from process_reaper import OutputCapture, ProcessReaper
+from workspace import get_workspace
 
 if sys.version_info[1] >= 3:
     from subprocess import TimeoutExpired
@@ -52,100 +56,298 @@ def maybe_add_exe_extension(path):
     return path
 
 
-class ProcessWithTimeout:
-    def __init__(self, timeout):
-        self.timeout = timeout
-        self.process = None
+_devnull = None
+_devnull_lock = threading.Lock()
 
-    def run(self, *args, **kwargs):
-        def target():
-            self.process = subprocess.Popen(*args, **kwargs)
-            self.process.communicate()
 
-        if self.timeout is not None:
-            thread = threading.Thread(target=target)
-            thread.start()
+# The null device is opened once and shared by all the processes
+def _get_devnull():
+    global _devnull
+    with _devnull_lock:
+        if _devnull is None:
+            _devnull = open(os.devnull, 'wb')
+        return _devnull
 
-            thread.join(self.timeout)
-            if thread.is_alive():
-                self.process.terminate()
-                thread.join(self.timeout)
-                assert (not thread.is_alive())
-                return (True, self.process.returncode)
 
-            return (False, self.process.returncode)
+def _fileno(output):
+    return output if isinstance(output, int) else output.fileno()
 
-        else:
-            target()
-            return (False, self.process.returncode)
+
+# Removes the hidden names and the absolute paths from the captured output of
+# the binaries before it's shown to the students, the same way build.sh does
+# with the compiler output. Loaded from the file written by build.sh into the
+# build directory, with lines `hidden NAME` and `path PATH`.
+class OutputFilter:
+    FILENAME = 'output_filter.txt'
+    HIDDEN_NAME_REPLACEMENT = 'HIDDEN'
+
+    def __init__(self, hidden_names=(), strip_paths=()):
+        self._hidden_names = [name for name in hidden_names if name]
+        self._strip_paths = [path for path in strip_paths if path]
+
+    @staticmethod
+    def load(path):
+        hidden_names = []
+        strip_paths = []
+        with open(path, 'r') as f:
+            for line in f:
+                (kind, _, value) = line.rstrip('\n').partition(' ')
+                if kind == 'hidden':
+                    hidden_names.append(value)
+                elif kind == 'path':
+                    strip_paths.append(value)
+        return OutputFilter(hidden_names, strip_paths)
+
+    # `paths` are removed as well, e.g. the working directory of the process
+    def apply(self, text, paths=()):
+        all_paths = self._strip_paths + \
+            [path.rstrip('/') + '/' for path in paths if path]
+        for path in sorted(all_paths, key=len, reverse=True):
+            text = text.replace(path, '')
+        for name in self._hidden_names:
+            text = text.replace(name, self.HIDDEN_NAME_REPLACEMENT)
+        return text
+
+
+_output_filter = OutputFilter()
+
+
+def get_output_filter():
+    return _output_filter
+
+
+def set_output_filter(output_filter: OutputFilter):
+    global _output_filter
+    _output_filter = output_filter
+
+
+class ExecutionResult:
+    def __init__(self, verdict, exitcode=0, time_sec=0, cpu_time_sec=None,
+                 peak_memory_kb=None):
+        self.verdict = verdict
+        self.exitcode = exitcode
+        # Wall clock time
+        self.time_sec = time_sec
+        # User + system CPU time, None if unknown
+        self.cpu_time_sec = cpu_time_sec
+        # Peak resident set size, None if unknown
+        self.peak_memory_kb = peak_memory_kb
+        # Last bytes of the output (decoded), if it was captured
+        self.stdout_tail = None
+        self.stderr_tail = None
 
 
 class BinaryWrapper:
+    # Wall clock limit of the processes with CPU time limit is this times
+    # larger, so that only hanging processes are killed by it
+    CPU_MODE_WALL_TIME_LIMIT_FACTOR = 3
+    # Messages printed to stderr when an allocation fails (uncaught
+    # std::bad_alloc, ENOMEM). With RLIMIT_AS the allocation fails before the
+    # memory is resident, so these are the evidence of the exceeded limit.
+    ALLOCATION_FAILURE_MARKERS = (b'std::bad_alloc', b'out of memory',
+                                  b'Cannot allocate memory')
+    # How much of stderr is searched for the markers
+    STDERR_TAIL_BYTES = 4096
+    # Shell which applies the limits before executing the binary
+    SHIM_SHELL_PATH = '/bin/sh'
+    # Default size of the output kept for failed executions
+    OUTPUT_TAIL_KB = 64
+
     def __init__(self, binary_path, dry_run):
         self._binary_path = os.path.abspath(
             maybe_add_exe_extension(binary_path))
+        self._name = os.path.basename(binary_path)
         self._dry_run = dry_run
 
+    def name(self):
+        return self._name
+
     def run(self, args, time_limit_sec=None, memory_limit_kb=None,
-            suppress_output=True, cwd=None):
+            suppress_output=True, cwd=None, env=None,
+            stdout_line_handler=None, cancel_event=None,
+            time_limit_mode=TimeLimitMode.WALL,
+            output_tail_kb=OUTPUT_TAIL_KB):
         if cwd is None:
-            with TemporaryDirectory(dir=os.curdir) as tmp:
+            with get_workspace().acquire() as tmp:
                 return self._execute(args, tmp, time_limit_sec,
-                                     memory_limit_kb, suppress_output)
+                                     memory_limit_kb, suppress_output, env,
+                                     stdout_line_handler, cancel_event,
+                                     time_limit_mode, output_tail_kb)
         else:
             return self._execute(args, cwd, time_limit_sec,
-                                 memory_limit_kb, suppress_output)
+                                 memory_limit_kb, suppress_output, env,
+                                 stdout_line_handler, cancel_event,
+                                 time_limit_mode, output_tail_kb)
 
+    # If `stdout_line_handler` is specified, it's called with every line of
+    # stdout of the binary (bytes without the newline) while it runs.
+    # The binary is terminated once `cancel_event` is set. If the output isn't
+    # suppressed, its last `output_tail_kb` KB are kept in the result of a
+    # failed execution (except on Windows).
+    # The output is captured with pipes into ring buffers, so the memory is
+    # bounded regardless of how much the binary prints.
     def _execute(self, args, cwd, time_limit_sec=None, memory_limit_kb=None,
-                 suppress_output=True):
-        if not suppress_output:
-            raise not NotImplementedError('pipe binary output')
-
+                 suppress_output=True, env=None, stdout_line_handler=None,
+                 cancel_event=None, time_limit_mode=TimeLimitMode.WALL,
+                 output_tail_kb=OUTPUT_TAIL_KB):
         if self._dry_run:
-            return Verdict.ACCEPTED
+            return ExecutionResult(Verdict.ACCEPTED)
         if args is None:
             args = []
 
         exec_params = dict()
+        if env is not None:
+            exec_params['env'] = dict(os.environ, **env)
+
+        tail_bytes = output_tail_kb * 1024
+        capture_output = not suppress_output and not _is_running_on_windows()
+        stdout_file = None
+        stdout_capture = None
+        if stdout_line_handler is not None and _is_running_on_windows():
+            stdout_file = tempfile.TemporaryFile()
+        elif stdout_line_handler is not None or capture_output:
+            stdout_capture = OutputCapture(
+                tail_bytes if capture_output else 0, stdout_line_handler)
+        # Stderr is also kept to recognize allocation failures
+        stderr_capture = None
+        if capture_output:
+            stderr_capture = OutputCapture(tail_bytes)
+        elif memory_limit_kb is not None and not self._is_asan_build() and \
+                not _is_running_on_windows():
+            stderr_capture = OutputCapture(self.STDERR_TAIL_BYTES)
+
+        exec_params['stdout'] = _get_devnull()
+        if stdout_file is not None:
+            exec_params['stdout'] = stdout_file
+        elif stdout_capture is not None:
+            exec_params['stdout'] = stdout_capture.write_fd
+        exec_params['stderr'] = _get_devnull()
+        if stderr_capture is not None:
+            exec_params['stderr'] = stderr_capture.write_fd
+        captures = [capture for capture in (stdout_capture, stderr_capture)
+                    if capture is not None]
+
+        try:
+            result = self._execute_limited(
+                args, cwd, exec_params, time_limit_sec, memory_limit_kb,
+                time_limit_mode, cancel_event, captures, stderr_capture)
+            if stdout_file is not None:
+                stdout_file.seek(0)
+                for line in stdout_file:
+                    stdout_line_handler(line.rstrip(b'\r\n'))
+            if capture_output and result.verdict != Verdict.ACCEPTED:
+                paths = (os.path.abspath(cwd),
+                         os.path.dirname(self._binary_path))
+                result.stdout_tail = get_output_filter().apply(
+                    stdout_capture.getvalue().decode('utf-8', 'replace'),
+                    paths)
+                result.stderr_tail = get_output_filter().apply(
+                    stderr_capture.getvalue().decode('utf-8', 'replace'),
+                    paths)
+            return result
+        finally:
+            if stdout_file is not None:
+                stdout_file.close()
+            for capture in captures:
+                capture.close()
 
-        exec_params['stdout'] = open(os.devnull, 'w')
-        exec_params['stderr'] = open(os.devnull, 'w')
-
-        if not _is_running_on_windows():
-            def limit_process_resources():
-                # The following code works on real Linux but crashes on WSL
-                if time_limit_sec is not None:
-                    # We hope that the code with 'kill by timer' logic works fine,
-                    # but lets leave this rlimit still active until the new way of
-                    # TLE detection will be properly tested.
-                    import resource
-                    resource.setrlimit(
-                        resource.RLIMIT_CPU,
-                        (time_limit_sec * 2, time_limit_sec * 2)
-                    )
-                if memory_limit_kb is not None:
-                    # TODO: Remove this *temporary* hack
-                    if not self._binary_path.endswith(('_asan', '_asan.exe')):
-                        import resource
-                        resource.setrlimit(
-                            resource.RLIMIT_AS,
-                            (memory_limit_kb * 1024, memory_limit_kb * 1024)
-                        )
-
-            exec_params['preexec_fn'] = limit_process_resources
-
-        #try:
-            # exitcode = call([self._binary_path] + args, cwd=cwd, **exec_params)
-
-        proc = ProcessWithTimeout(timeout=time_limit_sec)
-        (killed_by_timer, exitcode) = \
-            proc.run([self._binary_path] + args, cwd=cwd, **exec_params)
+    def _execute_limited(self, args, cwd, exec_params, time_limit_sec,
+                         memory_limit_kb, time_limit_mode, cancel_event,
+                         captures, stderr_capture):
+        wall_time_limit_sec = time_limit_sec
+        cpu_time_limit_sec = None
+        rlimit_cpu_sec = None
+        if time_limit_sec is not None:
+            if time_limit_mode == TimeLimitMode.WALL:
+                rlimit_cpu_sec = int(math.ceil(time_limit_sec * 2))
+            else:
+                cpu_time_limit_sec = time_limit_sec
+                # The exceeded limit is detected after the process finishes,
+                # and RLIMIT_CPU makes sure that it does finish soon after
+                rlimit_cpu_sec = int(math.ceil(time_limit_sec)) + 1
+            if time_limit_mode == TimeLimitMode.CPU:
+                wall_time_limit_sec = \
+                    time_limit_sec * self.CPU_MODE_WALL_TIME_LIMIT_FACTOR
+
+        # We hope that the code with 'kill by timer' logic works fine, but
+        # lets leave the CPU limit still active until the new way of TLE
+        # detection will be properly tested.
+        limits = ProcessLimits(cpu_time_sec=rlimit_cpu_sec)
+        # TODO: Remove this *temporary* hack
+        if not self._is_asan_build():
+            limits.memory_kb = memory_limit_kb
+        sandbox = get_execution_backend().create_sandbox(limits)
+
+        try:
+            start_time = timer()
+            (killed_by_timer, exitcode, rusage) = self._launch(
+                args, cwd, exec_params, sandbox, wall_time_limit_sec,
+                cancel_event, captures)
+            finish_time = timer()
+            usage = sandbox.collect(rusage)
+        finally:
+            sandbox.close()
+        cpu_time_sec = usage.cpu_time_sec
+        peak_memory_kb = usage.peak_memory_kb
 
         if killed_by_timer:
-            return Verdict.TIME_LIMIT_EXCEEDED
+            verdict = Verdict.TIME_LIMIT_EXCEEDED
+        elif cpu_time_limit_sec is not None and cpu_time_sec is not None and \
+                cpu_time_sec > cpu_time_limit_sec:
+            verdict = Verdict.TIME_LIMIT_EXCEEDED
+        elif usage.memory_limit_hit or self._is_memory_limit_exceeded(
+                exitcode, peak_memory_kb, memory_limit_kb, stderr_capture):
+            verdict = Verdict.MEMORY_LIMIT_EXCEEDED
+        elif exitcode == 0:
+            verdict = Verdict.ACCEPTED
+        else:
+            verdict = Verdict.FAILED
+
+        return ExecutionResult(verdict, exitcode, finish_time - start_time,
+                               cpu_time_sec, peak_memory_kb)
+
+    # The process is supervised (and killed on timeout together with its
+    # process group) by the shared reaper thread. Where possible, it's started
+    # with posix_spawn through a shell shim, which applies the limits of the
+    # sandbox and then execs the binary:
+    #   sh -c SHIM sh CWD BINARY ARGS...
+    def _launch(self, args, cwd, exec_params, sandbox, timeout, cancel_event,
+                captures):
+        reaper = ProcessReaper.instance()
+        if _is_running_on_windows() or not hasattr(os, 'posix_spawn'):
+            if not _is_running_on_windows():
+                exec_params['preexec_fn'] = sandbox.enter
+            return reaper.run([self._binary_path] + args, timeout=timeout,
+                              cancel_event=cancel_event, captures=captures,
+                              cwd=cwd, **exec_params)
+
+        shim = ' && '.join(['cd "$1"', 'shift'] + sandbox.shell_commands() +
+                           ['exec "$@"'])
+        file_actions = [
+            (os.POSIX_SPAWN_DUP2, _fileno(exec_params['stdout']), 1),
+            (os.POSIX_SPAWN_DUP2, _fileno(exec_params['stderr']), 2),
+        ]
+        return reaper.spawn(
+            self.SHIM_SHELL_PATH,
+            [self.SHIM_SHELL_PATH, '-c', shim, 'sh', os.path.abspath(cwd),
+             self._binary_path] + args,
+            exec_params.get('env', os.environ), file_actions,
+            timeout=timeout, cancel_event=cancel_event, captures=captures)
 
-        return Verdict.ACCEPTED if exitcode == 0 else Verdict.FAILED
+    def _is_asan_build(self):
+        return self._binary_path.endswith(('_asan', '_asan.exe'))
 
-        #except TimeoutExpired:
-        #    return Verdict.TIME_LIMIT_EXCEEDED
-        # TODO: Check MLE
+    def _is_memory_limit_exceeded(self, exitcode, peak_memory_kb,
+                                  memory_limit_kb, stderr_capture):
+        # ASan shadow memory is resident too, so its builds aren't limited
+        if memory_limit_kb is None or self._is_asan_build():
+            return False
+        # The peak is memory.peak of the cgroup, or the maxrss of the child
+        # only if it's above the tester's own one (see execution_backend)
+        if peak_memory_kb is not None and peak_memory_kb >= memory_limit_kb:
+            return True
+        if exitcode == 0 or stderr_capture is None:
+            return False
+        stderr_tail = stderr_capture.getvalue()[-self.STDERR_TAIL_BYTES:]
+        return any(marker in stderr_tail
+                   for marker in self.ALLOCATION_FAILURE_MARKERS)
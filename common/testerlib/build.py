@@ -0,0 +1,628 @@
+# Copyright (c) 2019-2022 Andrei Ilyin. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#    * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#    * Changes made to the source code must be documented if this code is
+# published in a repository/storage with a public access.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# Builds the test binaries for several editions (sets of compiler flags) in
+# parallel: every translation unit of every edition is compiled as a separate
+# job, and each edition is linked as soon as its objects are ready. Compiler
+# and linker diagnostics are sanitized and printed in the same order and
+# format as the sequential build did, up to the first failed step.
+
+import argparse
+import os
+import re
+import shlex
+import shutil
+import subprocess
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from sys import stdout
+
+from gtest import GTEST_TESTS_MANIFEST_SUFFIX
+from object_cache import CACHE_ENVIRONMENT_VARIABLES, ObjectCache
+from unity_build import group_sources, write_unity_source
+
+# (source relative to the test sources dir, object name); the objects may be
+# precompiled into the package by `build.sh --precompile`
+LIBRARY_OBJECTS = (
+    ('gtest/gtest-all.cc', 'gtest.o'),
+    ('gmock/gmock-all.cc', 'gmock.o'),
+    ('gmock/gmock_main.cc', 'gmock_main.o'),
+)
+DIAGNOSTIC_MARKERS = ('note', 'warning', 'error')
+# Printed instead of the diagnostics of gtest/gmock, which are filtered out
+LIBRARY_FAILURE_MESSAGE = 'error: compilation of the test libraries failed'
+HIDDEN_NAME_REPLACEMENT = 'HIDDEN'
+# Precompiled header of the test sources in the precompiled objects dir of
+# an edition, and the version of the compiler which built it
+PCH_NAME = 'tests.pch'
+PCH_VERSION_SUFFIX = '.version'
+# Header the PCH is built from, relative to the test sources dir
+PCH_HEADER = 'utils/tests_pch.h'
+# Time limit of the tests listing, e.g. a static initializer of the solution
+# may hang
+TESTS_LISTING_TIMEOUT_SEC = 10
+# Replaces the build directory in the object cache keys and logs
+_TEMP_DIR_PLACEHOLDER = '@TEMP_DIR@'
+
+# Generated sources of the unity build, in the objects dir of an edition
+_UNITY_SOURCE_FORMAT = '__unity_%s_%d.cc'
+
+# Linker messages mentioning the object files only reveal the build layout
+_OBJECT_FILE_RE = re.compile(r'[a-zA-Z0-9_]+[.]o[:]')
+
+_COMMENT_RE = re.compile(r'//[^\n]*|/[*].*?[*]/', re.DOTALL)
+_INCLUDE_RE = re.compile(r'[ \t]*#[ \t]*include[ \t]*("[^"]*"|<[^>]*>)\s*$')
+
+
+def _get_object_name(src):
+    return os.path.splitext(os.path.basename(src))[0] + '.o'
+
+
+# Headers included at the very beginning of the source (before any other
+# code or directive), up to `count` of them
+def _get_leading_includes(path, count=None):
+    try:
+        with open(path, errors='replace') as source_file:
+            text = _COMMENT_RE.sub(' ', source_file.read())
+    except OSError:
+        return []
+    includes = []
+    for line in text.splitlines():
+        if len(includes) == count:
+            break
+        if len(line.strip()) == 0:
+            continue
+        match = _INCLUDE_RE.match(line)
+        if match is None:
+            break
+        includes.append(match.group(1))
+    return includes
+
+
+class Edition:
+    def __init__(self, name, flags, output_path):
+        # Name of the objects directory, e.g. 'obj_dbg'
+        self.name = name
+        self.flags = flags
+        self.output_path = output_path
+
+
+# Single compiler or linker invocation. If it fails, it is repeated with
+# `fallback_args` if given, and the result of the latter is reported.
+class _Job:
+    def __init__(self, args, cwd, fallback_args=None):
+        self.args = args
+        self.cwd = cwd
+        self.fallback_args = fallback_args
+        self.returncode = None
+        self.output = ''
+
+    def run(self):
+        self._execute(self.args)
+        if not self.succeeded() and self.fallback_args is not None:
+            self._execute(self.fallback_args)
+        return self
+
+    def _execute(self, args):
+        completed = subprocess.run(
+            args, cwd=self.cwd,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        self.returncode = completed.returncode
+        self.output = completed.stdout.decode(errors='replace')
+
+    def succeeded(self):
+        return self.returncode == 0
+
+
+# Compilation of a translation unit through the object cache. The key is
+# built from the compiler version and options and the preprocessed source,
+# with the build directory replaced, so that the builds in different
+# directories share the entries. Objects are reused even though they may
+# refer to the sources of another build in __FILE__. The precompiled header
+# doesn't change the object, so it isn't a part of the key.
+class _CachedCompileJob(_Job):
+    def __init__(self, compiler, src, object_name, cwd, cache: ObjectCache,
+                 compiler_version, temp_dir, pch_args=()):
+        compile_args = ['-c', src, '-o', object_name]
+        super().__init__(
+            compiler + list(pch_args) + compile_args, cwd,
+            fallback_args=compiler + compile_args if pch_args else None)
+        self._compiler = compiler
+        self._src = src
+        self._object_path = os.path.join(cwd, object_name)
+        self._cache = cache
+        self._compiler_version = compiler_version
+        self._temp_dir = temp_dir.rstrip('/')
+
+    def run(self):
+        preprocessing = subprocess.run(
+            self._compiler + ['-E', self._src], cwd=self.cwd,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        if preprocessing.returncode != 0:
+            # Errors are reported by the compilation
+            return super().run()
+
+        key = ObjectCache.key(
+            [self._compiler_version] +
+            [self._normalize(arg) for arg in self._compiler] +
+            [preprocessing.stdout.replace(
+                self._temp_dir.encode(), _TEMP_DIR_PLACEHOLDER.encode())])
+        log = self._cache.get(key, self._object_path)
+        if log is not None:
+            self.returncode = 0
+            self.output = log.replace(_TEMP_DIR_PLACEHOLDER, self._temp_dir)
+            return self
+
+        super().run()
+        if self.succeeded():
+            self._cache.put(key, self._object_path,
+                            self._normalize(self.output))
+        return self
+
+    def _normalize(self, text):
+        return text.replace(self._temp_dir, _TEMP_DIR_PLACEHOLDER)
+
+
+# Compilation of several sources as one unity translation unit. If it fails
+# or reports anything, the sources are compiled separately by their own jobs
+# (`member_jobs`), whose outputs are the ones printed, so that the
+# diagnostics are exactly the same as without the unity build. The same is
+# done if the edition fails to link (see BuildOrchestrator._link).
+class _UnityCompileJob:
+    def __init__(self, unity_job: _Job, object_path, member_jobs,
+                 max_workers):
+        self._unity_job = unity_job
+        self._object_path = object_path
+        self._member_jobs = member_jobs
+        self._max_workers = max_workers
+        self.compiled_separately = False
+        self.returncode = None
+        self.output = ''
+
+    def run(self):
+        self._unity_job.run()
+        if self._unity_job.succeeded() and \
+                not self._unity_job.output.strip():
+            self.returncode = 0
+            return self
+        return self.run_separately()
+
+    def run_separately(self):
+        self.compiled_separately = True
+        if os.path.exists(self._object_path):
+            os.remove(self._object_path)
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            list(executor.map(lambda job: job.run(), self._member_jobs))
+        self.returncode = 0 if all(job.succeeded()
+                                   for job in self._member_jobs) else 1
+        self.output = ''.join(job.output for job in self._member_jobs)
+        return self
+
+    def succeeded(self):
+        return self.returncode == 0
+
+
+# Part of the build whose diagnostics are printed together: compilation of
+# the solution or of the tests, or linking of an edition
+class _Step:
+    SOLUTION = 'solution'
+    TESTS = 'tests'
+    LINK = 'link'
+
+    def __init__(self, kind, edition, jobs, printed_jobs, library_jobs=()):
+        self.kind = kind
+        self.edition = edition
+        self.jobs = jobs
+        self.printed_jobs = printed_jobs
+        # Jobs of gtest/gmock among `jobs`, their diagnostics aren't printed
+        self.library_jobs = library_jobs
+        self.futures = []
+
+    def is_done(self):
+        return len(self.futures) == len(self.jobs) and \
+            all(future.done() for future in self.futures)
+
+    def succeeded(self):
+        return all(not future.cancelled() and future.result().succeeded()
+                   for future in self.futures)
+
+
+class BuildOrchestrator:
+    def __init__(self, cxx_command, test_src_dir, temp_dir, solution_srcs,
+                 test_srcs, link_flags=(), strip_paths=(), hidden_names=(),
+                 jobs=None, cache: ObjectCache = None,
+                 precompiled_variant=None, unity=False):
+        self._cxx_command = list(cxx_command)
+        self._test_src_dir = test_src_dir
+        self._temp_dir = temp_dir
+        self._solution_srcs = list(solution_srcs)
+        self._test_srcs = list(test_srcs)
+        self._link_flags = list(link_flags)
+        self._strip_paths = list(strip_paths)
+        self._hidden_names = [name for name in hidden_names if name]
+        self._jobs = jobs or os.cpu_count() or 1
+        self._editions = []
+        # Subdirectory of the precompiled objects dir with the test objects
+        # for the chosen hidden namespace (see precompile_libs in build.sh)
+        self._precompiled_variant = precompiled_variant
+        # Test sources are compiled as unity translation units where
+        # possible (see unity_build.py). Solution sources are always
+        # compiled separately, otherwise a header missing in one of them
+        # could be included by the sources before it in the unit.
+        self._unity = unity
+        # Test sources and libraries are the same for all the submissions, so
+        # their objects are cached. Solution sources are always compiled.
+        self._cache = cache
+        # Identifies the compiler in the cache keys and the precompiled
+        # headers
+        self._compiler_version = subprocess.run(
+            self._cxx_command[:1] + ['--version'],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+        ).stdout.decode(errors='replace')
+        # Headers in the precompiled header, it's used only for the sources
+        # which start with them
+        self._pch_includes = _get_leading_includes(
+            os.path.join(test_src_dir, PCH_HEADER))
+
+    def add_edition(self, edition: Edition):
+        self._editions.append(edition)
+
+    # Returns True if all the editions are built
+    def build(self):
+        editions_steps = [self._prepare_edition(edition)
+                          for edition in self._editions]
+        steps = [step for edition_steps in editions_steps
+                 for step in edition_steps]
+
+        with ThreadPoolExecutor(max_workers=self._jobs) as executor:
+            for step in steps:
+                if step.kind != _Step.LINK:
+                    step.futures = [executor.submit(job.run)
+                                    for job in step.jobs]
+
+            printed_steps_count = 0
+            while printed_steps_count < len(steps):
+                pending = [future for step in steps for future in step.futures
+                           if not future.done()]
+                if len(pending) > 0:
+                    wait(pending, return_when=FIRST_COMPLETED)
+
+                for edition_steps in editions_steps:
+                    link_step = edition_steps[-1]
+                    if len(link_step.futures) == 0 and \
+                            all(step.is_done() and step.succeeded()
+                                for step in edition_steps[:-1]):
+                        link_step.futures = [executor.submit(
+                            self._link, link_step.edition, link_step.jobs[0],
+                            [job for step in edition_steps[:-1]
+                             for job in step.jobs])]
+
+                while printed_steps_count < len(steps) and \
+                        steps[printed_steps_count].is_done():
+                    step = steps[printed_steps_count]
+                    self._print_step(step)
+                    if not step.succeeded():
+                        for future in (future for other_step in steps
+                                       for future in other_step.futures):
+                            future.cancel()
+                        return False
+                    printed_steps_count += 1
+        return True
+
+    def _prepare_edition(self, edition: Edition):
+        compile_dir = os.path.join(self._temp_dir, edition.name)
+        os.makedirs(compile_dir, exist_ok=True)
+        precompiled_dir = os.path.join(self._test_src_dir, edition.name)
+        if os.path.isdir(precompiled_dir):
+            for name in os.listdir(precompiled_dir):
+                path = os.path.join(precompiled_dir, name)
+                if os.path.isfile(path) and name.endswith('.o'):
+                    shutil.copy(path, compile_dir)
+        variant_dir = None
+        if self._precompiled_variant:
+            variant_dir = os.path.join(
+                precompiled_dir, self._precompiled_variant)
+
+        compiler = self._cxx_command + shlex.split(edition.flags)
+        pch_args = self._get_pch_args(compiler, precompiled_dir)
+        steps = []
+        if len(self._solution_srcs) > 0:
+            (jobs, printed_jobs) = self._compile_jobs(
+                _Step.SOLUTION, compiler, self._solution_srcs, compile_dir)
+            steps.append(_Step(_Step.SOLUTION, edition, jobs, printed_jobs))
+
+        test_srcs = []
+        for src in self._test_srcs:
+            object_name = _get_object_name(src)
+            if variant_dir is not None and \
+                    os.path.isfile(os.path.join(variant_dir, object_name)):
+                shutil.copy(os.path.join(variant_dir, object_name),
+                            compile_dir)
+            else:
+                test_srcs.append(src)
+        (test_jobs, printed_jobs) = self._compile_jobs(
+            _Step.TESTS, compiler, test_srcs, compile_dir, cached=True,
+            pch_args=pch_args, unity=self._unity)
+        library_jobs = [
+            self._compile_job(
+                compiler, os.path.join(self._test_src_dir, src), compile_dir,
+                cached=True, object_name=obj)
+            for (src, obj) in LIBRARY_OBJECTS
+            if not os.path.exists(os.path.join(compile_dir, obj))]
+        steps.append(_Step(
+            _Step.TESTS, edition, test_jobs + library_jobs, printed_jobs,
+            library_jobs))
+
+        # Arguments of the linker are known only when all the objects exist
+        link_job = _Job(compiler, compile_dir)
+        steps.append(_Step(_Step.LINK, edition, [link_job], [link_job]))
+        return steps
+
+    # Options of the precompiled header of the edition, or none if it's
+    # missing, built by another compiler or rejected by the compiler (e.g.
+    # if the flags or the headers differ from the ones it was built with).
+    # The compilation is also repeated without it on errors, so that the
+    # diagnostics are exactly the same as without it.
+    def _get_pch_args(self, compiler, precompiled_dir):
+        pch_path = os.path.join(precompiled_dir, PCH_NAME)
+        version_path = pch_path + PCH_VERSION_SUFFIX
+        if len(self._pch_includes) == 0 or not os.path.isfile(pch_path) or \
+                not os.path.isfile(version_path):
+            return []
+        with open(version_path, errors='replace') as version_file:
+            if version_file.read() != self._compiler_version:
+                return []
+        pch_args = ['-include-pch', os.path.abspath(pch_path)]
+        check = subprocess.run(
+            compiler + pch_args + ['-fsyntax-only', '-x', 'c++', os.devnull],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if check.returncode != 0:
+            return []
+        return pch_args
+
+    # The precompiled header is included before the source, so it's only
+    # used if the source starts with the same headers. Otherwise the macros
+    # defined by the source before them would be ignored.
+    def _can_use_pch(self, src):
+        return _get_leading_includes(src, len(self._pch_includes)) == \
+            self._pch_includes
+
+    # Returns the jobs compiling the sources and the jobs whose outputs are
+    # printed, in the order of the sources
+    def _compile_jobs(self, kind, compiler, srcs, compile_dir, cached=False,
+                      pch_args=(), unity=False):
+        src_pch_args = dict(
+            (src, pch_args if pch_args and self._can_use_pch(src) else ())
+            for src in srcs)
+        src_jobs = {src: self._compile_job(compiler, src, compile_dir,
+                                           cached=cached,
+                                           pch_args=src_pch_args[src])
+                    for src in srcs}
+        printed_jobs = [src_jobs[src] for src in srcs]
+        if not unity:
+            return (printed_jobs, printed_jobs)
+
+        jobs = []
+        for (index, group) in enumerate(group_sources(srcs)):
+            member_jobs = [src_jobs[source.path] for source in group]
+            if len(member_jobs) == 1:
+                jobs += member_jobs
+                continue
+            unity_src = os.path.join(
+                compile_dir, _UNITY_SOURCE_FORMAT % (kind, index))
+            write_unity_source(unity_src, group)
+            # Unity source starts with the first of the grouped sources
+            unity_job = self._compile_job(
+                compiler, unity_src, compile_dir, cached=cached,
+                pch_args=src_pch_args[group[0].path])
+            object_path = os.path.join(compile_dir,
+                                       _get_object_name(unity_src))
+            jobs.append(_UnityCompileJob(unity_job, object_path, member_jobs,
+                                         self._jobs))
+        return (jobs, printed_jobs)
+
+    def _compile_job(self, compiler, src, compile_dir, cached=False,
+                     object_name=None, pch_args=()):
+        if object_name is None:
+            object_name = _get_object_name(src)
+        if cached and self._cache is not None:
+            return _CachedCompileJob(
+                compiler, src, object_name, compile_dir, self._cache,
+                self._compiler_version, self._temp_dir, pch_args=pch_args)
+        compile_args = ['-c', src, '-o', object_name]
+        fallback_args = compiler + compile_args if pch_args else None
+        return _Job(compiler + list(pch_args) + compile_args, compile_dir,
+                    fallback_args=fallback_args)
+
+    def _link(self, edition: Edition, job: _Job, compile_jobs):
+        compiler = job.args
+        output_path = os.path.join(job.cwd, edition.output_path)
+        self._run_linker(job, compiler, output_path)
+        # Linker errors would refer to the unity sources, so the sources
+        # are compiled separately and linked again to report the real ones
+        unity_jobs = [compile_job for compile_job in compile_jobs
+                      if isinstance(compile_job, _UnityCompileJob) and
+                      not compile_job.compiled_separately]
+        if not job.succeeded() and len(unity_jobs) > 0:
+            for unity_job in unity_jobs:
+                unity_job.run_separately()
+            if all(unity_job.succeeded() for unity_job in unity_jobs):
+                self._run_linker(job, compiler, output_path)
+            else:
+                job.returncode = 1
+                job.output = ''.join(
+                    unity_job.output for unity_job in unity_jobs)
+        # The listing runs the solution code unsandboxed, which must not get
+        # to the key of the object cache, so with the cache the tests are
+        # listed by the runner
+        if job.succeeded() and self._cache is None:
+            self._write_tests_manifest(output_path)
+        return job
+
+    def _run_linker(self, job: _Job, compiler, output_path):
+        job.args = compiler + self._link_flags + \
+            sorted(name for name in os.listdir(job.cwd)
+                   if name.endswith('.o')) + \
+            ['-o', output_path]
+        job.run()
+
+    # Tests listing, loaded by the runner instead of spawning the binary with
+    # --gtest_list_tests (the runner falls back to it if missing)
+    @staticmethod
+    def _write_tests_manifest(binary_path):
+        manifest_path = binary_path + GTEST_TESTS_MANIFEST_SUFFIX
+        env = dict((name, value) for (name, value) in os.environ.items()
+                   if name not in CACHE_ENVIRONMENT_VARIABLES)
+        try:
+            completed = subprocess.run(
+                [binary_path, '--gtest_list_tests',
+                 '--gtest_output=json:' + manifest_path],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                env=env, timeout=TESTS_LISTING_TIMEOUT_SEC)
+            succeeded = completed.returncode == 0
+        except subprocess.TimeoutExpired:
+            succeeded = False
+        if not succeeded and os.path.exists(manifest_path):
+            os.remove(manifest_path)
+
+    def _sanitize(self, output):
+        for path in self._strip_paths:
+            output = output.replace(path, '')
+        for name in self._hidden_names:
+            output = output.replace(name, HIDDEN_NAME_REPLACEMENT)
+        return [line for line in output.splitlines()
+                if 'gtest' not in line and 'gmock' not in line]
+
+    def _print_step(self, step: _Step):
+        output = ''.join(job.output for job in step.printed_jobs)
+        if step.kind == _Step.LINK:
+            if step.succeeded():
+                return
+            lines = [line for line in self._sanitize(output)
+                     if not _OBJECT_FILE_RE.search(line)]
+        else:
+            lines = [line for line in self._sanitize(output)
+                     if any(marker in line for marker in DIAGNOSTIC_MARKERS)]
+            if any(job.returncode is not None and not job.succeeded()
+                   for job in step.library_jobs):
+                lines.append(LIBRARY_FAILURE_MESSAGE)
+        for line in lines:
+            print(line)
+        stdout.flush()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cxx',
+                        required=True,
+                        help='Compiler command with the common options.')
+    parser.add_argument('--link-flags',
+                        default='',
+                        help='Additional options of the linker.')
+    parser.add_argument('--test-src-dir',
+                        required=True,
+                        help='Directory with the test sources, gtest/gmock'
+                             ' and the precompiled objects.')
+    parser.add_argument('--temp-dir',
+                        required=True,
+                        help='Directory where the objects are compiled.')
+    parser.add_argument('--solution-srcs', nargs='*', default=[])
+    parser.add_argument('--test-srcs', nargs='*', default=[])
+    parser.add_argument('--strip-paths',
+                        nargs='*',
+                        default=[],
+                        help='Prefixes removed from the diagnostics.')
+    parser.add_argument('--hidden-names',
+                        nargs='*',
+                        default=[],
+                        help='Names replaced with \'%s\' in the diagnostics.'
+                             % HIDDEN_NAME_REPLACEMENT)
+    parser.add_argument('--edition',
+                        action='append',
+                        default=[],
+                        help='Edition as NAME:OUTPUT_PATH:FLAGS, e.g.'
+                             ' --edition="obj_opt:out/tests_opt:-O2".')
+    parser.add_argument('--precompiled-variant',
+                        default=None,
+                        help='Subdirectory of the precompiled objects with'
+                             ' the test objects for the chosen hidden'
+                             ' namespace.')
+    parser.add_argument('--cache-dir',
+                        default=None,
+                        help='Directory of the object cache shared by the'
+                             ' builds on the host. Disabled if empty.')
+    parser.add_argument('--cache-size-mb',
+                        default=2048,
+                        type=int,
+                        help='Size limit of the object cache, the least'
+                             ' recently used objects are evicted above it.')
+    parser.add_argument('--cache-key-file',
+                        default=None,
+                        help='File with the secret key the object cache'
+                             ' entries are signed with, required by'
+                             ' --cache-dir. Must not be readable by the'
+                             ' tests.')
+    parser.add_argument('--unity',
+                        action='store_true',
+                        help='Compile the test sources as unity translation'
+                             ' units where possible, each of them is'
+                             ' compiled separately if its unity unit fails.'
+                             ' Solution sources are compiled separately.')
+    parser.add_argument('--jobs',
+                        default=None,
+                        type=int,
+                        help='Number of parallel jobs, all the cores by'
+                             ' default.')
+    args = parser.parse_args()
+
+    cache = None
+    if args.cache_dir:
+        if not args.cache_key_file:
+            parser.error('--cache-key-file is required by --cache-dir')
+        cache = ObjectCache.load(args.cache_dir,
+                                 args.cache_size_mb * 1024 * 1024,
+                                 args.cache_key_file)
+    orchestrator = BuildOrchestrator(
+        cxx_command=shlex.split(args.cxx),
+        test_src_dir=args.test_src_dir,
+        temp_dir=args.temp_dir,
+        solution_srcs=args.solution_srcs,
+        test_srcs=args.test_srcs,
+        link_flags=shlex.split(args.link_flags),
+        strip_paths=args.strip_paths,
+        hidden_names=args.hidden_names,
+        jobs=args.jobs,
+        cache=cache,
+        precompiled_variant=args.precompiled_variant,
+        unity=args.unity)
+    for edition_spec in args.edition:
+        (name, output_path, flags) = edition_spec.split(':', 2)
+        orchestrator.add_edition(Edition(name, flags, output_path))
+    succeeded = orchestrator.build()
+    if cache is not None:
+        cache.trim()
+    exit(0 if succeeded else 1)
@@ -27,62 +27,189 @@
 
 import re
 
+from bisect import bisect_left
+from collections import defaultdict
+
 from base import *
+from dependency_graph import DependencyGraph
 from tester import Tester
 
+_REGEX_SPECIAL_CHARS = '.^$*+?{}[]\\|()'
+
+
+def _has_top_level_alternation(regex):
+    depth = 0
+    i = 0
+    while i < len(regex):
+        char = regex[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char == '[':
+            # Skips the character class, where ']' is literal if it's first
+            i += 1
+            if regex[i:i + 1] == '^':
+                i += 1
+            if regex[i:i + 1] == ']':
+                i += 1
+            while i < len(regex) and regex[i] != ']':
+                i += 2 if regex[i] == '\\' else 1
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return True
+        i += 1
+    return False
+
+
+# Returns a string which starts every test name matched by the regex (note
+# that `re.match` is anchored at the beginning). It may be shorter than the
+# actual common prefix, e.g. it's empty for the top level alternations.
+def _literal_prefix(regex):
+    if _has_top_level_alternation(regex):
+        return ''
+    prefix = []
+    i = 0
+    while i < len(regex):
+        char = regex[i]
+        if char == '\\':
+            if i + 1 == len(regex) or regex[i + 1].isalnum():
+                break
+            char = regex[i + 1]
+            i += 2
+        elif char in _REGEX_SPECIAL_CHARS:
+            break
+        else:
+            i += 1
+        # The character is optional if it's followed by such a quantifier
+        if i < len(regex) and regex[i] in '*?{':
+            break
+        prefix.append(char)
+    return ''.join(prefix)
+
 
 class Configurator:
     def __init__(self, overall_tl_sec=600, default_time_limit_sec=180,
-                 default_memory_limit_kb=None):
+                 default_memory_limit_kb=None,
+                 default_time_limit_mode=TimeLimitMode.WALL, strict=False):
+        self._runners = []
         self._tests_order = []
         self._full_name_to_test = {}
         self._suits = set()
+        # Indices used to find the tests matching a regex without scanning
+        # all of them: tests are grouped by the part of the full name before
+        # the first '.' (i.e. by the suit name), and the groups are sorted, so
+        # only the ones which start with the literal prefix of the regex are
+        # checked.
+        self._test_positions = {}
+        self._name_head_to_tests = defaultdict(list)
+        self._sorted_name_heads = None
+        self._compiled_regexes = {}
         self._standalone_tests = []
+        self._standalone_test_names = set()
+        self._dependency_graph = DependencyGraph()
         self._overall_tl_sec = overall_tl_sec
         self._default_time_limit_sec = default_time_limit_sec
         self._default_memory_limit_kb = default_memory_limit_kb
+        self._default_time_limit_mode = default_time_limit_mode
+        # In the strict mode configuration errors raise ConfigurationError
+        # instead of being printed (used when the test plan is compiled)
+        self._strict = strict
 
     def load_runner(self, runner: TestRunner):
+        self._runners.append(runner)
         for test in runner.get_tests():
             test_full_name = test.description.full_name()
             if test_full_name in self._full_name_to_test:
-                print("ERROR: Test '%s' loaded multiple times!" % test)
+                self._report_error(
+                    "Test '%s' loaded multiple times!" % test)
             else:
                 test.description.resource_limits = ResourceLimits(
                     self._default_time_limit_sec,
-                    self._default_memory_limit_kb
+                    self._default_memory_limit_kb,
+                    self._default_time_limit_mode
                 )
+                self._test_positions[test_full_name] = len(self._tests_order)
                 self._tests_order.append(test_full_name)
                 self._full_name_to_test[test_full_name] = test
+                self._dependency_graph.add_test(test)
                 self._suits.add(test.description.suit_name)
+                self._name_head_to_tests[
+                    test_full_name.partition('.')[0]].append(test_full_name)
+                self._sorted_name_heads = None
+
+    def _report_error(self, message):
+        if self._strict:
+            raise ConfigurationError(message)
+        print('ERROR: ' + message)
+
+    def _compile(self, regex_filter):
+        pattern = self._compiled_regexes.get(regex_filter)
+        if pattern is None:
+            pattern = re.compile(regex_filter)
+            self._compiled_regexes[regex_filter] = pattern
+        return pattern
+
+    # Returns full names of the tests matching the regex in the loading order
+    def _match(self, regex_filter):
+        pattern = self._compile(regex_filter)
+        prefix = _literal_prefix(regex_filter)
+        if len(prefix) == 0:
+            candidates = self._tests_order
+        else:
+            (head, dot, _) = prefix.partition('.')
+            if dot:
+                candidates = self._name_head_to_tests.get(head, [])
+            else:
+                if self._sorted_name_heads is None:
+                    self._sorted_name_heads = sorted(self._name_head_to_tests)
+                heads = self._sorted_name_heads
+                candidates = []
+                i = bisect_left(heads, prefix)
+                while i < len(heads) and heads[i].startswith(prefix):
+                    candidates += self._name_head_to_tests[heads[i]]
+                    i += 1
+                candidates.sort(key=self._test_positions.get)
+        return [test_full_name for test_full_name in candidates
+                if pattern.match(test_full_name)]
+
+    def find_tests(self, regex_filter):
+        return [self._full_name_to_test[test_full_name]
+                for test_full_name in self._match(regex_filter)]
 
     def override_time_limit(self, regex_filter, time_limit_sec):
-        for test_full_name in self._tests_order:
-            if re.match(regex_filter, test_full_name):
-                self._full_name_to_test[test_full_name]. \
-                    description.resource_limits.time_sec = time_limit_sec
+        for test_full_name in self._match(regex_filter):
+            self._full_name_to_test[test_full_name]. \
+                description.resource_limits.time_sec = time_limit_sec
 
     def override_memory_limit(self, regex_filter, memory_limit_kb):
-        for test_full_name in self._tests_order:
-            if re.match(regex_filter, test_full_name):
-                self._full_name_to_test[test_full_name]. \
-                    description.resource_limits.memory_kb = memory_limit_kb
+        for test_full_name in self._match(regex_filter):
+            self._full_name_to_test[test_full_name]. \
+                description.resource_limits.memory_kb = memory_limit_kb
+
+    def override_time_limit_mode(self, regex_filter,
+                                 time_limit_mode: TimeLimitMode):
+        for test_full_name in self._match(regex_filter):
+            self._full_name_to_test[test_full_name]. \
+                description.resource_limits.time_limit_mode = \
+                time_limit_mode
 
     def _process_group(self, regex_filter, group_score, group_type):
-        tests = []
-        for test_name in self._tests_order:
-            if re.match(regex_filter, test_name):
-                tests.append(self._full_name_to_test[test_name])
+        tests = [self._full_name_to_test[test_name]
+                 for test_name in self._match(regex_filter)]
 
         if len(tests) == 0:
-            print("ERROR: No tests match regex '%s'" % regex_filter)
+            self._report_error("No tests match regex '%s'" % regex_filter)
             return
 
         if group_type == TestType.IGNORED:
             for test in tests:
                 if test.description.type == TestType.PUBLIC or \
                         test.description.type == TestType.PRIVATE:
-                    print("ERROR: Test '%s' will not be ignored!" % test)
+                    self._report_error(
+                        "Test '%s' will not be ignored!" % test)
                 else:
                     test.description.type = TestType.IGNORED
             return
@@ -90,11 +217,12 @@ class Configurator:
         if group_type == TestType.PUBLIC:
             for test in tests:
                 if test.description.type == TestType.PRIVATE:
-                    print("ERROR: Scored test '%s' cannot be redefined as"
-                          " public! Define public tests prior to private."
-                          % test)
+                    self._report_error(
+                        "Scored test '%s' cannot be redefined as public!"
+                        " Define public tests prior to private." % test)
                 elif test.description.type == TestType.IGNORED:
-                    print("ERROR: Test '%s' will not be ignored!" % test)
+                    self._report_error(
+                        "Test '%s' will not be ignored!" % test)
                 else:
                     test.description.type = TestType.PUBLIC
             return
@@ -102,10 +230,10 @@ class Configurator:
         validated_tests = []
         for test in tests:
             if test.description.type == TestType.IGNORED:
-                print("ERROR: Test '%s' will not be ignored!" % test)
+                self._report_error("Test '%s' will not be ignored!" % test)
             elif test.description.type == TestType.PRIVATE:
-                print("ERROR: Test '%s' matches multiple scored filters!"
-                      % test)
+                self._report_error(
+                    "Test '%s' matches multiple scored filters!" % test)
             elif test.description.type == TestType.UNUSED:
                 validated_tests.append(test)
             else:
@@ -116,7 +244,7 @@ class Configurator:
                 pass
 
         if len(validated_tests) == 0:
-            print("ERROR: No tests match regex '%s'" % regex_filter)
+            self._report_error("No tests match regex '%s'" % regex_filter)
             return
 
         single_test_score = group_score / len(validated_tests)
@@ -148,23 +276,31 @@ class Configurator:
         self._process_group(regex_filter, 0, TestType.IGNORED)
 
     def force_skip_group(self, regex_filter, reverse_filter=False):
-        for test_name in self._tests_order:
-            if (re.match(regex_filter, test_name) is not None) ^ (reverse_filter):
-                self._full_name_to_test[test_name].description.type = TestType.IGNORED
+        matched_tests = self._match(regex_filter)
+        if reverse_filter:
+            matched_tests = set(matched_tests)
+            skipped_tests = [test_name for test_name in self._tests_order
+                             if test_name not in matched_tests]
+        else:
+            skipped_tests = matched_tests
+        for test_name in skipped_tests:
+            self._full_name_to_test[test_name].description.type = \
+                TestType.IGNORED
 
     def mark_standalone_tests(self, regex_filter):
         self._standalone_tests.append(regex_filter)
 
     def add_dependency(self, target_tests_filter, required_tests_filter):
-        required_tests = []
-        for test_full_name in self._tests_order:
-            if re.match(target_tests_filter, test_full_name):
-                required_tests.append(self._full_name_to_test[test_full_name])
+        target_tests = [
+            self._full_name_to_test[test_full_name]
+            for test_full_name in self._match(target_tests_filter)
+        ]
 
-        for test_full_name in self._tests_order:
-            if re.match(required_tests_filter, test_full_name):
-                self._full_name_to_test[
-                    test_full_name].description.dependencies += required_tests
+        for test_full_name in self._match(required_tests_filter):
+            required_test = self._full_name_to_test[test_full_name]
+            for target_test in target_tests:
+                self._dependency_graph.add_dependency(
+                    required_test, target_test)
 
     def normalize_scores(self, total_score):
         scores_sum = 0
@@ -177,19 +313,22 @@ class Configurator:
             self._full_name_to_test[
                 test_full_name].description.max_score *= scale
 
-    def create_tester(self, enable_aggregation, time_limit_debug_mode):
+    def create_tester(self, enable_aggregation, time_limit_debug_mode,
+                      jobs=1, runner_options: RunnerOptions = None):
+        if runner_options is not None:
+            for runner in self._runners:
+                runner.apply_options(runner_options)
+
         tester = Tester(overall_tl_sec=self._overall_tl_sec,
-                        enable_time_limit_debug_mode=time_limit_debug_mode)
+                        enable_time_limit_debug_mode=time_limit_debug_mode,
+                        jobs=jobs, dependency_graph=self._dependency_graph)
 
+        standalone_tests = self._get_standalone_test_names()
         for test_full_name in self._tests_order:
             test = self._full_name_to_test[test_full_name]
 
-            if not enable_aggregation:
+            if not enable_aggregation or test_full_name in standalone_tests:
                 test.description.exclude_from_aggregation = True
-            else:
-                for filter_re in self._standalone_tests:
-                    if re.match(filter_re, test_full_name):
-                        test.description.exclude_from_aggregation = True
 
             if test.description.type == TestType.UNUSED:
                 print("WARNING: Test '%s' has not been used" %
@@ -199,4 +338,78 @@ class Configurator:
             elif test.description.type == TestType.PRIVATE:
                 tester.add_private_test(test)
 
+        self._check_dependencies()
         return tester
+
+    def _get_standalone_test_names(self):
+        result = set(self._standalone_test_names)
+        for filter_re in self._standalone_tests:
+            result.update(self._match(filter_re))
+        return result
+
+    # Fails on dependency cycles, which otherwise would block the testing
+    def _check_dependencies(self):
+        self._dependency_graph.subgraph(
+            self._full_name_to_test[test_full_name]
+            for test_full_name in self._tests_order
+            if self._full_name_to_test[test_full_name].description.type in
+            (TestType.PUBLIC, TestType.PRIVATE)
+        ).topological_order()
+
+    # Returns the resolved configuration of every loaded test, see test_plan
+    def export_plan(self):
+        self._check_dependencies()
+        runner_indices = dict(
+            (runner, i) for (i, runner) in enumerate(self._runners))
+        standalone_tests = self._get_standalone_test_names()
+        result = []
+        for test_full_name in self._tests_order:
+            test = self._full_name_to_test[test_full_name]
+            description = test.description
+            limits = description.resource_limits
+            result.append({
+                'name': test_full_name,
+                'runner': runner_indices[test.runner],
+                'type': description.type.name,
+                'max_score': description.max_score,
+                'time_limit_sec': limits.time_sec,
+                'memory_limit_kb': limits.memory_kb,
+                'time_limit_mode': limits.time_limit_mode.name,
+                'dependents': [
+                    dependent_test.description.full_name()
+                    for dependent_test in self._dependency_graph.dependents(
+                        test)],
+                'standalone': test_full_name in standalone_tests,
+            })
+        return result
+
+    # Applies the configuration exported by `export_plan` to the loaded tests
+    def apply_plan(self, tests_plan):
+        planned_names = set(entry['name'] for entry in tests_plan)
+        for test_full_name in self._tests_order:
+            if test_full_name not in planned_names:
+                raise ConfigurationError(
+                    "Test '%s' is missing from the test plan" % test_full_name)
+
+        for entry in tests_plan:
+            test = self._full_name_to_test.get(entry['name'])
+            if test is None or \
+                    self._runners.index(test.runner) != entry['runner']:
+                raise ConfigurationError(
+                    "Test '%s' from the test plan is not loaded"
+                    % entry['name'])
+            description = test.description
+            description.type = TestType[entry['type']]
+            description.max_score = entry['max_score']
+            description.resource_limits = ResourceLimits(
+                entry['time_limit_sec'], entry['memory_limit_kb'],
+                TimeLimitMode[entry['time_limit_mode']])
+            for dependent_name in entry['dependents']:
+                dependent_test = self._full_name_to_test.get(dependent_name)
+                if dependent_test is None:
+                    raise ConfigurationError(
+                        "Test '%s' from the test plan is not loaded"
+                        % dependent_name)
+                self._dependency_graph.add_dependency(test, dependent_test)
+            if entry['standalone']:
+                self._standalone_test_names.add(entry['name'])
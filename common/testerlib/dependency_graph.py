@@ -0,0 +1,121 @@
+# Copyright (c) 2019-2022 Andrei Ilyin. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#    * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#    * Changes made to the source code must be documented if this code is
+# published in a repository/storage with a public access.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from heapq import heapify, heappop, heappush
+
+from base import *
+
+
+# Directed graph over the tests where the edge A -> B means that B depends on
+# A, i.e. B is run only after A is passed. It's filled by the Configurator
+# and shared with the Tester. Edges are deduplicated, and the tests are kept
+# in the order they are added.
+class DependencyGraph:
+    def __init__(self, tests=()):
+        self._tests = []
+        self._index = dict()
+        # Adjacency sets. Dicts are used to keep the order of the edges.
+        self._dependents = dict()
+        self._prerequisites = dict()
+        for test in tests:
+            self.add_test(test)
+
+    def add_test(self, test: Test):
+        if test in self._index:
+            return
+        self._index[test] = len(self._tests)
+        self._tests.append(test)
+        self._dependents[test] = dict()
+        self._prerequisites[test] = dict()
+
+    # Makes `dependent_test` depend on `test`
+    def add_dependency(self, test: Test, dependent_test: Test):
+        self._dependents[test][dependent_test] = None
+        self._prerequisites[dependent_test][test] = None
+
+    # Graph over the given tests with the edges between them
+    def subgraph(self, tests):
+        graph = DependencyGraph(tests)
+        for test in graph.tests():
+            for dependent_test in self._dependents.get(test, ()):
+                if dependent_test in graph._index:
+                    graph.add_dependency(test, dependent_test)
+        return graph
+
+    def tests(self):
+        return self._tests
+
+    def dependents(self, test: Test):
+        return self._dependents[test].keys()
+
+    def prerequisites(self, test: Test):
+        return self._prerequisites[test].keys()
+
+    # All the tests which directly or transitively depend on the given test.
+    # Tests from `visited` are not traversed and the found tests are added to
+    # it, so the calls sharing the set visit every test at most once.
+    def all_dependents(self, test: Test, visited=None):
+        if visited is None:
+            visited = set()
+        visited.add(test)
+        result = []
+        stack = [test]
+        while len(stack) > 0:
+            for dependent_test in self._dependents[stack.pop()]:
+                if dependent_test not in visited:
+                    visited.add(dependent_test)
+                    result.append(dependent_test)
+                    stack.append(dependent_test)
+        result.sort(key=lambda t: self._index[t])
+        return result
+
+    # Kahn's algorithm. Among the tests available at the moment the one
+    # defined earlier is always taken first, so the order of independent tests
+    # is preserved.
+    def topological_order(self):
+        remaining = dict(
+            (test, len(self._prerequisites[test])) for test in self._tests)
+        ready = [self._index[test] for test in self._tests
+                 if remaining[test] == 0]
+        heapify(ready)
+
+        result = []
+        while len(ready) > 0:
+            test = self._tests[heappop(ready)]
+            result.append(test)
+            for dependent_test in self._dependents[test]:
+                remaining[dependent_test] -= 1
+                if remaining[dependent_test] == 0:
+                    heappush(ready, self._index[dependent_test])
+
+        if len(result) != len(self._tests):
+            cyclic_tests = [test.description.full_name()
+                            for test in self._tests if remaining[test] > 0]
+            raise ConfigurationError(
+                'Cyclic dependencies between tests: ' +
+                ', '.join(cyclic_tests))
+        return result
@@ -0,0 +1,109 @@
+# Copyright (c) 2019-2022 Andrei Ilyin. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#    * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#    * Changes made to the source code must be documented if this code is
+# published in a repository/storage with a public access.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import json
+import os
+
+from threading import Lock
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+
+
+# Persistent per-test statistics of the editions of a test binary: number of
+# runs, number of failures and total execution time. Used to run the edition
+# which is the most likely to fail cheaply first.
+class EditionStats:
+    def __init__(self, path):
+        self._path = path
+        self._lock = Lock()
+        self._stats = self._load()
+        # Changes made since loading, merged into the file on save, so that
+        # concurrent testings sharing the file don't overwrite each other
+        self._updates = dict()
+
+    def record(self, full_test_name, edition, failed, time_sec):
+        with self._lock:
+            for stats in (self._stats, self._updates):
+                entry = stats.setdefault(full_test_name, dict()).setdefault(
+                    edition, [0, 0, 0.0])
+                entry[0] += 1
+                entry[1] += 1 if failed else 0
+                entry[2] += time_sec
+
+    # Sorts the editions by ascending expected time to find a failure
+    # (mean time / failure probability), which minimizes the expected time
+    # of testing wrong solutions. Editions without statistics keep their
+    # relative order and go first, so the statistics are collected for them.
+    def order(self, full_test_name, editions):
+        with self._lock:
+            test_stats = self._stats.get(full_test_name, dict())
+
+            def cost(indexed_edition):
+                (index, edition) = indexed_edition
+                if edition not in test_stats:
+                    return (0, 0, index)
+                (runs, failures, total_time_sec) = test_stats[edition]
+                # Laplace smoothing, so no edition is considered to never fail
+                failure_probability = (failures + 1) / (runs + 2)
+                return (1, total_time_sec / runs / failure_probability, index)
+
+            return [edition for (_, edition)
+                    in sorted(enumerate(editions), key=cost)]
+
+    # The file is read, merged and replaced under an exclusive lock of a
+    # sidecar file, so that the updates of concurrent testings aren't lost
+    def save(self):
+        with self._lock, open(self._path + '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            stats = self._load()
+            for (full_test_name, editions) in self._updates.items():
+                for (edition, update) in editions.items():
+                    entry = stats.setdefault(full_test_name, dict()) \
+                        .setdefault(edition, [0, 0, 0.0])
+                    for i in range(len(entry)):
+                        entry[i] += update[i]
+
+            tmp_path = '%s.%d.tmp' % (self._path, os.getpid())
+            with open(tmp_path, 'w') as f:
+                json.dump(stats, f)
+            os.replace(tmp_path, self._path)
+            self._stats = stats
+            self._updates = dict()
+
+    def _load(self):
+        if not os.path.exists(self._path):
+            return dict()
+        try:
+            with open(self._path, 'r') as f:
+                return json.load(f)
+        except ValueError:
+            return dict()
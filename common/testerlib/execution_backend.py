@@ -0,0 +1,385 @@
+# Copyright (c) 2019-2022 Andrei Ilyin. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#    * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#    * Changes made to the source code must be documented if this code is
+# published in a repository/storage with a public access.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import itertools
+import math
+import os
+import platform
+import shlex
+import signal
+import time
+
+
+# Limits applied to a single process (and its descendants, if the backend is
+# able to track them)
+class ProcessLimits:
+    def __init__(self, cpu_time_sec=None, memory_kb=None):
+        # Hard limit on CPU time, the process is killed when it's reached
+        self.cpu_time_sec = cpu_time_sec
+        self.memory_kb = memory_kb
+
+
+class ResourceUsage:
+    def __init__(self, cpu_time_sec=None, peak_memory_kb=None,
+                 memory_limit_hit=False):
+        # User + system CPU time, None if unknown
+        self.cpu_time_sec = cpu_time_sec
+        # Peak resident memory, None if unknown
+        self.peak_memory_kb = peak_memory_kb
+        # Whether the process was killed by the memory limit
+        self.memory_limit_hit = memory_limit_hit
+
+
+def _get_rusage_cpu_time_sec(rusage):
+    if rusage is None:
+        return None
+    return rusage.ru_utime + rusage.ru_stime
+
+
+def _maxrss_to_kb(maxrss):
+    # ru_maxrss is measured in bytes on macOS and in kilobytes elsewhere
+    if platform.system() == 'Darwin':
+        return maxrss // 1024
+    return maxrss
+
+
+# `rusage` is the one of the child itself, returned by wait4
+def _get_rusage_peak_memory_kb(rusage):
+    if rusage is None:
+        return None
+    # The image of the process before exec is counted too, and the child
+    # starts as a copy of the tester (or shares its memory with vfork). So
+    # the values up to the peak memory of the tester itself are meaningless.
+    import resource
+    own_maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if rusage.ru_maxrss <= own_maxrss:
+        return None
+    return _maxrss_to_kb(rusage.ru_maxrss)
+
+
+# Environment of a single process execution
+class Sandbox:
+    # Called in the child process before exec
+    def enter(self):
+        pass
+
+    # Shell commands doing the same as `enter`. They are executed by the shim
+    # shell which then execs the binary.
+    def shell_commands(self):
+        return []
+
+    # Called once the process is reaped. Returns ResourceUsage.
+    def collect(self, rusage):
+        return ResourceUsage(_get_rusage_cpu_time_sec(rusage),
+                             _get_rusage_peak_memory_kb(rusage))
+
+    def close(self):
+        pass
+
+
+class ExecutionBackend:
+    def name(self):
+        raise NotImplementedError('ExecutionBackend.name()')
+
+    def create_sandbox(self, limits: ProcessLimits):
+        raise NotImplementedError('ExecutionBackend.create_sandbox(...)')
+
+
+def _set_cpu_rlimit(cpu_time_sec):
+    import resource
+    limit = int(math.ceil(cpu_time_sec))
+    resource.setrlimit(resource.RLIMIT_CPU, (limit, limit))
+
+
+def _cpu_ulimit_command(cpu_time_sec):
+    return 'ulimit -t %d' % int(math.ceil(cpu_time_sec))
+
+
+class _RlimitSandbox(Sandbox):
+    def __init__(self, limits: ProcessLimits):
+        self._limits = limits
+
+    def enter(self):
+        # The following code works on real Linux but crashes on WSL
+        if self._limits.cpu_time_sec is not None:
+            _set_cpu_rlimit(self._limits.cpu_time_sec)
+        if self._limits.memory_kb is not None:
+            import resource
+            resource.setrlimit(
+                resource.RLIMIT_AS,
+                (self._limits.memory_kb * 1024, self._limits.memory_kb * 1024)
+            )
+
+    def shell_commands(self):
+        commands = []
+        if self._limits.cpu_time_sec is not None:
+            commands.append(_cpu_ulimit_command(self._limits.cpu_time_sec))
+        if self._limits.memory_kb is not None:
+            commands.append('ulimit -v %d' % self._limits.memory_kb)
+        return commands
+
+
+# Limits the process itself with setrlimit(). Memory limit is applied to the
+# address space, so only allocation failures are detected, and descendants
+# of the process aren't accounted.
+class RlimitBackend(ExecutionBackend):
+    def name(self):
+        return 'rlimit'
+
+    def create_sandbox(self, limits: ProcessLimits):
+        return _RlimitSandbox(limits)
+
+
+def _find_cgroup2_mount():
+    try:
+        with open('/proc/self/mounts', 'r') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 3 and fields[2] == 'cgroup2':
+                    return fields[1]
+    except OSError:
+        pass
+    return None
+
+
+def _get_own_cgroup():
+    try:
+        with open('/proc/self/cgroup', 'r') as f:
+            for line in f:
+                if line.startswith('0::'):
+                    return line[3:].strip()
+    except OSError:
+        pass
+    return None
+
+
+def _write_file(path, value):
+    with open(path, 'w') as f:
+        f.write(value)
+
+
+def _read_key_value_file(path):
+    result = dict()
+    with open(path, 'r') as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 2:
+                result[fields[0]] = int(fields[1])
+    return result
+
+
+class _CgroupSandbox(Sandbox):
+    # How many times removal of a cgroup is retried while its processes are
+    # being killed
+    REMOVAL_ATTEMPTS = 100
+    REMOVAL_RETRY_INTERVAL_SEC = 0.01
+
+    def __init__(self, path, limits: ProcessLimits, pids_limit, cpu_cores):
+        self._path = path
+        self._limits = limits
+        os.mkdir(path)
+        try:
+            if limits.memory_kb is not None:
+                _write_file(self._file('memory.max'),
+                            str(limits.memory_kb * 1024))
+                if os.path.exists(self._file('memory.swap.max')):
+                    _write_file(self._file('memory.swap.max'), '0')
+            if pids_limit is not None:
+                _write_file(self._file('pids.max'), str(pids_limit))
+            if cpu_cores is not None:
+                period_usec = 100000
+                _write_file(self._file('cpu.max'), '%d %d' % (
+                    int(cpu_cores * period_usec), period_usec))
+        except OSError:
+            self.close()
+            raise
+        self._procs_path = self._file('cgroup.procs')
+
+    def _file(self, name):
+        return os.path.join(self._path, name)
+
+    def enter(self):
+        _write_file(self._procs_path, '0')
+        # Total CPU time isn't limited by the cgroup controllers
+        if self._limits.cpu_time_sec is not None:
+            _set_cpu_rlimit(self._limits.cpu_time_sec)
+
+    def shell_commands(self):
+        # `echo` is a builtin, so the shell moves itself into the cgroup
+        commands = ['echo 0 > ' + shlex.quote(self._procs_path)]
+        if self._limits.cpu_time_sec is not None:
+            commands.append(_cpu_ulimit_command(self._limits.cpu_time_sec))
+        return commands
+
+    def collect(self, rusage):
+        usage = super().collect(rusage)
+        try:
+            cpu_stat = _read_key_value_file(self._file('cpu.stat'))
+            if 'usage_usec' in cpu_stat:
+                usage.cpu_time_sec = cpu_stat['usage_usec'] / 1e6
+            # memory.peak is only available since Linux 5.19
+            if os.path.exists(self._file('memory.peak')):
+                with open(self._file('memory.peak'), 'r') as f:
+                    usage.peak_memory_kb = int(f.read()) // 1024
+            memory_events = _read_key_value_file(self._file('memory.events'))
+            usage.memory_limit_hit = memory_events.get('oom_kill', 0) > 0
+        except (OSError, ValueError):
+            pass
+        return usage
+
+    def close(self):
+        # Descendants which outlived the process are killed as well
+        try:
+            if os.path.exists(self._file('cgroup.kill')):
+                _write_file(self._file('cgroup.kill'), '1')
+            else:
+                with open(self._file('cgroup.procs'), 'r') as f:
+                    for pid in map(int, f.read().split()):
+                        if pid <= 0:
+                            continue
+                        try:
+                            os.kill(pid, signal.SIGKILL)
+                        except ProcessLookupError:
+                            pass
+        except OSError:
+            pass
+
+        for attempt in range(self.REMOVAL_ATTEMPTS):
+            try:
+                os.rmdir(self._path)
+                return
+            except FileNotFoundError:
+                return
+            except OSError:
+                time.sleep(self.REMOVAL_RETRY_INTERVAL_SEC)
+
+
+# Puts every process into its own transient cgroup (v2) with memory, pids and
+# optionally cpu bandwidth limits. Memory of the whole process tree is
+# limited and accounted precisely, and the processes which outlive the
+# tested binary are killed.
+class CgroupBackend(ExecutionBackend):
+    REQUIRED_CONTROLLERS = ('memory', 'pids')
+    # Leaf cgroup where the processes of the root are moved. Controllers
+    # can't be enabled for the children of a cgroup which has processes
+    # itself (the "no internal processes" rule).
+    LEAF_CGROUP_NAME = 'tester'
+
+    def __init__(self, root, pids_limit=256, cpu_cores=None):
+        self._root = root
+        self._pids_limit = pids_limit
+        self._cpu_cores = cpu_cores
+        self._counter = itertools.count()
+
+    def name(self):
+        return 'cgroup'
+
+    def create_sandbox(self, limits: ProcessLimits):
+        path = os.path.join(
+            self._root, 'tester-%d-%d' % (os.getpid(), next(self._counter)))
+        return _CgroupSandbox(path, limits, self._pids_limit, self._cpu_cores)
+
+    # Returns the delegated cgroup where the transient ones can be created,
+    # or None if cgroups v2 can't be used. By default it's the cgroup of the
+    # current process, which is moved into its leaf child cgroup then.
+    @classmethod
+    def find_root(cls, root=None, cpu_cores=None):
+        if platform.system() != 'Linux':
+            return None
+        if root is None:
+            mount = _find_cgroup2_mount()
+            own_cgroup = _get_own_cgroup()
+            if mount is None or own_cgroup is None:
+                return None
+            root = os.path.join(mount, own_cgroup.lstrip('/'))
+
+        controllers = list(cls.REQUIRED_CONTROLLERS)
+        if cpu_cores is not None:
+            controllers.append('cpu')
+        if not os.access(root, os.W_OK):
+            return None
+        subtree_control_path = os.path.join(root, 'cgroup.subtree_control')
+        try:
+            with open(subtree_control_path, 'r') as f:
+                enabled = f.read().split()
+            missing = [c for c in controllers if c not in enabled]
+            if len(missing) > 0:
+                cls._move_to_leaf(root)
+                # Fails if the controllers aren't delegated
+                _write_file(subtree_control_path,
+                            ' '.join('+' + c for c in missing))
+        except OSError:
+            return None
+        return root
+
+    # If the current process is in the root, all the processes of the root
+    # (the tester and the ones which started it) are moved to the leaf
+    @classmethod
+    def _move_to_leaf(cls, root):
+        with open(os.path.join(root, 'cgroup.procs'), 'r') as f:
+            pids = f.read().split()
+        if str(os.getpid()) not in pids:
+            return
+        leaf_procs_path = os.path.join(
+            root, cls.LEAF_CGROUP_NAME, 'cgroup.procs')
+        os.makedirs(os.path.dirname(leaf_procs_path), exist_ok=True)
+        for pid in pids:
+            try:
+                _write_file(leaf_procs_path, pid)
+            except ProcessLookupError:
+                # Already exited
+                pass
+
+
+_backend = RlimitBackend()
+
+
+# Backend is chosen once for the whole testing session
+def get_execution_backend():
+    return _backend
+
+
+def set_execution_backend(backend: ExecutionBackend):
+    global _backend
+    _backend = backend
+
+
+# `name` is one of 'auto', 'rlimit' and 'cgroup'. Automatic choice prefers
+# cgroups if `cgroup_root` is specified and usable. Only the 'cgroup' one
+# takes the cgroup of the tester by default, since it moves the processes
+# of that cgroup and enables the controllers for its children. CPU bandwidth
+# of the cgroups is limited to `cpu_cores` if specified.
+def create_execution_backend(name='rlimit', cgroup_root=None, cpu_cores=None):
+    if name == 'rlimit' or (name == 'auto' and cgroup_root is None):
+        return RlimitBackend()
+    root = CgroupBackend.find_root(cgroup_root, cpu_cores)
+    if root is not None:
+        return CgroupBackend(root, cpu_cores=cpu_cores)
+    if name == 'cgroup':
+        print('[ WARNING ] cgroups v2 are not available, falling back to '
+              'rlimit backend')
+    return RlimitBackend()
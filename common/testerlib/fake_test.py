@@ -27,6 +27,7 @@
 
 from base import *
 
+
 class FakeTestRunner(TestRunner):
     def __init__(self, test_names):
         self._test_names = test_names
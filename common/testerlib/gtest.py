@@ -25,21 +25,122 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import json
 import os
+import random
+import re
 
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from subprocess import check_output
-from tempfile import TemporaryDirectory
-from timeit import default_timer as timer
+from threading import Event
 
 from base import *
-from binary_wrapper import BinaryWrapper, maybe_add_exe_extension
+from binary_wrapper import BinaryWrapper, ExecutionResult, \
+    maybe_add_exe_extension
+from edition_stats import EditionStats
+from workspace import get_workspace
+
+GTEST_TOKEN_FILENAME = 'ANTI_CHEAT_TOKEN_FILENAME'
+GTEST_TOKEN_SECRET = 'ANTI_CHEAT_TOKEN_SECRET'
+GTEST_REPORT_FILENAME = 'gtest_report.json'
+GTEST_TESTS_MANIFEST_SUFFIX = '.tests.json'
+
+# Prepended to the stderr of a process which executed several tests, since
+# it can't be split between them
+_BATCH_OUTPUT_LABEL = '(output of the process shared by the batch of tests)\n'
+_GTEST_RESULT_LINE_RE = re.compile(
+    rb'^\[ +(OK|FAILED) +\] ([^\s,]+)(?: \((\d+) ms\))?')
+# Lines of the gtest console output which start and finish a test
+_GTEST_RUN_LINE_RE = re.compile(r'^\[ RUN +\] (\S+)$')
+_GTEST_END_LINE_RE = re.compile(r'^\[ +(?:OK|FAILED|SKIPPED) +\] (\S+) \(')
+
+
+# Returns {full_test_name: (passed, time_sec)} for the tests which were
+# actually run, or None if the report hasn't been written
+def _read_gtest_report(report_path):
+    if not os.path.exists(report_path):
+        return None
+    try:
+        with open(report_path, 'r') as f:
+            report = json.load(f)
+    except ValueError:
+        return None
+
+    result = dict()
+    for suit in report.get('testsuites', []):
+        for test in suit.get('testsuite', []):
+            if test.get('status') != 'RUN':
+                continue
+            result[suit['name'] + '.' + test['name']] = (
+                len(test.get('failures', [])) == 0,
+                float(test.get('time', '0s').rstrip('s'))
+            )
+    return result
+
+
+# Collects {full_test_name: (passed, time_sec)} with the worst result over
+# all the iterations of --gtest_repeat from the lines of the gtest console
+# output, as they are printed
+class _GTestOutputParser:
+    def __init__(self):
+        self.results = dict()
+
+    def handle_line(self, line):
+        match = _GTEST_RESULT_LINE_RE.match(line)
+        if match is None:
+            return
+        (status, full_test_name, time_ms) = match.groups()
+        full_test_name = full_test_name.decode(errors='replace')
+        (passed, time_sec) = self.results.get(full_test_name, (True, 0))
+        if time_ms is not None:
+            time_sec = max(time_sec, int(time_ms) / 1000)
+        self.results[full_test_name] = (passed and status == b'OK', time_sec)
+
+
+# Lines of the stdout of a batch printed by the given test, from its
+# `[ RUN ]` line to its result line (of every iteration of --gtest_repeat).
+# None if they aren't in the captured tail.
+def _get_test_output(output, full_test_name):
+    lines = []
+    current_test_name = None
+    for line in output.splitlines(keepends=True):
+        match = _GTEST_RUN_LINE_RE.match(line.rstrip('\r\n'))
+        if match is not None:
+            current_test_name = match.group(1)
+        if current_test_name == full_test_name:
+            lines.append(line)
+        match = _GTEST_END_LINE_RE.match(line)
+        if match is not None and match.group(1) == current_test_name:
+            current_test_name = None
+    return ''.join(lines) or None
+
+
+def _make_test_result(verdict, score, executions):
+    result = TestResult(
+        verdict, score, max(execution.time_sec for execution in executions))
+    for execution in executions:
+        if execution.cpu_time_sec is not None:
+            result.cpu_time_sec = max(
+                result.cpu_time_sec or 0, execution.cpu_time_sec)
+        result.update_peak_memory(execution.peak_memory_kb)
+        if verdict != Verdict.ACCEPTED and (
+                execution.stdout_tail is not None or
+                execution.stderr_tail is not None):
+            result.stdout_tail = execution.stdout_tail
+            result.stderr_tail = execution.stderr_tail
+    return result
 
 
 class GoogleTestRunner(TestRunner):
     def __init__(self, test_binary_path, suitcase_to_tests, tests_order,
                  dry_run, editions, heavy_tests_editions, runs_count,
-                 check_token):
+                 check_token, batch_size=1, shards_count=1,
+                 repeat_in_process=False, random_seed=None,
+                 editions_concurrency=1, edition_stats_path=None,
+                 output_tail_kb=None, test_editions=None):
+        self._editions = list(editions)
+        self._heavy_tests_editions = list(heavy_tests_editions)
         self._binary_wrappers = [
             BinaryWrapper(test_binary_path + edition, dry_run)
             for edition in editions
@@ -50,58 +151,448 @@ class GoogleTestRunner(TestRunner):
         ]
         self._suitcase_to_tests = suitcase_to_tests
         self._tests_order = tests_order
+        self._dry_run = dry_run
         self._runs_count = runs_count
         self._check_token = check_token and not dry_run
-        self._heavy_tests = []
+        self._heavy_tests = set()
+        self._batch_size = batch_size
+        self._shards_count = shards_count
+        self._repeat_in_process = repeat_in_process
+        # Shuffling seed is fixed for the whole testing, so that the failures
+        # can be reproduced
+        if random_seed is None:
+            random_seed = random.randint(1, 99999)
+        self._random_seed = random_seed
+        self._editions_concurrency = editions_concurrency
+        self._edition_stats = None
+        if edition_stats_path is not None:
+            self._edition_stats = EditionStats(edition_stats_path)
+        # Size of the output kept for failed tests, None if it's suppressed
+        self._output_tail_kb = output_tail_kb
+        # {full_test_name: set of editions which contain the test}, the tests
+        # are run only on these editions. None if all the tests are available
+        # on every edition.
+        self._test_editions = test_editions
+        # {full_test_name: index of the batch}
+        self._full_name_to_batch = dict()
 
     # Mark the test to run only on heavy_tests_editions of the binary
     def mark_heavy_test(self, full_test_name):
-        self._heavy_tests.append(full_test_name)
+        self._heavy_tests.add(full_test_name)
+
+    def is_heavy_test(self, full_test_name):
+        return full_test_name in self._heavy_tests
 
-    # Mark the tests in a suit to run only on heavy_tests_editions of the binary
+    # Mark the tests in a suit to run only on heavy_tests_editions of the
+    # binary
     def mark_heavy_suit(self, suit_name):
         for test_name in self._suitcase_to_tests[suit_name]:
             self.mark_heavy_test(suit_name + '.' + test_name)
 
+    def apply_options(self, options: RunnerOptions):
+        if options.gtest_batch_size is not None:
+            self._batch_size = options.gtest_batch_size
+        if options.gtest_shards_count is not None:
+            self._shards_count = options.gtest_shards_count
+        if options.gtest_repeat_in_process is not None:
+            self._repeat_in_process = options.gtest_repeat_in_process
+        if options.gtest_random_seed is not None:
+            self._random_seed = options.gtest_random_seed
+        if options.gtest_editions_concurrency is not None:
+            self._editions_concurrency = options.gtest_editions_concurrency
+        if options.gtest_edition_stats_path is not None:
+            self._edition_stats = EditionStats(
+                options.gtest_edition_stats_path)
+        if options.output_tail_kb is not None:
+            self._output_tail_kb = options.output_tail_kb
+
+    def describe(self, description: TestDescription):
+        wrappers = self._get_ordered_wrappers(description.full_name())
+        lines = ['Editions: ' + ', '.join(
+            wrapper.name() for wrapper in wrappers)]
+        if self._is_repeated_in_process():
+            lines.append('Repeats: %d in process (random seed: %d)'
+                         % (self._runs_count, self._random_seed))
+        else:
+            lines.append('Repeats: %d' % self._runs_count)
+        return lines
+
+    # Splits the tests into batches. Only the tests from the same suit with
+    # the same resource limits and editions are executed together. When
+    # sharding is enabled, each batch is spread across several processes, so
+    # it's `shards_count` times larger (or the whole suit if batching is off).
+    def prepare(self, descriptions):
+        self._full_name_to_batch = dict()
+        if self._dry_run:
+            return
+        if self._shards_count > 1:
+            if self._batch_size > 1:
+                batch_size = self._batch_size * self._shards_count
+            else:
+                batch_size = len(descriptions)
+        elif self._batch_size > 1:
+            batch_size = self._batch_size
+        else:
+            return
+
+        groups_order = []
+        groups = defaultdict(list)
+        for description in descriptions:
+            # CPU time of a single test can't be measured inside a batch
+            if description.resource_limits.time_limit_mode != \
+                    TimeLimitMode.WALL:
+                continue
+            key = (description.suit_name,
+                   tuple(wrapper.name() for wrapper in
+                         self._get_wrappers(description.full_name())),
+                   description.resource_limits.time_sec,
+                   description.resource_limits.memory_kb)
+            if key not in groups:
+                groups_order.append(key)
+            groups[key].append(description)
+
+        batches_count = 0
+        for key in groups_order:
+            group = groups[key]
+            for i in range(0, len(group), batch_size):
+                chunk = group[i:i + batch_size]
+                if len(chunk) < 2:
+                    continue
+                for description in chunk:
+                    self._full_name_to_batch[description.full_name()] = \
+                        batches_count
+                batches_count += 1
+
+    def finalize(self):
+        if self._edition_stats is not None:
+            self._edition_stats.save()
+
+    def get_batch(self, description: TestDescription):
+        return self._full_name_to_batch.get(description.full_name())
+
+    # Batches only contain tests with wall clock time limits
+    def run_batch(self, descriptions):
+        results = self._run_batch(
+            descriptions,
+            descriptions[0].resource_limits.time_sec is not None)
+        return [results[description.full_name()]
+                for description in descriptions]
+
     def run(self, description: TestDescription):
-        full_test_name = description.suit_name + '.' + description.test_name
+        full_test_name = description.full_name()
+        wrappers = self._get_ordered_wrappers(full_test_name)
+        outcomes = []
+        if self._editions_concurrency > 1 and len(wrappers) > 1:
+            # Editions are independent binaries, so they are run concurrently.
+            # The first failure cancels the editions which are still running.
+            cancel_event = Event()
+            with ThreadPoolExecutor(max_workers=min(
+                    self._editions_concurrency, len(wrappers))) as executor:
+                outcomes = list(executor.map(
+                    lambda wrapper: self._run_on_wrapper(
+                        wrapper, description, cancel_event),
+                    wrappers))
+        else:
+            for wrapper in wrappers:
+                outcomes.append(self._run_on_wrapper(wrapper, description))
+                if outcomes[-1][0] != Verdict.ACCEPTED:
+                    break
+
+        if self._edition_stats is not None:
+            for (wrapper, (verdict, executions)) in zip(wrappers, outcomes):
+                if verdict is not None:
+                    self._edition_stats.record(
+                        full_test_name, wrapper.name(),
+                        verdict != Verdict.ACCEPTED,
+                        sum(execution.time_sec for execution in executions))
 
+        executions = [execution for (_, executions) in outcomes
+                      for execution in executions]
+        for (verdict, _) in outcomes:
+            if verdict is not None and verdict != Verdict.ACCEPTED:
+                return _make_test_result(verdict, 0, executions)
+        return _make_test_result(
+            Verdict.ACCEPTED, description.max_score, executions)
+
+    # Returns (verdict, executions) of all the runs of the test on the edition.
+    # Verdict is None if the runs were cancelled due to a failure on another
+    # edition.
+    def _run_on_wrapper(self, wrapper, description, cancel_event=None):
+        executions = []
+        for run_id in range(self._get_processes_count()):
+            if cancel_event is not None and cancel_event.is_set():
+                return None, executions
+
+            execution = self._run_single(
+                wrapper, description, description.resource_limits.time_sec,
+                cancel_event)
+
+            if execution.verdict != Verdict.ACCEPTED:
+                if cancel_event is not None:
+                    if cancel_event.is_set():
+                        return None, executions
+                    cancel_event.set()
+                executions.append(execution)
+                return execution.verdict, executions
+            executions.append(execution)
+
+        return Verdict.ACCEPTED, executions
+
+    # Editions which contain the test. If the test is missing in all of them,
+    # they are all returned, so that the test fails instead of being skipped.
+    def _get_wrappers(self, full_test_name):
         if full_test_name in self._heavy_tests:
+            editions = self._heavy_tests_editions
             wrappers = self._heavy_tests_binary_wrappers
         else:
+            editions = self._editions
             wrappers = self._binary_wrappers
+        if self._test_editions is None:
+            return wrappers
+        available = self._test_editions.get(full_test_name, ())
+        return [wrapper for (edition, wrapper) in zip(editions, wrappers)
+                if edition in available] or wrappers
+
+    # Editions in the order of execution, which is adapted to the collected
+    # statistics if they are enabled
+    def _get_ordered_wrappers(self, full_test_name):
+        wrappers = self._get_wrappers(full_test_name)
+        if self._edition_stats is None:
+            return wrappers
+        name_to_wrapper = dict(
+            (wrapper.name(), wrapper) for wrapper in wrappers)
+        return [name_to_wrapper[name] for name in self._edition_stats.order(
+            full_test_name, [wrapper.name() for wrapper in wrappers])]
+
+    def _is_repeated_in_process(self):
+        return self._repeat_in_process and self._runs_count > 1
+
+    # Number of runs of each test inside a process
+    def _get_iterations_count(self):
+        return self._runs_count if self._is_repeated_in_process() else 1
 
-        times_sec = []
-        for wrapper in wrappers:
-            with TemporaryDirectory(dir=os.curdir) as tmp:
-                GTEST_TOKEN_FILENAME = \
-                    os.path.join(tmp, 'ANTI_CHEAT_TOKEN_FILENAME')
-                GTEST_TOKEN_SECRET = \
-                    'ANTI_CHEAT_TOKEN_SECRET'
-
-                for run_id in range(self._runs_count):
-                    start_time = timer()
-                    verdict = wrapper.run(
-                        ["--gtest_filter=" + full_test_name],
-                        time_limit_sec=description.resource_limits.time_sec,
-                        memory_limit_kb=description.resource_limits.memory_kb,
-                        cwd=tmp
-                    )
-                    finish_time = timer()
-                    times_sec.append(finish_time - start_time)
-
-                    if verdict != Verdict.ACCEPTED:
-                        return TestResult(verdict, 0, max(times_sec))
-
-                    if self._check_token:
-                        if not os.path.exists(GTEST_TOKEN_FILENAME):
-                            raise PermissionError('Token file not found!')
-                        with open(GTEST_TOKEN_FILENAME, 'r') as f:
-                            if f.read().strip() != GTEST_TOKEN_SECRET:
-                                raise PermissionError('Token value is wrong!')
-
-        return TestResult(Verdict.ACCEPTED, description.max_score,
-                          max(times_sec))
+    # Number of processes started for each test on each edition
+    def _get_processes_count(self):
+        return 1 if self._is_repeated_in_process() else self._runs_count
+
+    # Time limit for a process which executes tests with the given total TL
+    def _get_process_time_limit(self, time_limit_sec):
+        if time_limit_sec is None or not self._is_repeated_in_process():
+            return time_limit_sec
+        return time_limit_sec * self._runs_count
+
+    # Returns ExecutionResult with the times of a single iteration of the test
+    def _run_single(self, wrapper, description, time_limit_sec,
+                    cancel_event=None):
+        full_test_name = description.full_name()
+        time_limit_mode = description.resource_limits.time_limit_mode
+        execution, report = self._execute(
+            wrapper, ["--gtest_filter=" + full_test_name],
+            time_limit_sec=self._get_process_time_limit(time_limit_sec),
+            memory_limit_kb=description.resource_limits.memory_kb,
+            time_limit_mode=time_limit_mode,
+            cancel_event=cancel_event)
+
+        # CPU time of the iterations of --gtest_repeat can't be told apart, so
+        # the average one is reported
+        if self._is_repeated_in_process() and \
+                execution.cpu_time_sec is not None:
+            execution.cpu_time_sec /= self._runs_count
+
+        # Wall time limit is applied to every iteration of --gtest_repeat, and
+        # to the process time per iteration, which includes the static
+        # initialization and the exit, so the larger one is reported
+        if report is not None and full_test_name in report:
+            execution.time_sec = max(
+                report[full_test_name][1],
+                execution.time_sec / self._get_iterations_count())
+            if execution.verdict == Verdict.ACCEPTED and \
+                    time_limit_sec is not None and \
+                    time_limit_mode != TimeLimitMode.CPU and \
+                    execution.time_sec > time_limit_sec:
+                execution.verdict = Verdict.TIME_LIMIT_EXCEEDED
+        return execution
+
+    # Returns (execution_result, gtest_report). The report is read either if
+    # requested or if tests are repeated inside the process.
+    def _execute(self, wrapper, args, time_limit_sec, memory_limit_kb,
+                 time_limit_mode=TimeLimitMode.WALL, read_report=False,
+                 env=None, cancel_event=None):
+        with get_workspace().acquire() as tmp:
+            token_path = os.path.join(tmp, GTEST_TOKEN_FILENAME)
+            report_path = os.path.abspath(
+                os.path.join(tmp, GTEST_REPORT_FILENAME))
+            output_parser = None
+            line_handler = None
+            if read_report:
+                args = args + ['--gtest_output=json:' + report_path]
+            if self._is_repeated_in_process():
+                output_parser = _GTestOutputParser()
+                line_handler = output_parser.handle_line
+                args = args + ['--gtest_repeat=%d' % self._runs_count,
+                               '--gtest_shuffle',
+                               '--gtest_random_seed=%d' % self._random_seed]
+
+            output_params = dict()
+            if self._output_tail_kb:
+                output_params = dict(suppress_output=False,
+                                     output_tail_kb=self._output_tail_kb)
+            execution = wrapper.run(args,
+                                    time_limit_sec=time_limit_sec,
+                                    memory_limit_kb=memory_limit_kb,
+                                    time_limit_mode=time_limit_mode,
+                                    cwd=tmp,
+                                    env=env,
+                                    stdout_line_handler=line_handler,
+                                    cancel_event=cancel_event,
+                                    **output_params)
+
+            if execution.verdict == Verdict.ACCEPTED and \
+                    self._check_token and \
+                    (cancel_event is None or not cancel_event.is_set()):
+                if not os.path.exists(token_path):
+                    raise PermissionError('Token file not found!')
+                with open(token_path, 'r') as f:
+                    if f.read().strip() != GTEST_TOKEN_SECRET:
+                        raise PermissionError('Token value is wrong!')
+
+            report = _read_gtest_report(report_path) if read_report else None
+            if output_parser is not None:
+                # JSON report only contains the last iteration, so the results
+                # of the other ones are taken from the console output
+                iterations = output_parser.results
+                if report is None:
+                    report = iterations
+                else:
+                    for (full_test_name, (passed, time_sec)) in \
+                            iterations.items():
+                        if full_test_name in report:
+                            report[full_test_name] = (
+                                passed and report[full_test_name][0],
+                                max(time_sec, report[full_test_name][1]))
+            return execution, report
+
+    def _run_batch(self, descriptions, enable_time_limit):
+        results = dict()
+        executions = defaultdict(list)
+        remaining = descriptions
+        for wrapper in self._get_wrappers(descriptions[0].full_name()):
+            for run_id in range(self._get_processes_count()):
+                outcomes = self._run_batch_on_wrapper(
+                    wrapper, remaining, enable_time_limit)
+                still_accepted = []
+                for description in remaining:
+                    full_test_name = description.full_name()
+                    execution = outcomes[full_test_name]
+                    executions[full_test_name].append(execution)
+                    if execution.verdict == Verdict.ACCEPTED:
+                        still_accepted.append(description)
+                    else:
+                        results[full_test_name] = _make_test_result(
+                            execution.verdict, 0,
+                            executions[full_test_name])
+                remaining = still_accepted
+
+        for description in remaining:
+            full_test_name = description.full_name()
+            results[full_test_name] = _make_test_result(
+                Verdict.ACCEPTED, description.max_score,
+                executions[full_test_name])
+        return results
+
+    # Returns {full_test_name: ExecutionResult}. Time of a test is taken from
+    # the gtest report, CPU time is unknown and peak memory is the one of the
+    # process which executed the test. If the process fails and the failure
+    # can't be attributed to particular tests by the gtest report (crash, TLE
+    # of the whole batch, sanitizer error at exit, etc.), the batch is split
+    # until the failing tests are executed in isolation.
+    def _run_batch_on_wrapper(self, wrapper, descriptions, enable_time_limit):
+        if len(descriptions) == 1:
+            description = descriptions[0]
+            return {description.full_name(): self._run_single(
+                wrapper, description,
+                (description.resource_limits.time_sec
+                 if enable_time_limit else None))}
+
+        time_limit_sec = None
+        if enable_time_limit:
+            time_limit_sec = self._get_process_time_limit(
+                sum(description.resource_limits.time_sec
+                    for description in descriptions))
+        args = ["--gtest_filter=" + ':'.join(
+            description.full_name() for description in descriptions)]
+        memory_limit_kb = descriptions[0].resource_limits.memory_kb
+
+        # Each shard is executed in its own directory with its own token file
+        shards_count = min(self._shards_count, len(descriptions))
+        if shards_count > 1:
+            with ThreadPoolExecutor(max_workers=shards_count) as executor:
+                executions = list(executor.map(
+                    lambda shard_index: self._execute(
+                        wrapper, args, time_limit_sec, memory_limit_kb,
+                        read_report=True,
+                        env={'GTEST_TOTAL_SHARDS': str(shards_count),
+                             'GTEST_SHARD_INDEX': str(shard_index)}),
+                    range(shards_count)))
+        else:
+            executions = [self._execute(wrapper, args, time_limit_sec,
+                                        memory_limit_kb, read_report=True)]
+
+        # {full_test_name: (passed, time_sec, execution result of the process)}
+        report = dict()
+        for (execution, shard_report) in executions:
+            if shard_report is None:
+                continue
+            for (full_test_name, (passed, time_sec)) in shard_report.items():
+                report[full_test_name] = (passed, time_sec, execution)
+
+        outcomes = dict()
+        unresolved = []
+        # Processes whose stderr is already attached to a failed test
+        stderr_attached = []
+        for description in descriptions:
+            full_test_name = description.full_name()
+            if full_test_name not in report:
+                unresolved.append(description)
+                continue
+            (passed, time_sec, execution) = report[full_test_name]
+            if not passed:
+                verdict = Verdict.FAILED
+            elif enable_time_limit and \
+                    time_sec > description.resource_limits.time_sec:
+                verdict = Verdict.TIME_LIMIT_EXCEEDED
+            elif execution.verdict == Verdict.ACCEPTED:
+                verdict = Verdict.ACCEPTED
+            else:
+                unresolved.append(description)
+                continue
+            outcomes[full_test_name] = ExecutionResult(
+                verdict, execution.exitcode, time_sec,
+                peak_memory_kb=execution.peak_memory_kb)
+            if verdict == Verdict.ACCEPTED:
+                continue
+            # Stdout is split between the tests by the gtest markers, the
+            # whole stderr is attached once, to the first failed test
+            if execution.stdout_tail is not None:
+                outcomes[full_test_name].stdout_tail = _get_test_output(
+                    execution.stdout_tail, full_test_name)
+            if execution.stderr_tail and \
+                    all(execution is not other
+                        for other in stderr_attached):
+                stderr_attached.append(execution)
+                outcomes[full_test_name].stderr_tail = \
+                    _BATCH_OUTPUT_LABEL + execution.stderr_tail
+
+        if len(unresolved) == len(descriptions):
+            middle = len(descriptions) // 2
+            outcomes.update(self._run_batch_on_wrapper(
+                wrapper, descriptions[:middle], enable_time_limit))
+            outcomes.update(self._run_batch_on_wrapper(
+                wrapper, descriptions[middle:], enable_time_limit))
+        elif len(unresolved) > 0:
+            outcomes.update(self._run_batch_on_wrapper(
+                wrapper, unresolved, enable_time_limit))
+        return outcomes
 
     def get_tests(self):
         result = []
@@ -116,19 +607,27 @@ class GoogleTestRunner(TestRunner):
         return result
 
 
-def prepare_google_test_runner(
-        test_binary_path, dry_run, editions=('',), heavy_tests_editions=None,
-        runs_count=3):
-    sample_binary_path = maybe_add_exe_extension(test_binary_path + editions[0])
-    if not os.path.exists(sample_binary_path):
-        raise FileNotFoundError(
-            'Cannot find binary executable ' + sample_binary_path)
+# Reads the `--gtest_list_tests --gtest_output=json:...` listing written by
+# build.sh next to the binary. Returns [(suit_name, test_name)] or None if
+# the manifest is missing or broken
+def _load_tests_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, 'r') as f:
+            listing = json.load(f)
+        return [(suit['name'], test['name'])
+                for suit in listing['testsuites']
+                for test in suit['testsuite']]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
 
+
+def _list_tests(binary_path):
     raw_tests_list = check_output(
-        [sample_binary_path, "--gtest_list_tests"]
+        [binary_path, "--gtest_list_tests"]
     ).decode().split('\n')
 
-    suitcase_to_tests = defaultdict(list)
     tests_order = []
     current_tests_suitcase = ''
     for line in raw_tests_list:
@@ -139,12 +638,52 @@ def prepare_google_test_runner(
             current_tests_suitcase = line[:-1]
         else:
             tests_order.append((current_tests_suitcase, line))
-            suitcase_to_tests[current_tests_suitcase].append(line)
+    return tests_order
+
+
+def _discover_tests(binary_path):
+    executable_path = maybe_add_exe_extension(binary_path)
+    if not os.path.exists(executable_path):
+        raise FileNotFoundError(
+            'Cannot find binary executable ' + executable_path)
+
+    tests_order = _load_tests_manifest(
+        binary_path + GTEST_TESTS_MANIFEST_SUFFIX)
+    if tests_order is None:
+        tests_order = _list_tests(executable_path)
+    return tests_order
 
+
+def prepare_google_test_runner(
+        test_binary_path, dry_run, editions=('',), heavy_tests_editions=None,
+        runs_count=3, batch_size=1, shards_count=1, repeat_in_process=False,
+        editions_concurrency=1, edition_stats_path=None, output_tail_kb=None):
     if heavy_tests_editions is None:
         heavy_tests_editions = editions
 
+    # Tests may be compiled out of some editions (e.g. by SKIP_SPEED_TESTS),
+    # so every edition is listed separately
+    tests_order = []
+    test_editions = dict()
+    suitcase_to_tests = defaultdict(list)
+    for edition in list(editions) + [
+            edition for edition in heavy_tests_editions
+            if edition not in editions]:
+        for (suit_name, test_name) in _discover_tests(
+                test_binary_path + edition):
+            full_test_name = suit_name + '.' + test_name
+            if full_test_name not in test_editions:
+                test_editions[full_test_name] = set()
+                tests_order.append((suit_name, test_name))
+                suitcase_to_tests[suit_name].append(test_name)
+            test_editions[full_test_name].add(edition)
+
     return GoogleTestRunner(
         test_binary_path, suitcase_to_tests, tests_order, dry_run, editions,
-        heavy_tests_editions, runs_count, check_token=True
+        heavy_tests_editions, runs_count, check_token=True,
+        batch_size=batch_size, shards_count=shards_count,
+        repeat_in_process=repeat_in_process,
+        editions_concurrency=editions_concurrency,
+        edition_stats_path=edition_stats_path,
+        output_tail_kb=output_tail_kb, test_editions=test_editions
     )
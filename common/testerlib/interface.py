@@ -26,7 +26,7 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 from json import dump
-from sys import stderr, stdout
+from sys import stderr
 
 from base import *
 
@@ -77,7 +77,11 @@ def _to_log_line(test, print_time=False):
     result_str = ('%-35s' % result_str) + test.description.full_name()
 
     if print_time:
-        result_str += '    (time: %.3f s)' % test.result.time_sec
+        if test.result.peak_memory_kb is not None:
+            result_str += '    (time: %.3f s, memory: %d KB)' % (
+                test.result.time_sec, test.result.peak_memory_kb)
+        else:
+            result_str += '    (time: %.3f s)' % test.result.time_sec
 
     return result_str
 
@@ -90,6 +94,17 @@ def _group_public_feedback(group: TestGroup):
     )
 
 
+# Captured output of the failed tests of the group
+def _group_output(group: TestGroup, stream_name):
+    outputs = []
+    for test in group.tests:
+        tail = getattr(test.result, stream_name + '_tail')
+        if tail:
+            outputs.append('--- %s ---\n%s' % (
+                test.description.full_name(), tail))
+    return '\n'.join(outputs)
+
+
 def _group_judges_feedback(group: TestGroup):
     tests = []
     for test in group.tests:
@@ -117,6 +132,8 @@ class TestingSystemInterface:
             str(report.passed_tests_count), str(report.tests_count)))
         if print_time:
             _eprint("Total time: %.3f s" % report.result.time_sec)
+            if report.result.peak_memory_kb is not None:
+                _eprint("Peak memory: %d KB" % report.result.peak_memory_kb)
         _eprint("Total score: %s out of %s" % (
             str(round(report.result.score, 3)),
             str(round(report.max_score, 3))))
@@ -194,14 +211,17 @@ class IRunnerInterface(TestingSystemInterface):
                 report.result, checker_comment=report.general_comment))
 
         for group in report.groups:
+            time_limit_sec = group.description.resource_limits.time_sec
             tests.append(self._group_json(
                 group.result.verdict,
                 score=round(group.result.score),
                 max_score=round(group.description.max_score),
                 time_ms=group.result.time_sec * 1000,
-                time_limit_ms=group.description.resource_limits.time_sec * 1000,
+                time_limit_ms=time_limit_sec * 1000,
                 checker_comment=_group_public_feedback(group),
                 answer=_group_judges_feedback(group),
+                stdout=_group_output(group, 'stdout'),
+                stderr=_group_output(group, 'stderr'),
             ))
 
         with open(self._report_file, 'w') as outfile:
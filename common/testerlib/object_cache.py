@@ -0,0 +1,184 @@
+# Copyright (c) 2019-2022 Andrei Ilyin. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#    * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#    * Changes made to the source code must be documented if this code is
+# published in a repository/storage with a public access.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import hashlib
+import hmac
+import os
+import tempfile
+
+# Bumped when the format of the entries or of the keys changes
+CACHE_FORMAT_VERSION = '2'
+_OBJECT_SUFFIX = '.o'
+_LOG_SUFFIX = '.log'
+
+# Variables of the build environment which configure the cache (see
+# build.sh). The tester removes them from the environment of the tests.
+CACHE_ENVIRONMENT_VARIABLES = ('OBJECT_CACHE_DIR', 'OBJECT_CACHE_KEY_FILE')
+
+
+def _update_digest(digest, parts):
+    for part in parts:
+        encoded = part
+        if not isinstance(part, bytes):
+            encoded = part.encode(errors='replace')
+        digest.update(str(len(encoded)).encode() + b':')
+        digest.update(encoded)
+
+
+# Content-addressed cache of the compiled objects, shared by the concurrent
+# builds on the grading host. Entry is an object file with the compiler
+# output, keyed by the hash of everything the object depends on (see `key`).
+# Entries are published with atomic renames, so readers never see partial
+# files, and the least recently used ones are evicted above the size limit.
+#
+# Every entry is signed with HMAC of the object and the output, and the
+# entries which fail the check are dropped, so that an object planted into
+# the cache isn't linked into another build. The secret key must be readable
+# only by the builds, and the cache directory should be read-only for the
+# tests (e.g. owned by another user or not mounted into their sandbox).
+class ObjectCache:
+    def __init__(self, root, max_size_bytes, secret_key):
+        self._root = root
+        self._max_size_bytes = max_size_bytes
+        self._secret_key = secret_key
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def load(root, max_size_bytes, key_file_path):
+        with open(key_file_path, 'rb') as f:
+            secret_key = f.read().strip()
+        if not secret_key:
+            raise ValueError('Object cache key file %s is empty'
+                             % key_file_path)
+        return ObjectCache(root, max_size_bytes, secret_key)
+
+    # `parts` are strings or bytes, e.g. the compiler version, the flags and
+    # the preprocessed source (which covers all the included headers)
+    @staticmethod
+    def key(parts):
+        digest = hashlib.sha256(CACHE_FORMAT_VERSION.encode())
+        _update_digest(digest, parts)
+        return digest.hexdigest()
+
+    def _sign(self, key, object_data, log):
+        digest = hmac.new(self._secret_key, digestmod=hashlib.sha256)
+        _update_digest(digest, [key, object_data, log])
+        return digest.hexdigest()
+
+    def _entry_path(self, key, suffix):
+        return os.path.join(self._root, key[:2], key + suffix)
+
+    # Copies the cached object to `object_path` and returns the compiler
+    # output, or None on a miss
+    def get(self, key, object_path):
+        entry_path = self._entry_path(key, _OBJECT_SUFFIX)
+        log_path = self._entry_path(key, _LOG_SUFFIX)
+        try:
+            # Log is the signature line followed by the compiler output
+            with open(log_path, 'rb') as f:
+                signature = f.readline().strip().decode(errors='replace')
+                log = f.read()
+            with open(entry_path, 'rb') as f:
+                object_data = f.read()
+        except OSError:
+            # Missing or evicted concurrently
+            return None
+        if not hmac.compare_digest(
+                signature, self._sign(key, object_data, log)):
+            self._remove_entry(entry_path, log_path)
+            return None
+        try:
+            self._write_atomically(object_data, object_path)
+            # Modification time is the last use time for the eviction
+            os.utime(entry_path)
+        except OSError:
+            return None
+        return log.decode(errors='replace')
+
+    def put(self, key, object_path, log):
+        try:
+            with open(object_path, 'rb') as f:
+                object_data = f.read()
+            log = log.encode(errors='replace')
+            signature = self._sign(key, object_data, log)
+            os.makedirs(os.path.dirname(self._entry_path(key, '')),
+                        exist_ok=True)
+            # Log goes last, as its presence marks a complete entry
+            self._write_atomically(
+                object_data, self._entry_path(key, _OBJECT_SUFFIX))
+            self._write_atomically(signature.encode() + b'\n' + log,
+                                   self._entry_path(key, _LOG_SUFFIX))
+        except OSError:
+            # Caching is an optimization, e.g. a full disk isn't a failure
+            pass
+
+    # Removes the least recently used entries while the cache is larger
+    # than the limit
+    def trim(self):
+        entries = []
+        total_size = 0
+        for bucket in os.scandir(self._root):
+            if not bucket.is_dir():
+                continue
+            for item in os.scandir(bucket.path):
+                if not item.name.endswith(_OBJECT_SUFFIX):
+                    continue
+                try:
+                    stat = item.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, item.path))
+                total_size += stat.st_size
+
+        entries.sort()
+        for (_, size, path) in entries:
+            if total_size <= self._max_size_bytes:
+                break
+            self._remove_entry(
+                path, path[:-len(_OBJECT_SUFFIX)] + _LOG_SUFFIX)
+            total_size -= size
+
+    @staticmethod
+    def _remove_entry(entry_path, log_path):
+        # Log goes first, so that the entry stops being complete
+        for path in (log_path, entry_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _write_atomically(data, destination_path):
+        (fd, temp_path) = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(destination_path)))
+        try:
+            with os.fdopen(fd, 'wb') as destination:
+                destination.write(data)
+            os.replace(temp_path, destination_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
@@ -0,0 +1,409 @@
+# Copyright (c) 2019-2022 Andrei Ilyin. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#    * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#    * Changes made to the source code must be documented if this code is
+# published in a repository/storage with a public access.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import platform
+import selectors
+import signal
+import socket
+import subprocess
+import threading
+import traceback
+
+from heapq import heappop, heappush
+from timeit import default_timer as timer
+
+
+def _is_running_on_windows():
+    return platform.system() == 'Windows'
+
+
+# Reported for the children whose exit status is unknown: lost ones and the
+# ones killed after a failure of the reaper. Graded as a runtime error.
+UNKNOWN_STATUS_RETURNCODE = 1
+
+
+def _status_to_returncode(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+# Pipe which keeps only the last `capacity` bytes written to it. The read end
+# is drained by the reaper thread, so the child never blocks on a full pipe
+# and the memory stays bounded however much it writes. If `line_handler` is
+# given, it's called by the reaper thread with every line of the output
+# (bytes without the newline, truncated to MAX_LINE_SIZE). Not available on
+# Windows, where pipes can't be selected.
+class OutputCapture:
+    READ_CHUNK_SIZE = 65536
+    MAX_LINE_SIZE = 4096
+
+    def __init__(self, capacity, line_handler=None):
+        self.capacity = capacity
+        self.total_size = 0
+        self._buffer = bytearray()
+        self._line_handler = line_handler
+        self._line = bytearray()
+        (self._read_fd, self.write_fd) = os.pipe()
+        os.set_blocking(self._read_fd, False)
+
+    def fileno(self):
+        return self._read_fd
+
+    def is_open(self):
+        return self._read_fd is not None
+
+    # Returns False once the pipe is closed by all the writers
+    def drain(self):
+        while True:
+            try:
+                data = os.read(self._read_fd, self.READ_CHUNK_SIZE)
+            except BlockingIOError:
+                return True
+            if len(data) == 0:
+                self._flush_line()
+                return False
+            self.total_size += len(data)
+            self._buffer += data
+            if len(self._buffer) > self.capacity:
+                del self._buffer[:len(self._buffer) - self.capacity]
+            if self._line_handler is not None:
+                self._handle_lines(data)
+
+    def _handle_lines(self, data):
+        lines = data.split(b'\n')
+        for line in lines[:-1]:
+            self._line += line
+            self._flush_line()
+        self._line += lines[-1]
+        del self._line[self.MAX_LINE_SIZE:]
+
+    def _flush_line(self):
+        if self._line_handler is not None and len(self._line) > 0:
+            self._line_handler(bytes(self._line[:self.MAX_LINE_SIZE]))
+        self._line = bytearray()
+
+    def getvalue(self):
+        return bytes(self._buffer)
+
+    # The child has its own copy of the write end after it's started
+    def close_write_end(self):
+        if self.write_fd is not None:
+            os.close(self.write_fd)
+            self.write_fd = None
+
+    def close(self):
+        self.close_write_end()
+        if self._read_fd is not None:
+            self._flush_line()
+            os.close(self._read_fd)
+            self._read_fd = None
+
+
+class _Child:
+    # `process` is None for the processes started with posix_spawn
+    def __init__(self, pid, process, deadline, cancel_event, captures):
+        self.process = process
+        self.pid = pid
+        self.deadline = deadline
+        self.cancel_event = cancel_event
+        self.captures = captures
+        self.pidfd = None
+        self.killed = False
+        self.returncode = None
+        self.rusage = None
+        self.done = threading.Event()
+
+
+# Supervises all the child processes from a single thread. Exits are waited
+# for with pidfd + epoll where available (Linux 5.3+, Python 3.9+), otherwise
+# the children are polled. Processes which exceed their deadline are
+# terminated together with their process groups: SIGTERM first, then SIGKILL
+# if they are still alive after the grace period.
+class ProcessReaper:
+    # Time between SIGTERM and SIGKILL
+    TERMINATION_GRACE_SEC = 1
+    # How often children are polled when pidfd is unavailable, and how often
+    # cancellation events are checked
+    POLL_INTERVAL_SEC = 0.01
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = ProcessReaper()
+            return cls._instance
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._new_children = []
+        self._children = dict()
+        # Heap of (time, sequence number, child, signal to send)
+        self._deadlines = []
+        self._deadlines_counter = 0
+        self._use_pidfd = hasattr(os, 'pidfd_open')
+        # All the children are killed while it's set
+        self._aborted = False
+
+        self._selector = selectors.DefaultSelector()
+        # Sockets rather than a pipe, since on Windows only they're selectable
+        (self._wakeup_read, self._wakeup_write) = socket.socketpair()
+        self._wakeup_read.setblocking(False)
+        self._wakeup_write.setblocking(False)
+        self._selector.register(
+            self._wakeup_read, selectors.EVENT_READ, None)
+
+        thread = threading.Thread(target=self._loop, daemon=True)
+        thread.start()
+
+    # Starts the process and blocks until it's finished.
+    # Returns (killed, returncode, rusage), where `killed` is True if the
+    # process was terminated due to the timeout or the cancellation event.
+    # Resource usage is None on Windows. Write ends of the `captures` should
+    # be passed to the process as its output, they are drained until the
+    # process is reaped.
+    def run(self, args, timeout=None, cancel_event=None, captures=(),
+            **kwargs):
+        if not _is_running_on_windows():
+            kwargs['start_new_session'] = True
+        process = subprocess.Popen(args, **kwargs)
+        return self._supervise(process.pid, process, timeout, cancel_event,
+                               captures)
+
+    # Same as `run`, but the process is started with os.posix_spawn in a new
+    # process group. Unlike Popen with `preexec_fn` it doesn't run any Python
+    # code in the child and lets libc use vfork, so it's both faster and safe
+    # to be used from multiple threads.
+    def spawn(self, path, argv, env, file_actions=(), timeout=None,
+              cancel_event=None, captures=()):
+        pid = os.posix_spawn(path, argv, env, file_actions=file_actions,
+                             setpgroup=0)
+        return self._supervise(pid, None, timeout, cancel_event, captures)
+
+    def _supervise(self, pid, process, timeout, cancel_event, captures):
+        for capture in captures:
+            capture.close_write_end()
+        deadline = None if timeout is None else timer() + timeout
+        child = _Child(pid, process, deadline, cancel_event, captures)
+        with self._lock:
+            self._new_children.append(child)
+        self._wakeup()
+
+        child.done.wait()
+        return child.killed, child.returncode, child.rusage
+
+    # Kills all the supervised processes, and the ones started until `resume`
+    # is called, e.g. while the testing is being aborted
+    def abort(self):
+        self._aborted = True
+        self._wakeup()
+
+    def resume(self):
+        self._aborted = False
+
+    def _wakeup(self):
+        try:
+            self._wakeup_write.send(b'\0')
+        except BlockingIOError:
+            pass
+
+    def _loop(self):
+        while True:
+            try:
+                self._iterate()
+            except Exception:
+                # Waiters would hang forever without the reaper, so all the
+                # children are killed and reported as failed
+                traceback.print_exc()
+                self._fail_children()
+
+    def _iterate(self):
+        for (key, _) in self._selector.select(self._get_select_timeout()):
+            if key.data is None:
+                try:
+                    while self._wakeup_read.recv(4096):
+                        pass
+                except BlockingIOError:
+                    pass
+            elif isinstance(key.data, OutputCapture):
+                # May be already closed if its process was reaped
+                if key.data.is_open() and not key.data.drain():
+                    self._close_capture(key.data)
+            else:
+                self._try_reap(key.data)
+
+        with self._lock:
+            new_children = self._new_children
+            self._new_children = []
+        # Known before the registration, in case it fails
+        self._children.update((child.pid, child) for child in new_children)
+        for child in new_children:
+            self._register(child)
+
+        for child in list(self._children.values()):
+            if self._aborted and not child.killed:
+                child.killed = True
+                self._signal(child, getattr(signal, 'SIGKILL', signal.SIGTERM))
+            if child.pidfd is None:
+                self._try_reap(child)
+            elif child.cancel_event is not None and \
+                    child.cancel_event.is_set() and not child.killed:
+                self._terminate(child)
+
+        now = timer()
+        while len(self._deadlines) > 0 and self._deadlines[0][0] <= now:
+            (_, _, child, sig) = heappop(self._deadlines)
+            if child.done.is_set():
+                continue
+            if sig == signal.SIGTERM:
+                self._terminate(child)
+            else:
+                self._signal(child, sig)
+
+    def _get_select_timeout(self):
+        timeout = None
+        if len(self._deadlines) > 0:
+            timeout = max(self._deadlines[0][0] - timer(), 0)
+        if any(child.pidfd is None or child.cancel_event is not None
+               for child in self._children.values()):
+            if timeout is None or timeout > self.POLL_INTERVAL_SEC:
+                timeout = self.POLL_INTERVAL_SEC
+        return timeout
+
+    def _register(self, child):
+        if self._use_pidfd:
+            try:
+                child.pidfd = os.pidfd_open(child.pid)
+                self._selector.register(
+                    child.pidfd, selectors.EVENT_READ, child)
+            except OSError:
+                child.pidfd = None
+        for capture in child.captures:
+            self._selector.register(capture, selectors.EVENT_READ, capture)
+        if child.deadline is not None:
+            self._push_deadline(child.deadline, child, signal.SIGTERM)
+        self._try_reap(child)
+
+    def _close_capture(self, capture):
+        self._selector.unregister(capture)
+        capture.close()
+
+    def _push_deadline(self, deadline, child, sig):
+        self._deadlines_counter += 1
+        heappush(self._deadlines,
+                 (deadline, self._deadlines_counter, child, sig))
+
+    def _terminate(self, child):
+        if child.killed:
+            return
+        child.killed = True
+        self._signal(child, signal.SIGTERM)
+        if not _is_running_on_windows():
+            self._push_deadline(timer() + self.TERMINATION_GRACE_SEC,
+                                child, signal.SIGKILL)
+
+    def _signal(self, child, sig):
+        if _is_running_on_windows():
+            child.process.terminate()
+            return
+        try:
+            os.killpg(child.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def _try_reap(self, child):
+        if child.done.is_set():
+            return
+        if _is_running_on_windows():
+            returncode = child.process.poll()
+            if returncode is None:
+                return
+        else:
+            if child.killed and hasattr(os, 'waitid'):
+                # While the exited child isn't reaped, its pid (and the process
+                # group id) can't be reused, so the rest of the group is
+                # killed safely here.
+                try:
+                    if os.waitid(os.P_PID, child.pid, os.WEXITED |
+                                 os.WNOHANG | os.WNOWAIT) is None:
+                        return
+                except ChildProcessError:
+                    pass
+                self._signal(child, signal.SIGKILL)
+            try:
+                (pid, status, child.rusage) = os.wait4(child.pid, os.WNOHANG)
+            except ChildProcessError:
+                # Reaped by someone else, its exit status is lost
+                self._finish(child, UNKNOWN_STATUS_RETURNCODE)
+                return
+            if pid == 0:
+                return
+            returncode = _status_to_returncode(status)
+        self._finish(child, returncode)
+
+    def _finish(self, child, returncode):
+        child.returncode = returncode
+        if child.process is not None:
+            child.process.returncode = returncode
+        self._children.pop(child.pid, None)
+        if child.pidfd is not None:
+            self._selector.unregister(child.pidfd)
+            os.close(child.pidfd)
+            child.pidfd = None
+        # The rest of the output is collected, but descendants which are
+        # still alive aren't waited for
+        for capture in child.captures:
+            if capture.is_open():
+                capture.drain()
+                self._close_capture(capture)
+        child.done.set()
+
+    # Kills all the supervised children after an unexpected error, and wakes
+    # up their waiters. The children are reaped if they are gone already.
+    def _fail_children(self):
+        with self._lock:
+            children = list(self._children.values()) + self._new_children
+            self._new_children = []
+        self._children = dict()
+        self._deadlines = []
+        for child in children:
+            if child.done.is_set():
+                continue
+            try:
+                self._signal(child, getattr(signal, 'SIGKILL', signal.SIGTERM))
+                if not _is_running_on_windows():
+                    os.wait4(child.pid, os.WNOHANG)
+            except Exception:
+                pass
+            try:
+                self._finish(child, UNKNOWN_STATUS_RETURNCODE)
+            except Exception:
+                child.done.set()
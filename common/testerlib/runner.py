@@ -30,8 +30,14 @@
 import argparse
 import os
 
+from base import RunnerOptions
+from binary_wrapper import OutputFilter, set_output_filter
+from execution_backend import create_execution_backend, \
+    set_execution_backend
 from interface import YandexContestInterface, IRunnerInterface, LocalInterface
-from tester_config import configure
+from object_cache import CACHE_ENVIRONMENT_VARIABLES
+from test_plan import TEST_PLAN_FILENAME, load_test_plan
+from workspace import Workspace, set_workspace
 
 YANDEX_CONTEST_MODE = 'yandex-contest'
 IRUNNER_MODE = 'irunner'
@@ -44,7 +50,8 @@ if __name__ == '__main__':
                         help='Path to the directory with executables.')
     parser.add_argument('--mode',
                         default=IRUNNER_MODE,
-                        choices=[YANDEX_CONTEST_MODE, IRUNNER_MODE, LOCAL_MODE])
+                        choices=[YANDEX_CONTEST_MODE, IRUNNER_MODE,
+                                 LOCAL_MODE])
     parser.add_argument('--dry-run',
                         default=False,
                         help='If true, doesn\'t actually execute the tests.',
@@ -75,6 +82,85 @@ if __name__ == '__main__':
                              ' there will be a warning printed if exec time is'
                              ' less than 1/4 of the specified TL.',
                         action='store_true')
+    parser.add_argument('--jobs',
+                        default=1,
+                        type=int,
+                        help='Number of tests executed in parallel. Tests'
+                             ' which depend on other tests are started only'
+                             ' after all their dependencies are finished.')
+    parser.add_argument('--gtest-batch-size',
+                        default=None,
+                        type=int,
+                        help='If greater than 1, up to this number of Google'
+                             ' Test cases from the same suit are executed in a'
+                             ' single process. Tests crashing the batch are'
+                             ' re-executed in isolation.')
+    parser.add_argument('--gtest-shards',
+                        default=None,
+                        type=int,
+                        help='If greater than 1, each batch of Google Test'
+                             ' cases is spread across this number of'
+                             ' concurrent processes using gtest sharding.'
+                             ' Without --gtest-batch-size the whole suit'
+                             ' becomes a single batch.')
+    parser.add_argument('--gtest-repeat-in-process',
+                        default=None,
+                        help='If specified, repeated runs of the Google Test'
+                             ' cases are done inside a single process with'
+                             ' --gtest_repeat and --gtest_shuffle.',
+                        action='store_true')
+    parser.add_argument('--gtest-random-seed',
+                        default=None,
+                        type=int,
+                        help='Seed for --gtest_shuffle (1..99999). Random by'
+                             ' default, printed with --print-test-config.')
+    parser.add_argument('--editions-concurrency',
+                        default=None,
+                        type=int,
+                        help='Number of editions (_opt, _asan, etc.) of the'
+                             ' test binary executed concurrently for each'
+                             ' test. The first failure cancels the others.')
+    parser.add_argument('--edition-stats',
+                        default=None,
+                        help='Path to the file with per-test statistics of'
+                             ' editions (durations and failure rates). If'
+                             ' specified, the edition which is the most'
+                             ' likely to fail cheaply is run first.')
+    parser.add_argument('--failed-output-tail-kb',
+                        default=None,
+                        type=int,
+                        help='If specified, the last KBs of stdout and stderr'
+                             ' of the failed tests are kept for the report'
+                             ' (iRunner JSON).')
+    parser.add_argument('--sandbox',
+                        default='rlimit',
+                        choices=['auto', 'rlimit', 'cgroup'],
+                        help='How the resources of the test processes are'
+                             ' limited: with setrlimit() or with a transient'
+                             ' cgroup v2 per process. The cgroup one also'
+                             ' limits and accounts the memory of the whole'
+                             ' process tree. The auto one uses cgroups if'
+                             ' --cgroup-root is specified and usable.')
+    parser.add_argument('--cgroup-root',
+                        default=None,
+                        help='Delegated cgroup v2 directory where the'
+                             ' transient cgroups are created. By default the'
+                             ' cgroup sandbox uses the cgroup of the tester'
+                             ' process, whose processes are moved to its'
+                             ' leaf child cgroup.')
+    parser.add_argument('--cgroup-cpu-cores',
+                        default=None,
+                        type=float,
+                        help='If specified, CPU bandwidth of each test'
+                             ' process is limited to this number of cores'
+                             ' (cgroup sandbox only).')
+    parser.add_argument('--scratch-root',
+                        default=None,
+                        help='Directory where the working directories of the'
+                             ' test processes are kept, the current directory'
+                             ' by default. Note that the files written by the'
+                             ' tests to tmpfs (e.g. /dev/shm) take RAM which'
+                             ' isn\'t covered by the memory limits.')
     parser.add_argument('--irunner-report-json')
     args = parser.parse_args()
 
@@ -85,10 +171,38 @@ if __name__ == '__main__':
     else:
         test_system_interface = LocalInterface()
 
-    config = configure(args.build_dir, args.dry_run)
+    set_execution_backend(
+        create_execution_backend(args.sandbox, args.cgroup_root,
+                                 args.cgroup_cpu_cores))
+    set_workspace(Workspace(args.scratch_root, preallocated_count=args.jobs))
+    # The tests mustn't find the object cache of the builds
+    for name in CACHE_ENVIRONMENT_VARIABLES:
+        os.environ.pop(name, None)
+    # Loaded before any test is run, so the tests can't change it
+    output_filter_path = os.path.join(args.build_dir, OutputFilter.FILENAME)
+    if os.path.exists(output_filter_path):
+        set_output_filter(OutputFilter.load(output_filter_path))
+
+    # The test plan compiled by build.sh from the declarative config is
+    # preferred over the `tester_config` script
+    test_plan_path = os.path.join(args.build_dir, TEST_PLAN_FILENAME)
+    if os.path.exists(test_plan_path):
+        config = load_test_plan(test_plan_path, args.build_dir, args.dry_run)
+    else:
+        from tester_config import configure
+        config = configure(args.build_dir, args.dry_run)
     tester = config.create_tester(
         enable_aggregation=not args.disable_aggregation,
-        time_limit_debug_mode=args.time_limit_debug)
+        time_limit_debug_mode=args.time_limit_debug,
+        jobs=args.jobs,
+        runner_options=RunnerOptions(
+            gtest_batch_size=args.gtest_batch_size,
+            gtest_shards_count=args.gtest_shards,
+            gtest_repeat_in_process=args.gtest_repeat_in_process,
+            gtest_random_seed=args.gtest_random_seed,
+            gtest_editions_concurrency=args.editions_concurrency,
+            gtest_edition_stats_path=args.edition_stats,
+            output_tail_kb=args.failed_output_tail_kb))
     tester.run(test_system_interface, verbose=args.verbose_testing,
                print_report_to_stderr=args.print_report_to_stderr,
                print_test_config=args.print_test_config)
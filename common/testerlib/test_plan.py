@@ -0,0 +1,304 @@
+# Copyright (c) 2019-2022 Andrei Ilyin. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#    * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#    * Changes made to the source code must be documented if this code is
+# published in a repository/storage with a public access.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# Declarative tester configuration. Instead of the `tester_config.py` script
+# a lab may provide `tester_config.json`:
+#
+#   {
+#     "overall_tl_sec": 480,
+#     "default_time_limit_sec": 1,
+#     "default_time_limit_mode": "WALL",
+#     "default_memory_limit_kb": null,
+#     "runners": [
+#       {"type": "gtest", "binary": "tests", "editions": ["_opt", "_dbg"],
+#        "heavy_tests_editions": ["_opt"], "runs_count": 2,
+#        "heavy_tests": ["Speed\\..*"]},
+#       {"type": "fake", "tests": [["FullSolutionBonus", "Bonus"]]}
+#     ],
+#     "skip": ["SomeOldTestSuite\\..*"],
+#     "public": ["Samples\\..*"],
+#     "private": [{"filter": "Foo\\..*", "score": 4}],
+#     "normalize_scores": 150,
+#     "time_limits": [{"filter": "Foo\\.Big.*", "time_sec": 30}],
+#     "memory_limits": [{"filter": "Foo\\..*", "memory_kb": 65536}],
+#     "time_limit_modes": [{"filter": "Speed\\..*", "mode": "CPU"}],
+#     "dependencies": [{"target": "FullSolutionBonus\\.Bonus",
+#                       "required": "Foo\\..*"}],
+#     "standalone": ["Samples\\..*"],
+#     "force_skip": [{"filter": ".*(Foo|Bar).*", "reverse": false}]
+#   }
+#
+# Sections are applied in this order, regexes have the same meaning as in the
+# corresponding Configurator methods. build.sh compiles the config against the
+# built binaries into `test_plan.json`, where every test is resolved (type,
+# score, limits, dependents, heavy and standalone flags). The runner loads the
+# plan without evaluating any regex, and configuration errors fail the build.
+
+import argparse
+import json
+import os
+import re
+
+from sys import stderr
+
+from base import *
+from configurator import Configurator
+from fake_test import FakeTestRunner
+from gtest import GoogleTestRunner, prepare_google_test_runner
+
+TESTER_CONFIG_FILENAME = 'tester_config.json'
+TEST_PLAN_FILENAME = 'test_plan.json'
+TEST_PLAN_VERSION = 1
+
+_SETTINGS = ('overall_tl_sec', 'default_time_limit_sec',
+             'default_memory_limit_kb', 'default_time_limit_mode')
+_GTEST_RUNNER_OPTIONS = (
+    'editions', 'heavy_tests_editions', 'runs_count', 'batch_size',
+    'shards_count', 'repeat_in_process', 'editions_concurrency',
+    'edition_stats_path', 'output_tail_kb')
+_RUNNER_KEYS = {
+    'gtest': ('type', 'binary', 'heavy_tests') + _GTEST_RUNNER_OPTIONS,
+    'fake': ('type', 'tests'),
+}
+# Sections which are lists of regexes
+_REGEX_SECTIONS = ('skip', 'public', 'standalone')
+# Sections which are lists of objects: (required keys, optional keys)
+_OBJECT_SECTIONS = {
+    'private': (('filter', 'score'), ()),
+    'time_limits': (('filter', 'time_sec'), ()),
+    'memory_limits': (('filter', 'memory_kb'), ()),
+    'time_limit_modes': (('filter', 'mode'), ()),
+    'dependencies': (('target', 'required'), ()),
+    'force_skip': (('filter',), ('reverse',)),
+}
+_REGEX_KEYS = ('filter', 'target', 'required')
+
+
+def _check_regex(regex):
+    if not isinstance(regex, str):
+        raise ConfigurationError('Regex expected, got %r' % (regex,))
+    try:
+        re.compile(regex)
+    except re.error as e:
+        raise ConfigurationError("Invalid regex '%s': %s" % (regex, e))
+
+
+def _check_time_limit_mode(name):
+    if name not in TimeLimitMode.__members__:
+        raise ConfigurationError("Unknown time limit mode '%s'" % name)
+
+
+# Validates the structure of the config and its regexes, which doesn't need
+# the built binaries
+def check_config(config):
+    if not isinstance(config, dict):
+        raise ConfigurationError('The config must be a JSON object')
+    for key in config:
+        if key not in _SETTINGS and key not in _REGEX_SECTIONS and \
+                key not in _OBJECT_SECTIONS and \
+                key not in ('runners', 'normalize_scores'):
+            raise ConfigurationError("Unknown config section '%s'" % key)
+    if 'default_time_limit_mode' in config:
+        _check_time_limit_mode(config['default_time_limit_mode'])
+
+    if not config.get('runners'):
+        raise ConfigurationError('No runners are configured')
+    for spec in config['runners']:
+        if not isinstance(spec, dict) or spec.get('type') not in _RUNNER_KEYS:
+            raise ConfigurationError('Unknown runner %r' % (spec,))
+        for key in spec:
+            if key not in _RUNNER_KEYS[spec['type']]:
+                raise ConfigurationError(
+                    "Unknown option '%s' of the %s runner"
+                    % (key, spec['type']))
+        for regex in spec.get('heavy_tests', ()):
+            _check_regex(regex)
+
+    for section in _REGEX_SECTIONS:
+        for regex in config.get(section, ()):
+            _check_regex(regex)
+    for (section, (required_keys, optional_keys)) in _OBJECT_SECTIONS.items():
+        for item in config.get(section, ()):
+            if not isinstance(item, dict) or \
+                    any(key not in item for key in required_keys) or \
+                    any(key not in required_keys + optional_keys
+                        for key in item):
+                raise ConfigurationError(
+                    "Invalid item of the '%s' section: %r (keys: %s)"
+                    % (section, item, ', '.join(required_keys)))
+            for key in _REGEX_KEYS:
+                if key in item:
+                    _check_regex(item[key])
+            if 'mode' in item:
+                _check_time_limit_mode(item['mode'])
+
+
+def load_config(config_path):
+    try:
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+    except ValueError as e:
+        raise ConfigurationError('Cannot parse %s: %s' % (config_path, e))
+    check_config(config)
+    return config
+
+
+def _create_configurator(settings, strict):
+    kwargs = dict((key, settings[key]) for key in _SETTINGS if key in settings)
+    if 'default_time_limit_mode' in kwargs:
+        kwargs['default_time_limit_mode'] = \
+            TimeLimitMode[kwargs['default_time_limit_mode']]
+    return Configurator(strict=strict, **kwargs)
+
+
+def _create_runner(spec, build_dir, dry_run):
+    if spec['type'] == 'fake':
+        return FakeTestRunner([tuple(names) for names in spec['tests']])
+
+    kwargs = dict((key, spec[key])
+                  for key in _GTEST_RUNNER_OPTIONS if key in spec)
+    for key in ('editions', 'heavy_tests_editions'):
+        if key in kwargs:
+            kwargs[key] = tuple(kwargs[key])
+    return prepare_google_test_runner(
+        test_binary_path=os.path.join(build_dir, spec.get('binary', 'tests')),
+        dry_run=dry_run, **kwargs)
+
+
+def _apply_sections(config, configurator: Configurator):
+    for regex in config.get('skip', ()):
+        configurator.skip_group(regex)
+    for regex in config.get('public', ()):
+        configurator.add_public_group(regex)
+    for item in config.get('private', ()):
+        configurator.add_private_group(item['filter'], item['score'])
+    if 'normalize_scores' in config:
+        configurator.normalize_scores(config['normalize_scores'])
+    for item in config.get('time_limits', ()):
+        configurator.override_time_limit(item['filter'], item['time_sec'])
+    for item in config.get('memory_limits', ()):
+        configurator.override_memory_limit(item['filter'], item['memory_kb'])
+    for item in config.get('time_limit_modes', ()):
+        configurator.override_time_limit_mode(
+            item['filter'], TimeLimitMode[item['mode']])
+    for item in config.get('dependencies', ()):
+        configurator.add_dependency(item['target'], item['required'])
+    for regex in config.get('standalone', ()):
+        configurator.mark_standalone_tests(regex)
+    for item in config.get('force_skip', ()):
+        configurator.force_skip_group(
+            item['filter'], item.get('reverse', False))
+
+
+# Resolves the config against the binaries in `build_dir`. Any configuration
+# error raises ConfigurationError.
+def compile_test_plan(config, build_dir):
+    configurator = _create_configurator(config, strict=True)
+    runners = [_create_runner(spec, build_dir, dry_run=True)
+               for spec in config['runners']]
+    for runner in runners:
+        configurator.load_runner(runner)
+
+    for (spec, runner) in zip(config['runners'], runners):
+        for regex in spec.get('heavy_tests', ()):
+            tests = [test for test in configurator.find_tests(regex)
+                     if test.runner is runner]
+            if len(tests) == 0:
+                raise ConfigurationError("No tests match regex '%s'" % regex)
+            for test in tests:
+                runner.mark_heavy_test(test.description.full_name())
+
+    _apply_sections(config, configurator)
+
+    tests = configurator.export_plan()
+    for entry in tests:
+        runner = runners[entry['runner']]
+        entry['heavy'] = isinstance(runner, GoogleTestRunner) and \
+            runner.is_heavy_test(entry['name'])
+    return {
+        'version': TEST_PLAN_VERSION,
+        'settings': dict(
+            (key, config[key]) for key in _SETTINGS if key in config),
+        'runners': [
+            dict((key, value) for (key, value) in spec.items()
+                 if key != 'heavy_tests')
+            for spec in config['runners']],
+        'tests': tests,
+    }
+
+
+def load_test_plan(plan_path, build_dir, dry_run):
+    with open(plan_path, 'r') as f:
+        plan = json.load(f)
+    if plan.get('version') != TEST_PLAN_VERSION:
+        raise ConfigurationError(
+            'Unsupported test plan version %r' % plan.get('version'))
+
+    configurator = _create_configurator(plan['settings'], strict=False)
+    runners = [_create_runner(spec, build_dir, dry_run)
+               for spec in plan['runners']]
+    for runner in runners:
+        configurator.load_runner(runner)
+    configurator.apply_plan(plan['tests'])
+    for entry in plan['tests']:
+        if entry['heavy']:
+            runners[entry['runner']].mark_heavy_test(entry['name'])
+    return configurator
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config',
+                        default=TESTER_CONFIG_FILENAME,
+                        help='Path to the declarative tester config.')
+    parser.add_argument('--check',
+                        default=False,
+                        help='If specified, only validates the config, which'
+                             ' doesn\'t need the built binaries.',
+                        action='store_true')
+    parser.add_argument('--build-dir',
+                        default=os.curdir,
+                        help='Path to the directory with executables.')
+    parser.add_argument('--output',
+                        default=None,
+                        help='Path to the compiled test plan, \'%s\' in the'
+                             ' build directory by default.'
+                             % TEST_PLAN_FILENAME)
+    args = parser.parse_args()
+
+    try:
+        config = load_config(args.config)
+        if not args.check:
+            plan = compile_test_plan(config, args.build_dir)
+            output_path = args.output
+            if output_path is None:
+                output_path = os.path.join(args.build_dir, TEST_PLAN_FILENAME)
+            with open(output_path, 'w') as f:
+                json.dump(plan, f, indent=1)
+    except ConfigurationError as e:
+        print('ERROR: ' + str(e), file=stderr)
+        exit(1)
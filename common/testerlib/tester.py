@@ -25,19 +25,31 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from heapq import heapify, heappop, heappush
 from sys import stdout
+from threading import Lock
+from timeit import default_timer as timer
 
 from base import *
+from dependency_graph import DependencyGraph
 from interface import TestingSystemInterface
+from process_reaper import ProcessReaper
 
 
 class Tester:
-    def __init__(self, overall_tl_sec, enable_time_limit_debug_mode):
+    def __init__(self, overall_tl_sec, enable_time_limit_debug_mode, jobs=1,
+                 dependency_graph: DependencyGraph = None):
         self._public_tests = []
         self._private_tests = []
         self._aggregated_suits = set()
         self._overall_tl_sec = overall_tl_sec
         self._enable_time_limit_debug_mode = enable_time_limit_debug_mode
+        self._jobs = max(1, jobs)
+        if dependency_graph is None:
+            dependency_graph = DependencyGraph()
+        self._dependency_graph = dependency_graph
+        self._output_lock = Lock()
 
     def add_public_test(self, test: Test):
         self._public_tests.append(test)
@@ -60,8 +72,21 @@ class Tester:
             else:
                 raise NotImplementedError('testing mode not supported')
 
+            # Let the runners know what is going to be executed
+            runners = []
+            for test in tests_list:
+                if test.runner not in runners:
+                    runners.append(test.runner)
+            for runner in runners:
+                runner.prepare([test.description for test in tests_list
+                                if test.runner is runner])
+
             # Execute the tests
-            self._run_tests(tests_list, verbose, print_test_config)
+            try:
+                self._run_tests(tests_list, verbose, print_test_config)
+            finally:
+                for runner in runners:
+                    runner.finalize()
 
             # Prepare test groups
             test_groups_order = []
@@ -111,66 +136,186 @@ class Tester:
             print('Starting testing with overall TL ' + str(
                 self._overall_tl_sec) + ' seconds')
 
-        overall_time_sec = 0
-        for test in tests_list:
-            if test.result is not None:
-                if verbose:
-                    print("-- skipping '%s.%s' (dependency failed)" % (
-                        test.description.suit_name,
-                        test.description.test_name))
-                    stdout.flush()
-                continue
-
-            if verbose:
-                print("-- running '%s.%s'" % (
-                    test.description.suit_name, test.description.test_name))
-                if print_test_config:
-                    print('  Type: ' + str(
-                        test.description.type))
-                    print('  Dependencies from this test: ' + str(
-                        [
-                            t.description.full_name()
-                            for t in test.description.dependencies
-                        ]))
-                    print('  Max score: ' + str(
-                        test.description.max_score))
-                    print('  Standalone: ' + str(
-                        test.description.exclude_from_aggregation))
-                    print('  Time limit: ' + str(
-                        test.description.resource_limits.time_sec))
-                    print('  Memory limit: ' + str(
-                        test.description.resource_limits.memory_kb))
-                stdout.flush()
-
-            if self._enable_time_limit_debug_mode:
-                real_tl_sec = test.description.resource_limits.time_sec
-                test.description.resource_limits.time_sec = None
-                test.result = test.runner.run(test.description)
-                test.description.resource_limits.time_sec = real_tl_sec
-
-                if test.result.time_sec * 4 > real_tl_sec:
-                    print('[ WARNING ] Test execution time is %.4f '
-                          'while limit is %.4f (test: %s)'
-                          % ((test.result.time_sec,
-                              real_tl_sec,
-                              test.description.full_name())))
-                    stdout.flush()
-            else:
-                test.result = test.runner.run(test.description)
+        # Tests are started in the topological order as soon as all the tests
+        # they depend on are passed. When some test fails, all the tests
+        # depending on it (directly or transitively) are skipped at once.
+        graph = self._dependency_graph.subgraph(tests_list)
+        skipped_tests = set()
+        tests_order = graph.topological_order()
+        rank = dict((test, i) for (i, test) in enumerate(tests_order))
+        remaining_prerequisites = dict(
+            (test, len(graph.prerequisites(test))) for test in tests_order)
+        ready_tests = [rank[test] for test in tests_order
+                       if remaining_prerequisites[test] == 0]
+        heapify(ready_tests)
+        # Tests of a runner's batch are started together, as one job, with
+        # the other tests of the batch which are ready at the moment. The
+        # ones which become ready later are started as another batch.
+        batches = dict()
+        for test in tests_order:
+            batch = test.runner.get_batch(test.description)
+            if batch is not None:
+                batches.setdefault((test.runner, batch), []).append(test)
+        started_tests = set()
+
+        # Overall time limit is applied to the wall clock time of the whole
+        # testing, so the concurrent tests are counted once
+        start_time = timer()
+        running_tests = dict()
+        executor = ThreadPoolExecutor(max_workers=self._jobs)
+        try:
+            while len(ready_tests) > 0 or len(running_tests) > 0:
+                while len(ready_tests) > 0 and \
+                        len(running_tests) < self._jobs:
+                    test = tests_order[heappop(ready_tests)]
+                    if test in started_tests:
+                        continue
+                    batch = test.runner.get_batch(test.description)
+                    tests = [test]
+                    if batch is not None:
+                        tests = [
+                            batch_test
+                            for batch_test in batches[(test.runner, batch)]
+                            if batch_test not in started_tests and
+                            batch_test.result is None and
+                            remaining_prerequisites[batch_test] == 0]
+                    started_tests.update(tests)
+                    if verbose:
+                        for started_test in tests:
+                            self._print_test_start(
+                                started_test, graph, print_test_config)
+                    future = executor.submit(self._run_unit, tests)
+                    running_tests[future] = tests
+
+                timeout = None
+                if not self._enable_time_limit_debug_mode:
+                    timeout = max(
+                        self._overall_tl_sec - (timer() - start_time), 0)
+                finished, _ = wait(running_tests, timeout=timeout,
+                                   return_when=FIRST_COMPLETED)
+                if timer() - start_time > self._overall_tl_sec and \
+                        not self._enable_time_limit_debug_mode:
+                    raise TimeoutError(
+                        'General time limit exceeded. Testing aborted.')
 
-            overall_time_sec += test.result.time_sec
-            if overall_time_sec > self._overall_tl_sec and \
-                    not self._enable_time_limit_debug_mode:
-                raise TimeoutError(
-                    'General time limit exceeded. Testing aborted.')
+                # Results are processed in the topological order, so that the
+                # skipped tests don't depend on thread timings
+                finished_tests = []
+                for future in finished:
+                    tests = running_tests.pop(future)
+                    for (test, result) in zip(tests, future.result()):
+                        test.result = result
+                        finished_tests.append(test)
+                for test in sorted(finished_tests, key=lambda t: rank[t]):
+                    if test.result.verdict != Verdict.ACCEPTED:
+                        for dependent_test in graph.all_dependents(
+                                test, skipped_tests):
+                            if dependent_test.result is not None:
+                                continue
+                            dependent_test.result = TestResult(
+                                Verdict.DEPENDENCY_FAILED, 0, 0)
+                            if verbose:
+                                self._print(
+                                    "-- skipping '%s.%s' (dependency "
+                                    "failed)" % (
+                                        dependent_test.description.suit_name,
+                                        dependent_test.description.test_name))
+                        continue
 
-            if test.result.verdict != Verdict.ACCEPTED:
-                for dependent_test in test.description.dependencies:
-                    dependent_test.result = TestResult(
-                        Verdict.DEPENDENCY_FAILED, 0, 0)
+                    for dependent_test in graph.dependents(test):
+                        remaining_prerequisites[dependent_test] -= 1
+                        if remaining_prerequisites[dependent_test] == 0 and \
+                                dependent_test.result is None:
+                            heappush(ready_tests, rank[dependent_test])
+        except BaseException:
+            # The running tests are interrupted rather than waited for
+            reaper = ProcessReaper.instance()
+            reaper.abort()
+            try:
+                executor.shutdown(wait=True)
+            finally:
+                reaper.resume()
+            raise
+        executor.shutdown(wait=True)
 
+        overall_time_sec = timer() - start_time
         if overall_time_sec * 4 > self._overall_tl_sec:
-            print('[ WARNING ] Overall execution time is %.4f '
-                  '(overall limit is %.4f)'
-                  % ((overall_time_sec, self._overall_tl_sec)))
+            self._print('[ WARNING ] Overall execution time is %.4f '
+                        '(overall limit is %.4f)'
+                        % ((overall_time_sec, self._overall_tl_sec)))
+
+    # Runs a single test or the tests of one batch, returns their results
+    def _run_unit(self, tests):
+        runner = tests[0].runner
+        descriptions = [test.description for test in tests]
+        real_tls_sec = [description.resource_limits.time_sec
+                        for description in descriptions]
+        if self._enable_time_limit_debug_mode:
+            for description in descriptions:
+                description.resource_limits.time_sec = None
+        if len(tests) == 1:
+            results = [runner.run(descriptions[0])]
+        else:
+            results = runner.run_batch(descriptions)
+        if not self._enable_time_limit_debug_mode:
+            return results
+
+        for (description, real_tl_sec) in zip(descriptions, real_tls_sec):
+            description.resource_limits.time_sec = real_tl_sec
+        for (test, result) in zip(tests, results):
+            self._check_test_time(test, result)
+        return results
+
+    def _check_test_time(self, test: Test, result: TestResult):
+        real_tl_sec = test.description.resource_limits.time_sec
+        time_limit_mode = test.description.resource_limits.time_limit_mode
+        limited_time_sec = 0
+        if time_limit_mode != TimeLimitMode.CPU:
+            limited_time_sec = result.time_sec
+        if time_limit_mode != TimeLimitMode.WALL and \
+                result.cpu_time_sec is not None:
+            limited_time_sec = max(limited_time_sec, result.cpu_time_sec)
+        if limited_time_sec * 4 > real_tl_sec:
+            cpu_time_str = 'unknown'
+            if result.cpu_time_sec is not None:
+                cpu_time_str = '%.4f' % result.cpu_time_sec
+            self._print('[ WARNING ] Test execution time is %.4f (CPU time '
+                        'is %s) while %s limit is %.4f (test: %s)'
+                        % ((result.time_sec,
+                            cpu_time_str,
+                            time_limit_mode.name,
+                            real_tl_sec,
+                            test.description.full_name())))
+
+    def _print_test_start(self, test: Test, graph: DependencyGraph,
+                          print_test_config):
+        lines = ["-- running '%s.%s'" % (
+            test.description.suit_name, test.description.test_name)]
+        if print_test_config:
+            lines.append('  Type: ' + str(
+                test.description.type))
+            lines.append('  Dependencies from this test: ' + str(
+                [
+                    t.description.full_name()
+                    for t in graph.dependents(test)
+                ]))
+            lines.append('  Max score: ' + str(
+                test.description.max_score))
+            lines.append('  Standalone: ' + str(
+                test.description.exclude_from_aggregation))
+            lines.append('  Time limit: ' + str(
+                test.description.resource_limits.time_sec))
+            lines.append('  Time limit mode: ' + str(
+                test.description.resource_limits.time_limit_mode.name))
+            lines.append('  Memory limit: ' + str(
+                test.description.resource_limits.memory_kb))
+            for line in test.runner.describe(test.description):
+                lines.append('  ' + line)
+        self._print('\n'.join(lines))
+
+    # Tests are executed in parallel, so the output is serialized to prevent
+    # lines of different tests from being mixed.
+    def _print(self, message):
+        with self._output_lock:
+            print(message)
             stdout.flush()
@@ -0,0 +1,196 @@
+# Copyright (c) 2019-2022 Andrei Ilyin. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#    * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#    * Changes made to the source code must be documented if this code is
+# published in a repository/storage with a public access.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+# Unity (jumbo) build: several translation units are compiled as one, which
+# includes them one after another, so that the compiler starts and parses the
+# common headers only once. The sources are scanned to find the ones which
+# may change each other's meaning when concatenated, and those are compiled
+# separately. The scan is heuristic: its mistakes may only turn into compile
+# errors of the unity source, after which the sources are compiled one by
+# one (see build.py).
+
+import os
+import re
+
+_CONTINUATION_RE = re.compile(r'\\\n')
+_COMMENT_OR_LITERAL_RE = re.compile(
+    r'//[^\n]*|/[*].*?[*]/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'',
+    re.DOTALL)
+_DIRECTIVE_RE = re.compile(r'^[ \t]*#[ \t]*(\w+)[ \t]*(\w*).*$', re.MULTILINE)
+_TOKEN_RE = re.compile(r'[A-Za-z_]\w*|\S')
+_IDENTIFIER_RE = re.compile(r'[A-Za-z_]\w*$')
+
+# Keywords followed by the name of the declared entity
+_DECLARATION_KEYWORDS = ('class', 'struct', 'union', 'enum', 'namespace')
+# Tokens after the name of the declared variable or function
+_DECLARATOR_ENDS = ('(', '=', ';', '[', '{')
+# Keywords which may precede a parenthesis in a declaration
+_NOT_NAMES = ('alignas', 'decltype', 'noexcept', 'sizeof', 'static_assert',
+              'throw')
+# Test macros of gtest and utils.h, e.g. TEST(Suit, Test) or SAFE_TEST_A(...).
+# The names they define are made of their arguments, so the same names in
+# two sources fail the compilation instead of changing its meaning.
+_TEST_MACRO_RE = re.compile(r'(?:SAFE_|SPEED_|TYPED_)?TEST(?:_[A-Z]+)?$')
+
+
+# Names which a source brings into the unity translation unit, and the
+# identifiers it refers to
+class UnitySource:
+    def __init__(self, path, text):
+        self.path = path
+        # Names with internal linkage and using-declarations, which would
+        # be visible to (and could overload) the names of the next sources
+        self.internal_names = set()
+        self.identifiers = set()
+        # Compiled separately: macros may change the next sources and the
+        # headers shared with them, using-directives change the lookup, and
+        # the names of the internal operators and the ones generated by
+        # macros are unknown
+        self.exclusive = False
+
+        text = _CONTINUATION_RE.sub('', text)
+        text = _COMMENT_OR_LITERAL_RE.sub(
+            lambda match: ' ' if match.group(0)[0] == '/' else '""', text)
+        for match in _DIRECTIVE_RE.finditer(text):
+            if match.group(1) in ('define', 'undef'):
+                self.exclusive = True
+        self._scan_declarations(_TOKEN_RE.findall(_DIRECTIVE_RE.sub('', text)))
+
+    def conflicts_with(self, other):
+        return self.exclusive or other.exclusive or \
+            not self.internal_names.isdisjoint(other.identifiers) or \
+            not other.internal_names.isdisjoint(self.identifiers)
+
+    def _scan_declarations(self, tokens):
+        # 'anonymous', 'namespace' or 'other' for each open brace
+        scopes = []
+        # Namespace scope tokens of the current declaration
+        statement = []
+        for token in tokens:
+            if _IDENTIFIER_RE.match(token):
+                self.identifiers.add(token)
+            in_namespace = all(scope != 'other' for scope in scopes)
+            if in_namespace:
+                statement.append(token)
+            if token == '{':
+                if in_namespace:
+                    scopes.append(self._get_scope(statement))
+                    self._end_statement(statement, scopes)
+                    if scopes[-1] != 'other':
+                        statement = []
+                else:
+                    scopes.append('other')
+            elif token == '}' and len(scopes) > 0:
+                if in_namespace and len(statement) > 1:
+                    # Declaration without a semicolon, e.g. a macro
+                    self._end_statement(statement[:-1], scopes)
+                scopes.pop()
+                if all(scope != 'other' for scope in scopes):
+                    statement = []
+            elif token == ';' and in_namespace:
+                self._end_statement(statement, scopes)
+                statement = []
+        if len(statement) > 0:
+            self._end_statement(statement, scopes)
+
+    @staticmethod
+    def _get_scope(statement):
+        if statement[-2:] == ['namespace', '{']:
+            return 'anonymous'
+        if statement[-3:-2] == ['namespace']:
+            return 'namespace'
+        return 'other'
+
+    def _end_statement(self, statement, scopes):
+        if len(statement) > 0 and statement[0] == 'using':
+            if statement[1:2] == ['namespace']:
+                self.exclusive = True
+            elif '=' in statement:
+                # Alias declaration
+                self.internal_names.add(statement[1])
+            elif len(statement) > 2:
+                self.internal_names.add(statement[-2])
+            return
+        # Scope of the declaration itself, without the brace it opens
+        enclosing_scopes = scopes[:-1] if statement[-1] == '{' else scopes
+        if 'anonymous' not in enclosing_scopes and 'static' not in statement:
+            return
+
+        if 'operator' in statement:
+            self.exclusive = True
+            return
+        depth = 0
+        # Identifiers of an initializer aren't the declared names
+        in_initializer = False
+        for (previous, token) in zip(statement, statement[1:]):
+            if previous in _DECLARATION_KEYWORDS and \
+                    _IDENTIFIER_RE.match(token) and \
+                    token not in _DECLARATION_KEYWORDS:
+                self.internal_names.add(token)
+            if depth == 0 and not in_initializer and \
+                    token in _DECLARATOR_ENDS and \
+                    _IDENTIFIER_RE.match(previous) and \
+                    previous not in _NOT_NAMES:
+                if token != '(' or not previous.isupper():
+                    self.internal_names.add(previous)
+                elif not _TEST_MACRO_RE.match(previous):
+                    # Other macros may define any names
+                    self.exclusive = True
+            if token in ('(', '['):
+                depth += 1
+            elif token in (')', ']'):
+                depth -= 1
+            elif depth == 0 and token in ('=', ','):
+                in_initializer = token == '='
+
+
+# Splits the sources into groups which may be compiled as unity translation
+# units, keeping the order of the sources within each group
+def group_sources(paths):
+    groups = []
+    for path in paths:
+        try:
+            with open(path, errors='replace') as source_file:
+                source = UnitySource(path, source_file.read())
+        except OSError:
+            # Reported by the compilation
+            source = UnitySource(path, '')
+            source.exclusive = True
+        for group in groups:
+            if not any(source.conflicts_with(other) for other in group):
+                group.append(source)
+                break
+        else:
+            groups.append([source])
+    return groups
+
+
+def write_unity_source(path, sources):
+    with open(path, 'w') as unity_file:
+        for source in sources:
+            unity_file.write('#include "%s"\n' % os.path.abspath(source.path))
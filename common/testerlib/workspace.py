@@ -0,0 +1,127 @@
+# Copyright (c) 2019-2022 Andrei Ilyin. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#    * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#    * Changes made to the source code must be documented if this code is
+# published in a repository/storage with a public access.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import atexit
+import os
+import queue
+import shutil
+import tempfile
+import threading
+
+from contextlib import contextmanager
+
+
+# Pool of scratch directories used as working directories of the tested
+# processes, created under the current (build) directory by default. A
+# directory is taken by a single execution and is never reused: once it's
+# released, it's renamed away and removed in the background, so no file
+# (e.g. the anti-cheat token) survives from one execution to another, even
+# if written by a process which outlived the execution. The directories have
+# random names and are created ahead of time, up to the number of concurrent
+# executions.
+class Workspace:
+    REMOVED_DIR_SUFFIX = '.removed'
+
+    def __init__(self, scratch_root=None, preallocated_count=0):
+        if scratch_root is None:
+            scratch_root = os.curdir
+        self._root = tempfile.mkdtemp(prefix='tester-', dir=scratch_root)
+        self._lock = threading.Lock()
+        self._free_dirs = []
+        for i in range(preallocated_count):
+            self._free_dirs.append(self._create_dir())
+        # Released directories, removed by the cleaner thread
+        self._removed_dirs = queue.Queue()
+        self._cleaner = None
+
+    def root(self):
+        return self._root
+
+    @contextmanager
+    def acquire(self):
+        with self._lock:
+            path = self._free_dirs.pop() if len(self._free_dirs) > 0 \
+                else None
+        if path is None:
+            path = self._create_dir()
+        try:
+            yield path
+        finally:
+            self._release(path)
+
+    def close(self):
+        shutil.rmtree(self._root, ignore_errors=True)
+
+    # Waits until the released directories are removed
+    def flush(self):
+        self._removed_dirs.join()
+
+    def _create_dir(self):
+        return tempfile.mkdtemp(dir=self._root)
+
+    def _release(self, path):
+        removed_path = path + self.REMOVED_DIR_SUFFIX
+        try:
+            os.rename(path, removed_path)
+        except OSError:
+            removed_path = path
+        self._removed_dirs.put(removed_path)
+        # Replaced with a new one, so that the pool keeps its size
+        path = self._create_dir()
+        with self._lock:
+            self._free_dirs.append(path)
+            if self._cleaner is None:
+                self._cleaner = threading.Thread(
+                    target=self._remove_dirs, daemon=True)
+                self._cleaner.start()
+
+    def _remove_dirs(self):
+        while True:
+            path = self._removed_dirs.get()
+            shutil.rmtree(path, ignore_errors=True)
+            self._removed_dirs.task_done()
+
+
+_workspace = None
+_workspace_lock = threading.Lock()
+
+
+# Workspace is created on the first use and removed at exit
+def get_workspace():
+    global _workspace
+    with _workspace_lock:
+        if _workspace is None:
+            _workspace = Workspace()
+            atexit.register(_workspace.close)
+        return _workspace
+
+
+def set_workspace(workspace: Workspace):
+    global _workspace
+    with _workspace_lock:
+        _workspace = workspace
+        atexit.register(_workspace.close)
@@ -0,0 +1,96 @@
+# Copyright (c) 2019-2022 Andrei Ilyin. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#    * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#    * Changes made to the source code must be documented if this code is
+# published in a repository/storage with a public access.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'testerlib'))
+
+from base import Verdict
+from binary_wrapper import BinaryWrapper
+
+TRUE_PATH = shutil.which('true')
+SHELL_PATH = '/bin/sh'
+MEMORY_LIMIT_KB = 256 * 1024
+
+
+@unittest.skipIf(platform.system() != 'Linux' or TRUE_PATH is None,
+                 'Linux with `true` is required')
+class PeakMemoryTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    # The child starts as an image of the tester, which mustn't be taken for
+    # the memory of the binary
+    def test_limit_below_tester_memory(self):
+        import resource
+        ballast = b'x' * (128 * 1024 * 1024)
+        own_maxrss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result = BinaryWrapper(TRUE_PATH, dry_run=False).run(
+            [], memory_limit_kb=own_maxrss_kb // 2, cwd=self.temp_dir)
+        self.assertEqual(result.verdict, Verdict.ACCEPTED)
+        self.assertIsNone(result.peak_memory_kb)
+        del ballast
+
+
+@unittest.skipIf(platform.system() != 'Linux', 'Linux is required')
+class MemoryLimitVerdictTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _run_script(self, script):
+        return BinaryWrapper(SHELL_PATH, dry_run=False).run(
+            ['-c', script], memory_limit_kb=MEMORY_LIMIT_KB,
+            cwd=self.temp_dir)
+
+    def test_failure_without_evidence(self):
+        self.assertEqual(self._run_script('exit 1').verdict, Verdict.FAILED)
+
+    def test_allocation_failure(self):
+        result = self._run_script(
+            'echo "terminate called after throwing an instance of'
+            ' \'std::bad_alloc\'" >&2; exit 134')
+        self.assertEqual(result.verdict, Verdict.MEMORY_LIMIT_EXCEEDED)
+
+    def test_allocation_failure_message_of_accepted_run(self):
+        result = self._run_script('echo "std::bad_alloc" >&2')
+        self.assertEqual(result.verdict, Verdict.ACCEPTED)
+
+
+if __name__ == '__main__':
+    unittest.main()
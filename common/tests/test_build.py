@@ -0,0 +1,269 @@
+# Copyright (c) 2019-2022 Andrei Ilyin. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#    * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#    * Changes made to the source code must be documented if this code is
+# published in a repository/storage with a public access.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import io
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'testerlib'))
+
+import build
+from gtest import GTEST_TESTS_MANIFEST_SUFFIX
+
+
+class TestsManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.binary_path = os.path.join(self.temp_dir, 'tests')
+        self.manifest_path = self.binary_path + GTEST_TESTS_MANIFEST_SUFFIX
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    # Fake tests binary which writes the manifest and then runs `command`
+    def _write_binary(self, command):
+        with open(self.binary_path, 'w') as f:
+            f.write('#!/bin/sh\n'
+                    'echo "{}" > "%s"\n'
+                    '%s\n' % (self.manifest_path, command))
+        os.chmod(self.binary_path, stat.S_IRWXU)
+
+    def test_manifest_is_written(self):
+        self._write_binary('exit 0')
+        build.BuildOrchestrator._write_tests_manifest(self.binary_path)
+        with open(self.manifest_path, 'r') as f:
+            self.assertEqual(json.load(f), {})
+
+    def test_cache_variables_are_removed(self):
+        self._write_binary('test -z "$OBJECT_CACHE_KEY_FILE"')
+        os.environ['OBJECT_CACHE_KEY_FILE'] = self.binary_path
+        try:
+            build.BuildOrchestrator._write_tests_manifest(self.binary_path)
+        finally:
+            del os.environ['OBJECT_CACHE_KEY_FILE']
+        self.assertTrue(os.path.exists(self.manifest_path))
+
+    def test_hanging_listing_is_interrupted(self):
+        self._write_binary('exec sleep 60')
+        timeout_sec = build.TESTS_LISTING_TIMEOUT_SEC
+        build.TESTS_LISTING_TIMEOUT_SEC = 0.5
+        try:
+            build.BuildOrchestrator._write_tests_manifest(self.binary_path)
+        finally:
+            build.TESTS_LISTING_TIMEOUT_SEC = timeout_sec
+        self.assertFalse(os.path.exists(self.manifest_path))
+
+
+class PrintStepTest(unittest.TestCase):
+    def setUp(self):
+        self.orchestrator = build.BuildOrchestrator.__new__(
+            build.BuildOrchestrator)
+        self.orchestrator._strip_paths = []
+        self.orchestrator._hidden_names = []
+
+    @staticmethod
+    def _make_job(returncode, output):
+        job = build._Job([], None)
+        job.returncode = returncode
+        job.output = output
+        return job
+
+    def _print_step(self, jobs, printed_jobs, library_jobs):
+        step = build._Step(build._Step.TESTS, None, jobs, printed_jobs,
+                           library_jobs)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.orchestrator._print_step(step)
+        return output.getvalue().splitlines()
+
+    def test_library_failure_is_reported(self):
+        test_job = self._make_job(0, '')
+        library_job = self._make_job(
+            1, 'gtest-death-test.cc:1:1: error: dangling pointer\n')
+        lines = self._print_step([test_job, library_job], [test_job],
+                                 [library_job])
+        self.assertEqual(lines, [build.LIBRARY_FAILURE_MESSAGE])
+
+    def test_only_test_diagnostics_are_printed(self):
+        test_job = self._make_job(1, 'test.cpp:1:1: error: oops\n')
+        library_job = self._make_job(0, '')
+        lines = self._print_step([test_job, library_job], [test_job],
+                                 [library_job])
+        self.assertEqual(lines, ['test.cpp:1:1: error: oops'])
+
+
+class HiddenNamespaceTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.test_src_dir = os.path.join(self.temp_dir, 'tests_src')
+        self.variant_dir = os.path.join(self.test_src_dir, 'obj_dbg', 'ns_a')
+        os.makedirs(self.variant_dir)
+        for (_, object_name) in build.LIBRARY_OBJECTS:
+            self._write(os.path.join(self.test_src_dir, 'obj_dbg'),
+                        object_name)
+        self._write(self.variant_dir, 'tests.o')
+        self.test_srcs = [self._write(self.test_src_dir, 'tests.cc'),
+                          self._write(self.test_src_dir, 'other.cc')]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @staticmethod
+    def _write(dir_path, name):
+        path = os.path.join(dir_path, name)
+        with open(path, 'w') as f:
+            f.write('')
+        return path
+
+    def _make_orchestrator(self, precompiled_variant=None, hidden_names=()):
+        return build.BuildOrchestrator(
+            ['true'], self.test_src_dir, self.temp_dir, [], self.test_srcs,
+            hidden_names=hidden_names,
+            precompiled_variant=precompiled_variant)
+
+    def _get_compiled_sources(self, orchestrator):
+        steps = orchestrator._prepare_edition(
+            build.Edition('obj_dbg', '', 'tests_dbg'))
+        tests_step = next(step for step in steps
+                          if step.kind == build._Step.TESTS)
+        return [os.path.basename(job.args[job.args.index('-c') + 1])
+                for job in tests_step.jobs]
+
+    # Objects of the chosen variant replace the compilation of their sources
+    def test_variant_objects_are_used(self):
+        orchestrator = self._make_orchestrator(precompiled_variant='ns_a')
+        self.assertEqual(self._get_compiled_sources(orchestrator),
+                         ['other.cc'])
+        self.assertTrue(os.path.exists(
+            os.path.join(self.temp_dir, 'obj_dbg', 'tests.o')))
+
+    def test_other_variant_is_compiled(self):
+        orchestrator = self._make_orchestrator(precompiled_variant='ns_b')
+        self.assertEqual(self._get_compiled_sources(orchestrator),
+                         ['tests.cc', 'other.cc'])
+
+    # All the variants are hidden, not only the chosen one
+    def test_variants_are_hidden(self):
+        orchestrator = self._make_orchestrator(
+            hidden_names=['hidden_ns', 'variant_a', 'variant_b', ''])
+        self.assertEqual(
+            orchestrator._sanitize(
+                "tests.cc:1:1: error: 'variant_b::x' and 'variant_a::x'\n"
+                "other.cc:2:1: error: 'hidden_ns::y'\n"),
+            ["tests.cc:1:1: error: 'HIDDEN::x' and 'HIDDEN::x'",
+             "other.cc:2:1: error: 'HIDDEN::y'"])
+
+
+class PrecompiledHeaderTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.precompiled_dir = os.path.join(self.temp_dir, 'obj_dbg')
+        os.makedirs(os.path.join(self.temp_dir, 'utils'))
+        os.makedirs(self.precompiled_dir)
+        self._write(build.PCH_HEADER,
+                    '// Headers of the tests\n'
+                    '#include <gtest/gtest.h>\n'
+                    '#include "utils/utils.h"\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _write(self, name, text):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def _make_orchestrator(self, cxx='true'):
+        return build.BuildOrchestrator(
+            [cxx], self.temp_dir, self.temp_dir, [], [])
+
+    def test_leading_includes(self):
+        path = self._write('a.cc', '/* License\n */\n'
+                                   '\n'
+                                   '#include <gtest/gtest.h>  // Tests\n'
+                                   '  # include "a.h"\n'
+                                   '#define X\n'
+                                   '#include "b.h"\n')
+        self.assertEqual(build._get_leading_includes(path),
+                         ['<gtest/gtest.h>', '"a.h"'])
+        self.assertEqual(build._get_leading_includes(path, 1),
+                         ['<gtest/gtest.h>'])
+        self.assertEqual(build._get_leading_includes(path + '.missing'), [])
+
+    # Macros defined before the headers would be ignored with the PCH
+    def test_sources_starting_with_headers(self):
+        orchestrator = self._make_orchestrator()
+        for (text, expected) in (
+                ('#include <gtest/gtest.h>\n#include "utils/utils.h"\n'
+                 '#include <vector>\n', True),
+                ('#define SKIP\n#include <gtest/gtest.h>\n'
+                 '#include "utils/utils.h"\n', False),
+                ('#include <gtest/gtest.h>\n', False),
+                ('#include "utils/utils.h"\n#include <gtest/gtest.h>\n',
+                 False)):
+            with self.subTest(text=text):
+                self.assertEqual(orchestrator._can_use_pch(
+                    self._write('a.cc', text)), expected)
+
+    def _write_pch(self, version):
+        pch_path = os.path.join(self.precompiled_dir, build.PCH_NAME)
+        with open(pch_path, 'w') as f:
+            f.write('')
+        with open(pch_path + build.PCH_VERSION_SUFFIX, 'w') as f:
+            f.write(version)
+        return pch_path
+
+    def test_pch_is_used(self):
+        orchestrator = self._make_orchestrator()
+        pch_path = self._write_pch(orchestrator._compiler_version)
+        self.assertEqual(
+            orchestrator._get_pch_args(['true'], self.precompiled_dir),
+            ['-include-pch', pch_path])
+
+    def test_pch_of_other_compiler(self):
+        orchestrator = self._make_orchestrator()
+        self._write_pch(orchestrator._compiler_version + 'other')
+        self.assertEqual(
+            orchestrator._get_pch_args(['true'], self.precompiled_dir), [])
+
+    def test_rejected_pch(self):
+        orchestrator = self._make_orchestrator('false')
+        self._write_pch(orchestrator._compiler_version)
+        self.assertEqual(
+            orchestrator._get_pch_args(['false'], self.precompiled_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
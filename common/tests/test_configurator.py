@@ -0,0 +1,82 @@
+# Copyright (c) 2019-2022 Andrei Ilyin. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#    * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#    * Changes made to the source code must be documented if this code is
+# published in a repository/storage with a public access.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'testerlib'))
+
+from configurator import Configurator, _literal_prefix
+from fake_test import FakeTestRunner
+
+TEST_NAMES = [
+    ('Foo', 'Bar'), ('Foo', 'Baz'), ('FooBar', 'Test'), ('Fo', 'Test'),
+    ('Typed/0', 'Test'), ('Typed/1', 'Test'), ('Param', 'Test/0'),
+    ('Param', 'Test/1'), ('A.B', 'C'), ('a', 'Test'), ('F|o', 'Test'),
+]
+
+REGEXES = [
+    '', 'Foo', 'Foo\\.', 'Foo\\.Ba', 'Foo.*', 'FooB', 'Fo.', 'Foo?',
+    'Fo{2}', 'F(oo|o)\\.', 'Foo|Param', '.*Test', 'Typed/', 'Typed/[01]',
+    'Param\\.Test/1', 'A.B', 'A\\.B\\.C', '[Ff]oo', '(?i)foo', '\\w+\\.C',
+    'F\\|o', 'F[|]o', '[]|]', 'Missing',
+]
+
+
+class LiteralPrefixTest(unittest.TestCase):
+    def test_prefixes(self):
+        self.assertEqual(_literal_prefix('Foo\\.Bar'), 'Foo.Bar')
+        self.assertEqual(_literal_prefix('Foo.*'), 'Foo')
+        self.assertEqual(_literal_prefix('Foo?'), 'Fo')
+        self.assertEqual(_literal_prefix('Fo{2}'), 'F')
+        self.assertEqual(_literal_prefix('Foo|Bar'), '')
+        self.assertEqual(_literal_prefix('F(oo|o)'), 'F')
+        self.assertEqual(_literal_prefix('[|]Foo'), '')
+        self.assertEqual(_literal_prefix('\\w'), '')
+
+
+# Indexed matching must find the same tests as the scan of all of them
+class MatchTest(unittest.TestCase):
+    def test_index_matches_scan(self):
+        configurator = Configurator()
+        configurator.load_runner(FakeTestRunner(TEST_NAMES))
+        full_names = [suit_name + '.' + test_name
+                      for (suit_name, test_name) in TEST_NAMES]
+        for regex in REGEXES:
+            with self.subTest(regex=regex):
+                self.assertEqual(
+                    [test.description.full_name()
+                     for test in configurator.find_tests(regex)],
+                    [full_name for full_name in full_names
+                     if re.match(regex, full_name)])
+
+
+if __name__ == '__main__':
+    unittest.main()
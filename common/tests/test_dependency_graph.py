@@ -0,0 +1,93 @@
+# Copyright (c) 2019-2022 Andrei Ilyin. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#    * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#    * Changes made to the source code must be documented if this code is
+# published in a repository/storage with a public access.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'testerlib'))
+
+import base
+from dependency_graph import DependencyGraph
+
+
+def _make_graph(names, dependencies):
+    tests = dict((name, base.Test(base.TestDescription('Suit', name), None))
+                 for name in names)
+    graph = DependencyGraph(tests[name] for name in names)
+    for (name, dependent_name) in dependencies:
+        graph.add_dependency(tests[name], tests[dependent_name])
+    return (graph, tests)
+
+
+def _names(tests):
+    return [test.description.test_name for test in tests]
+
+
+class DependencyGraphTest(unittest.TestCase):
+    # Independent tests keep the order they are defined in
+    def test_topological_order(self):
+        (graph, _) = _make_graph(['A', 'B', 'C', 'D'],
+                                 [('C', 'A'), ('D', 'B')])
+        self.assertEqual(_names(graph.topological_order()),
+                         ['C', 'A', 'D', 'B'])
+
+    def test_duplicate_dependencies(self):
+        (graph, tests) = _make_graph(['A', 'B'], [('A', 'B'), ('A', 'B')])
+        self.assertEqual(_names(graph.prerequisites(tests['B'])), ['A'])
+        self.assertEqual(_names(graph.dependents(tests['A'])), ['B'])
+
+    def test_cycle(self):
+        (graph, _) = _make_graph(['A', 'B', 'C'],
+                                 [('A', 'B'), ('B', 'C'), ('C', 'B')])
+        with self.assertRaisesRegex(base.ConfigurationError,
+                                    'Suit.B, Suit.C'):
+            graph.topological_order()
+
+    def test_all_dependents(self):
+        (graph, tests) = _make_graph(
+            ['A', 'B', 'C', 'D', 'E'],
+            [('A', 'C'), ('C', 'B'), ('A', 'D'), ('D', 'B')])
+        visited = set()
+        self.assertEqual(_names(graph.all_dependents(tests['A'], visited)),
+                         ['B', 'C', 'D'])
+        # Visited tests aren't returned again
+        self.assertEqual(_names(graph.all_dependents(tests['C'], visited)),
+                         [])
+
+    def test_subgraph(self):
+        (graph, tests) = _make_graph(['A', 'B', 'C'],
+                                     [('A', 'B'), ('B', 'C')])
+        subgraph = graph.subgraph([tests['B'], tests['C']])
+        self.assertEqual(_names(subgraph.tests()), ['B', 'C'])
+        self.assertEqual(_names(subgraph.prerequisites(tests['B'])), [])
+        self.assertEqual(_names(subgraph.prerequisites(tests['C'])), ['B'])
+
+
+if __name__ == '__main__':
+    unittest.main()
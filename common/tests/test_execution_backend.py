@@ -0,0 +1,97 @@
+# Copyright (c) 2019-2022 Andrei Ilyin. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#    * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#    * Changes made to the source code must be documented if this code is
+# published in a repository/storage with a public access.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import platform
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'testerlib'))
+
+from execution_backend import CgroupBackend, ProcessLimits, \
+    RlimitBackend, create_execution_backend
+
+# Delegated cgroup v2 directory for the tests of the cgroup backend, which
+# creates the cgroups there and may enable the controllers for them
+CGROUP_ROOT_VARIABLE = 'TESTER_CGROUP_ROOT'
+
+
+# Cgroup from the environment if cgroups v2 with the required controllers
+# are delegated to it, None otherwise
+def _get_delegated_cgroup():
+    path = os.environ.get(CGROUP_ROOT_VARIABLE)
+    if platform.system() != 'Linux' or not path:
+        return None
+    try:
+        with open(os.path.join(path, 'cgroup.controllers'), 'r') as f:
+            controllers = f.read().split()
+    except OSError:
+        return None
+    if any(controller not in controllers
+           for controller in CgroupBackend.REQUIRED_CONTROLLERS):
+        return None
+    if not os.access(path, os.W_OK):
+        return None
+    return path
+
+
+class CgroupBackendTest(unittest.TestCase):
+    @unittest.skipIf(_get_delegated_cgroup() is None,
+                     '%s doesn\'t point at a delegated cgroup v2'
+                     % CGROUP_ROOT_VARIABLE)
+    def test_auto_mode_uses_cgroups(self):
+        backend = create_execution_backend('auto', _get_delegated_cgroup())
+        self.assertIsInstance(backend, CgroupBackend)
+        sandbox = backend.create_sandbox(ProcessLimits(memory_kb=65536))
+        sandbox.close()
+
+    # Cgroup of the tester is left alone unless cgroups are requested
+    def test_auto_mode_requires_root(self):
+        self.assertIsInstance(create_execution_backend('auto'),
+                              RlimitBackend)
+        self.assertIsInstance(create_execution_backend(), RlimitBackend)
+
+    @unittest.skipIf(platform.system() != 'Linux', 'Linux only')
+    def test_processes_are_moved_to_leaf(self):
+        with tempfile.TemporaryDirectory() as root:
+            with open(os.path.join(root, 'cgroup.procs'), 'w') as f:
+                f.write('%d\n' % os.getpid())
+            with open(os.path.join(root, 'cgroup.subtree_control'), 'w'):
+                pass
+
+            self.assertEqual(CgroupBackend.find_root(root, cpu_cores=1), root)
+            leaf_path = os.path.join(
+                root, CgroupBackend.LEAF_CGROUP_NAME, 'cgroup.procs')
+            with open(leaf_path, 'r') as f:
+                self.assertEqual(f.read(), str(os.getpid()))
+            with open(os.path.join(root, 'cgroup.subtree_control')) as f:
+                self.assertEqual(f.read(), '+memory +pids +cpu')
+
+
+if __name__ == '__main__':
+    unittest.main()
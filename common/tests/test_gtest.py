@@ -0,0 +1,260 @@
+# Copyright (c) 2019-2022 Andrei Ilyin. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#    * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#    * Changes made to the source code must be documented if this code is
+# published in a repository/storage with a public access.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'testerlib'))
+
+import base
+from gtest import _get_test_output, _list_tests, prepare_google_test_runner
+
+COMMON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+CXX = os.environ.get('CXX') or shutil.which('clang++') or shutil.which('g++')
+CXX_FLAGS = ['-std=c++20', '-pthread', '-I' + COMMON_DIR]
+# Flags of the test sources compilation in build.sh
+TESTS_CXX_FLAGS = ['-Wall', '-Wextra', '-Wno-sign-compare', '-Wno-attributes',
+                   '-Werror']
+
+TESTS_SOURCE = '''
+#include "utils/utils.h"
+
+SAFE_TEST(Suit, Regular) {
+  ASSERT_EQ(1, 1);
+}
+
+SPEED_TEST(Suit, Speed) {
+  ASSERT_EQ(1, 1);
+}
+'''
+
+BATCH_TESTS_SOURCE = '''
+#include <cstdlib>
+
+#include "utils/utils.h"
+
+SAFE_TEST(Batch, First) {
+  ASSERT_EQ(1, 1);
+}
+
+SAFE_TEST(Batch, Crash) {
+  std::abort();
+}
+
+SAFE_TEST(Batch, Failed) {
+  ASSERT_EQ(1, 2);
+}
+
+SAFE_TEST(Batch, Last) {
+  ASSERT_EQ(1, 1);
+}
+'''
+
+_temp_dir = None
+_library_objects = []
+
+
+def _compile(src, flags=()):
+    obj = os.path.join(_temp_dir, os.path.basename(src) + '.o')
+    subprocess.check_call(
+        [CXX] + CXX_FLAGS + list(flags) + ['-c', src, '-o', obj])
+    return obj
+
+
+# Builds the edition of the tests binary from the source text
+def _link(binary_path, source, edition, flags):
+    tests_src = binary_path + '.cc'
+    with open(tests_src, 'w') as f:
+        f.write(source)
+    obj = _compile(tests_src, flags)
+    os.rename(obj, obj + edition)
+    subprocess.check_call([CXX, '-pthread', obj + edition] +
+                          _library_objects + ['-o', binary_path + edition])
+
+
+# Libraries are compiled once for all the tests binaries
+def setUpModule():
+    global _temp_dir
+    if CXX is None:
+        return
+    _temp_dir = tempfile.mkdtemp()
+    for src in ('gtest/gtest-all.cc', 'gtest/gtest_main.cc',
+                'utils/utils.cc'):
+        _library_objects.append(_compile(os.path.join(COMMON_DIR, src)))
+
+
+def tearDownModule():
+    if _temp_dir is not None:
+        shutil.rmtree(_temp_dir)
+
+
+@unittest.skipIf(CXX is None, 'C++ compiler is not available')
+class SpeedTestsEditionsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.binary_path = os.path.join(_temp_dir, 'tests')
+        _link(cls.binary_path, TESTS_SOURCE, '_dbg',
+              TESTS_CXX_FLAGS + ['-DSKIP_SPEED_TESTS'])
+        _link(cls.binary_path, TESTS_SOURCE, '_opt', TESTS_CXX_FLAGS)
+
+    def test_speed_tests_are_not_registered_in_dbg(self):
+        self.assertEqual(_list_tests(self.binary_path + '_dbg'),
+                         [('Suit', 'Regular')])
+        self.assertEqual(_list_tests(self.binary_path + '_opt'),
+                         [('Suit', 'Regular'), ('Suit', 'Speed')])
+
+    def test_speed_tests_run_only_on_opt(self):
+        runner = prepare_google_test_runner(
+            self.binary_path, dry_run=True, editions=['_dbg', '_opt'])
+        regular = base.TestDescription('Suit', 'Regular')
+        speed = base.TestDescription('Suit', 'Speed')
+        self.assertEqual(runner.describe(regular),
+                         ['Editions: tests_dbg, tests_opt', 'Repeats: 3'])
+        self.assertEqual(runner.describe(speed),
+                         ['Editions: tests_opt', 'Repeats: 3'])
+
+
+@unittest.skipIf(CXX is None, 'C++ compiler is not available')
+class BatchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.binary_path = os.path.join(_temp_dir, 'batch_tests')
+        _link(cls.binary_path, BATCH_TESTS_SOURCE, '', TESTS_CXX_FLAGS)
+
+    def setUp(self):
+        self.runner = prepare_google_test_runner(
+            self.binary_path, dry_run=False, runs_count=1, batch_size=4)
+        self.descriptions = [
+            base.TestDescription('Batch', name, max_score=1,
+                                 resource_limits=base.ResourceLimits(10, None))
+            for name in ('First', 'Crash', 'Failed', 'Last')]
+
+    def test_tests_are_batched(self):
+        self.runner.prepare(self.descriptions)
+        self.assertEqual(
+            [self.runner.get_batch(description)
+             for description in self.descriptions], [0, 0, 0, 0])
+
+    # With sharding and no batching the whole suit is a batch
+    def test_shards_take_whole_suit(self):
+        runner = prepare_google_test_runner(
+            self.binary_path, dry_run=False, runs_count=1, shards_count=2)
+        runner.prepare(self.descriptions)
+        self.assertEqual(
+            [runner.get_batch(description)
+             for description in self.descriptions], [0, 0, 0, 0])
+
+    # The shard with the crash has no report, so only its tests are rerun
+    def test_crash_in_shard(self):
+        runner = prepare_google_test_runner(
+            self.binary_path, dry_run=False, runs_count=1, batch_size=2,
+            shards_count=2)
+        runner.prepare(self.descriptions)
+        results = runner.run_batch(self.descriptions)
+        self.assertEqual(
+            [result.verdict for result in results],
+            [base.Verdict.ACCEPTED, base.Verdict.FAILED,
+             base.Verdict.FAILED, base.Verdict.ACCEPTED])
+
+    def test_output_is_split_between_tests(self):
+        runner = prepare_google_test_runner(
+            self.binary_path, dry_run=False, runs_count=1, batch_size=4,
+            output_tail_kb=16)
+        descriptions = [self.descriptions[0]] + self.descriptions[2:]
+        runner.prepare(descriptions)
+        results = runner.run_batch(descriptions)
+        self.assertEqual(
+            [result.verdict for result in results],
+            [base.Verdict.ACCEPTED, base.Verdict.FAILED,
+             base.Verdict.ACCEPTED])
+        output = results[1].stdout_tail
+        self.assertTrue(output.startswith('[ RUN      ] Batch.Failed'))
+        self.assertIn('[  FAILED  ] Batch.Failed', output)
+        self.assertNotIn('Batch.First', output)
+        self.assertNotIn('Batch.Last', output)
+
+    def test_cpu_time_limited_tests_are_not_batched(self):
+        for description in self.descriptions:
+            description.resource_limits.time_limit_mode = \
+                base.TimeLimitMode.CPU
+        self.runner.prepare(self.descriptions)
+        self.assertEqual(
+            [self.runner.get_batch(description)
+             for description in self.descriptions], [None] * 4)
+
+    # The crash leaves no report, so the batch is split until the crashing
+    # test runs alone, and the other tests keep their own verdicts
+    def test_crash_is_bisected(self):
+        self.runner.prepare(self.descriptions)
+        results = self.runner.run_batch(self.descriptions)
+        self.assertEqual(
+            [result.verdict for result in results],
+            [base.Verdict.ACCEPTED, base.Verdict.FAILED,
+             base.Verdict.FAILED, base.Verdict.ACCEPTED])
+        self.assertEqual([result.score for result in results], [1, 0, 0, 1])
+
+
+class TestOutputTest(unittest.TestCase):
+    OUTPUT = ('Running main() from gtest_main.cc\n'
+              '[ RUN      ] Suit.A\n'
+              'a.cc:1: Failure\n'
+              '[  FAILED  ] Suit.A (0 ms)\n'
+              '[ RUN      ] Suit.B\n'
+              '[       OK ] Suit.B (0 ms)\n'
+              '[ RUN      ] Suit.A\n'
+              'a.cc:2: Failure\n'
+              '[  FAILED  ] Suit.A (1 ms)\n'
+              '[  FAILED  ] 1 test, listed below:\n'
+              '[  FAILED  ] Suit.A\n')
+
+    def test_iterations_of_test(self):
+        self.assertEqual(_get_test_output(self.OUTPUT, 'Suit.A'),
+                         '[ RUN      ] Suit.A\n'
+                         'a.cc:1: Failure\n'
+                         '[  FAILED  ] Suit.A (0 ms)\n'
+                         '[ RUN      ] Suit.A\n'
+                         'a.cc:2: Failure\n'
+                         '[  FAILED  ] Suit.A (1 ms)\n')
+
+    def test_test_out_of_tail(self):
+        self.assertEqual(_get_test_output(self.OUTPUT, 'Suit.C'), None)
+
+    # The tail may start in the middle of the test
+    def test_truncated_test(self):
+        output = self.OUTPUT[self.OUTPUT.index('a.cc:1'):]
+        self.assertEqual(_get_test_output(output, 'Suit.B'),
+                         '[ RUN      ] Suit.B\n'
+                         '[       OK ] Suit.B (0 ms)\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
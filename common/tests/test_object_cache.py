@@ -0,0 +1,81 @@
+# Copyright (c) 2019-2022 Andrei Ilyin. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#    * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#    * Changes made to the source code must be documented if this code is
+# published in a repository/storage with a public access.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'testerlib'))
+
+from object_cache import ObjectCache
+
+MAX_SIZE_BYTES = 1024 * 1024
+
+
+class ObjectCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+        self.object_path = os.path.join(self.temp_dir, 'file.o')
+        with open(self.object_path, 'wb') as f:
+            f.write(b'object')
+        self.key = ObjectCache.key(['g++', '-O2', 'int main() {}'])
+        cache = ObjectCache(self.cache_dir, MAX_SIZE_BYTES, b'secret')
+        cache.put(self.key, self.object_path, 'warning: unused')
+        os.remove(self.object_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _get(self, secret_key):
+        cache = ObjectCache(self.cache_dir, MAX_SIZE_BYTES, secret_key)
+        return cache.get(self.key, self.object_path)
+
+    def test_signed_entry_is_used(self):
+        self.assertEqual(self._get(b'secret'), 'warning: unused')
+        with open(self.object_path, 'rb') as f:
+            self.assertEqual(f.read(), b'object')
+
+    def test_modified_entry_is_dropped(self):
+        entry_path = os.path.join(
+            self.cache_dir, self.key[:2], self.key + '.o')
+        with open(entry_path, 'wb') as f:
+            f.write(b'planted')
+        self.assertIsNone(self._get(b'secret'))
+        self.assertFalse(os.path.exists(self.object_path))
+        self.assertFalse(os.path.exists(entry_path))
+
+    def test_entry_signed_with_another_key_is_dropped(self):
+        self.assertIsNone(self._get(b'another secret'))
+        self.assertIsNone(self._get(b'secret'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+# Copyright (c) 2019-2022 Andrei Ilyin. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#    * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#    * Changes made to the source code must be documented if this code is
+# published in a repository/storage with a public access.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import platform
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'testerlib'))
+
+from process_reaper import OutputCapture, ProcessReaper
+
+
+class OutputCaptureTest(unittest.TestCase):
+    def setUp(self):
+        self.lines = []
+        self.capture = OutputCapture(8, line_handler=self.lines.append)
+
+    def tearDown(self):
+        self.capture.close()
+
+    def _write(self, data):
+        os.write(self.capture.write_fd, data)
+
+    def test_tail_is_kept(self):
+        self._write(b'first\nsecond\nthird')
+        self.assertTrue(self.capture.drain())
+        self.capture.close_write_end()
+        self.assertFalse(self.capture.drain())
+        self.assertEqual(self.capture.getvalue(), b'nd\nthird')
+        self.assertEqual(self.capture.total_size, 18)
+        # The last line is handled once the pipe is closed
+        self.assertEqual(self.lines, [b'first', b'second', b'third'])
+
+    def test_lines_across_reads(self):
+        self._write(b'fir')
+        self.capture.drain()
+        self._write(b'st\nsec')
+        self.capture.drain()
+        self.assertEqual(self.lines, [b'first'])
+        self.capture.close()
+        self.assertEqual(self.lines, [b'first', b'sec'])
+
+    def test_long_line_is_truncated(self):
+        self._write(b'x' * (OutputCapture.MAX_LINE_SIZE + 10) + b'\n')
+        self.capture.drain()
+        self.assertEqual(self.lines, [b'x' * OutputCapture.MAX_LINE_SIZE])
+
+
+@unittest.skipIf(platform.system() == 'Windows', '`sh` is required')
+class ReaperCaptureTest(unittest.TestCase):
+    # Output much larger than the pipe buffer is drained while the process
+    # is running, so the process doesn't block on the write
+    def test_large_output(self):
+        capture = OutputCapture(16)
+        try:
+            (killed, returncode, _) = ProcessReaper.instance().run(
+                ['sh', '-c', 'head -c 1000000 /dev/zero; echo done'],
+                timeout=30, stdout=capture.write_fd, captures=[capture])
+            self.assertFalse(killed)
+            self.assertEqual(returncode, 0)
+            self.assertEqual(capture.total_size, 1000005)
+            self.assertEqual(capture.getvalue(), b'\0' * 11 + b'done\n')
+        finally:
+            capture.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
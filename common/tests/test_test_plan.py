@@ -0,0 +1,147 @@
+# Copyright (c) 2019-2022 Andrei Ilyin. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#    * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#    * Changes made to the source code must be documented if this code is
+# published in a repository/storage with a public access.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'testerlib'))
+
+import base
+import test_plan
+
+CONFIG = {
+    'overall_tl_sec': 100,
+    'default_time_limit_sec': 2,
+    'runners': [
+        {'type': 'fake', 'tests': [['Samples', 'A'], ['Foo', 'Small'],
+                                   ['Foo', 'Big'], ['Old', 'Test']]},
+        {'type': 'fake', 'tests': [['Bonus', 'Test']]},
+    ],
+    'skip': ['Old\\..*'],
+    'public': ['Samples\\..*'],
+    'private': [{'filter': 'Foo\\..*', 'score': 4},
+                {'filter': 'Bonus\\..*', 'score': 6}],
+    'normalize_scores': 20,
+    'time_limits': [{'filter': 'Foo\\.Big', 'time_sec': 30}],
+    'memory_limits': [{'filter': 'Foo\\..*', 'memory_kb': 65536}],
+    'time_limit_modes': [{'filter': 'Foo\\.Big', 'mode': 'CPU'}],
+    'dependencies': [{'target': 'Bonus\\..*', 'required': 'Foo\\..*'}],
+    'standalone': ['Bonus\\..*'],
+}
+
+
+class CheckConfigTest(unittest.TestCase):
+    def test_valid_config(self):
+        test_plan.check_config(CONFIG)
+
+    def test_invalid_configs(self):
+        runners = CONFIG['runners']
+        for config in ({'runners': runners, 'unknown': []},
+                       {'runners': []},
+                       {'runners': [{'type': 'unknown'}]},
+                       {'runners': [{'type': 'fake', 'binary': 'tests'}]},
+                       {'runners': runners, 'public': ['Foo(']},
+                       {'runners': runners, 'private': [{'filter': 'Foo'}]},
+                       {'runners': runners,
+                        'time_limit_modes': [{'filter': 'Foo',
+                                              'mode': 'USER'}]}):
+            with self.subTest(config=config):
+                with self.assertRaises(base.ConfigurationError):
+                    test_plan.check_config(config)
+
+
+class CompileTestPlanTest(unittest.TestCase):
+    def setUp(self):
+        self.build_dir = tempfile.mkdtemp()
+        self.plan = test_plan.compile_test_plan(CONFIG, self.build_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.build_dir)
+
+    def _entry(self, name):
+        return next(entry for entry in self.plan['tests']
+                    if entry['name'] == name)
+
+    def test_tests_are_resolved(self):
+        self.assertEqual(self._entry('Foo.Big'), {
+            'name': 'Foo.Big',
+            'runner': 0,
+            'type': 'PRIVATE',
+            'max_score': 4.0,
+            'time_limit_sec': 30,
+            'memory_limit_kb': 65536,
+            'time_limit_mode': 'CPU',
+            'dependents': ['Bonus.Test'],
+            'standalone': False,
+            'heavy': False,
+        })
+        self.assertEqual(self._entry('Samples.A')['type'], 'PUBLIC')
+        self.assertEqual(self._entry('Old.Test')['type'], 'IGNORED')
+        self.assertEqual(self._entry('Bonus.Test')['runner'], 1)
+        self.assertEqual(self._entry('Bonus.Test')['max_score'], 12.0)
+        self.assertTrue(self._entry('Bonus.Test')['standalone'])
+
+    def test_configuration_error_fails(self):
+        config = dict(CONFIG, public=['Missing\\..*'])
+        with self.assertRaisesRegex(base.ConfigurationError, 'Missing'):
+            test_plan.compile_test_plan(config, self.build_dir)
+
+    def test_cycle_fails(self):
+        config = dict(CONFIG, dependencies=[
+            {'target': 'Bonus\\..*', 'required': 'Foo\\..*'},
+            {'target': 'Foo\\.Big', 'required': 'Bonus\\..*'}])
+        with self.assertRaises(base.ConfigurationError):
+            test_plan.compile_test_plan(config, self.build_dir)
+
+    # Loaded plan configures the tests exactly as the config does
+    def test_plan_is_loaded(self):
+        plan_path = os.path.join(self.build_dir, test_plan.TEST_PLAN_FILENAME)
+        with open(plan_path, 'w') as f:
+            json.dump(self.plan, f)
+        configurator = test_plan.load_test_plan(
+            plan_path, self.build_dir, dry_run=True)
+        self.assertEqual(
+            configurator.export_plan(),
+            [dict((key, value) for (key, value) in entry.items()
+                  if key != 'heavy')
+             for entry in self.plan['tests']])
+
+    def test_unsupported_version(self):
+        plan_path = os.path.join(self.build_dir, test_plan.TEST_PLAN_FILENAME)
+        with open(plan_path, 'w') as f:
+            json.dump(dict(self.plan, version=0), f)
+        with self.assertRaises(base.ConfigurationError):
+            test_plan.load_test_plan(plan_path, self.build_dir, dry_run=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,223 @@
+# Copyright (c) 2019-2022 Andrei Ilyin. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#    * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#    * Changes made to the source code must be documented if this code is
+# published in a repository/storage with a public access.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import platform
+import sys
+import threading
+import unittest
+
+from timeit import default_timer as timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'testerlib'))
+
+import base
+from dependency_graph import DependencyGraph
+from interface import TestingSystemInterface
+from process_reaper import ProcessReaper
+import tester
+
+
+# Runs `sleep` for the configured time of each test
+class _SleepRunner(base.TestRunner):
+    def __init__(self, sleep_sec, failed_tests=()):
+        self._sleep_sec = sleep_sec
+        self._failed_tests = set(failed_tests)
+        self._lock = threading.Lock()
+        self.started_tests = []
+
+    def run(self, description):
+        with self._lock:
+            self.started_tests.append(description.test_name)
+        start_time = timer()
+        ProcessReaper.instance().run(['sleep', str(self._sleep_sec)])
+        verdict = base.Verdict.ACCEPTED
+        if description.test_name in self._failed_tests:
+            verdict = base.Verdict.FAILED
+        return base.TestResult(verdict, description.max_score,
+                               timer() - start_time)
+
+
+# Runs the tests with the given names as one batch, records the tests
+# started by each call
+class _BatchRunner(_SleepRunner):
+    def __init__(self, batch_tests, failed_tests=()):
+        super().__init__(0, failed_tests)
+        self._batch_tests = set(batch_tests)
+        self.units = []
+
+    def get_batch(self, description):
+        if description.test_name in self._batch_tests:
+            return 'batch'
+        return None
+
+    def run(self, description):
+        self.units.append([description.test_name])
+        return super().run(description)
+
+    def run_batch(self, descriptions):
+        self.units.append(
+            [description.test_name for description in descriptions])
+        return [super(_BatchRunner, self).run(description)
+                for description in descriptions]
+
+
+class _ReportInterface(TestingSystemInterface):
+    def __init__(self):
+        self.report = None
+
+    def get_test_mode(self):
+        return self.ALL_TESTS_RUN
+
+    def write_report(self, report, print_stderr_report):
+        self.report = report
+
+
+def _make_tests(names, runner):
+    return dict((name, base.Test(
+        base.TestDescription('Suit', name, max_score=1,
+                             resource_limits=base.ResourceLimits(60, None),
+                             exclude_from_aggregation=True),
+        runner)) for name in names)
+
+
+def _run(instance):
+    interface = _ReportInterface()
+    instance.run(interface, print_report_to_stderr=False)
+    return interface.report
+
+
+# Runs the tests with the given dependencies, returns {name: Test}
+def _run_graph(runner, names, dependencies=(), jobs=1):
+    tests = _make_tests(names, runner)
+    graph = DependencyGraph(tests.values())
+    for (name, dependent_name) in dependencies:
+        graph.add_dependency(tests[name], tests[dependent_name])
+    instance = tester.Tester(60, False, jobs=jobs, dependency_graph=graph)
+    for name in names:
+        instance.add_public_test(tests[name])
+    _run(instance)
+    return tests
+
+
+@unittest.skipIf(platform.system() == 'Windows', '`sleep` is required')
+class ConcurrentTestsTest(unittest.TestCase):
+    def _make_tester(self, overall_tl_sec, jobs, tests):
+        instance = tester.Tester(overall_tl_sec, False, jobs=jobs)
+        for test in tests.values():
+            instance.add_public_test(test)
+        return instance
+
+    # Concurrent tests take their total time only once
+    def test_overall_limit_counts_wall_time(self):
+        runner = _SleepRunner(0.3)
+        tests = _make_tests(['A', 'B', 'C', 'D'], runner)
+        report = _run(self._make_tester(1, 4, tests))
+        self.assertEqual(report.general_comment, None)
+        self.assertEqual(report.passed_tests_count, 4)
+
+    def test_running_tests_are_interrupted(self):
+        runner = _SleepRunner(30)
+        tests = _make_tests(['A', 'B', 'C'], runner)
+        start_time = timer()
+        report = _run(self._make_tester(0.5, 2, tests))
+        self.assertLess(timer() - start_time, 5)
+        self.assertEqual(report.result.verdict,
+                         base.Verdict.TIME_LIMIT_EXCEEDED)
+        self.assertEqual(sorted(runner.started_tests), ['A', 'B'])
+
+
+@unittest.skipIf(platform.system() == 'Windows', '`sleep` is required')
+class DependenciesTest(unittest.TestCase):
+    def test_failure_skips_dependents(self):
+        runner = _SleepRunner(0, failed_tests=['A'])
+        tests = _run_graph(runner, ['A', 'B', 'C', 'D'],
+                           dependencies=[('A', 'B'), ('B', 'C')])
+        self.assertEqual(runner.started_tests, ['A', 'D'])
+        self.assertEqual(
+            [tests[name].result.verdict for name in ('A', 'B', 'C', 'D')],
+            [base.Verdict.FAILED, base.Verdict.DEPENDENCY_FAILED,
+             base.Verdict.DEPENDENCY_FAILED, base.Verdict.ACCEPTED])
+
+    # Tests are started in the topological order, the independent ones in
+    # the order they are defined in
+    def test_dependent_starts_after_prerequisite(self):
+        runner = _SleepRunner(0)
+        _run_graph(runner, ['A', 'B', 'C'], dependencies=[('C', 'A')])
+        self.assertEqual(runner.started_tests, ['B', 'C', 'A'])
+
+    def test_concurrent_tests_wait_for_prerequisites(self):
+        runner = _SleepRunner(0.2)
+        _run_graph(runner, ['A', 'B', 'C'], dependencies=[('A', 'B')],
+                   jobs=2)
+        self.assertEqual(sorted(runner.started_tests[:2]), ['A', 'C'])
+        self.assertEqual(runner.started_tests[2], 'B')
+
+    def test_cycle_fails_check(self):
+        runner = _SleepRunner(0)
+        tests = _make_tests(['A', 'B'], runner)
+        graph = DependencyGraph(tests.values())
+        graph.add_dependency(tests['A'], tests['B'])
+        graph.add_dependency(tests['B'], tests['A'])
+        instance = tester.Tester(60, False, dependency_graph=graph)
+        for test in tests.values():
+            instance.add_public_test(test)
+        report = _run(instance)
+        self.assertEqual(report.result.verdict, base.Verdict.CHECK_FAILED)
+        self.assertEqual(runner.started_tests, [])
+
+
+@unittest.skipIf(platform.system() == 'Windows', '`sleep` is required')
+class BatchesTest(unittest.TestCase):
+
+    def test_batch_is_run_once(self):
+        runner = _BatchRunner(['A', 'B', 'C'])
+        tests = _run_graph(runner, ['A', 'B', 'C', 'D'], jobs=2)
+        self.assertEqual(sorted(runner.units), [['A', 'B', 'C'], ['D']])
+        for test in tests.values():
+            self.assertEqual(test.result.verdict, base.Verdict.ACCEPTED)
+
+    def test_failed_prerequisite_excludes_test(self):
+        runner = _BatchRunner(['A', 'B', 'C'], failed_tests=['P'])
+        tests = _run_graph(runner, ['P', 'A', 'B', 'C'],
+                           dependencies=[('P', 'B')])
+        self.assertEqual(runner.units, [['P'], ['A', 'C']])
+        self.assertEqual(tests['B'].result.verdict,
+                         base.Verdict.DEPENDENCY_FAILED)
+
+    # Test of the batch which depends on another one is started later
+    def test_dependency_inside_batch(self):
+        runner = _BatchRunner(['A', 'B', 'C'])
+        tests = _run_graph(runner, ['A', 'B', 'C'],
+                           dependencies=[('A', 'B')])
+        self.assertEqual(runner.units, [['A', 'C'], ['B']])
+        self.assertEqual(tests['B'].result.verdict, base.Verdict.ACCEPTED)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+# Copyright (c) 2019-2022 Andrei Ilyin. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#    * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#    * Changes made to the source code must be documented if this code is
+# published in a repository/storage with a public access.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'testerlib'))
+
+from unity_build import UnitySource, group_sources
+
+
+class UnitySourceTest(unittest.TestCase):
+    def test_internal_names(self):
+        source = UnitySource('a.cc', '''
+            namespace {
+            const int kSize = 10;
+            struct Helper {
+                int value = 0;
+            };
+            int Twice(int x) { return 2 * x; }
+            }  // namespace
+            static bool flag = false;
+            int Exported(int y) { return y; }
+        ''')
+        self.assertFalse(source.exclusive)
+        self.assertEqual(source.internal_names,
+                         {'kSize', 'Helper', 'Twice', 'flag'})
+
+    def test_comments_and_literals_are_ignored(self):
+        source = UnitySource('a.cc', '''
+            // #define MAX 1
+            const char* text = "using namespace std;";
+            /* static int hidden; */
+        ''')
+        self.assertFalse(source.exclusive)
+        self.assertEqual(source.internal_names, set())
+
+    def test_using_declaration(self):
+        source = UnitySource('a.cc', '''
+            using std::vector;
+            using Matrix = vector<vector<int>>;
+        ''')
+        self.assertFalse(source.exclusive)
+        self.assertEqual(source.internal_names, {'vector', 'Matrix'})
+
+    def test_exclusive_sources(self):
+        for text in ('#define MAX 1\n',
+                     '#undef assert\n',
+                     'using namespace std;\n',
+                     'namespace { bool operator<(A a, A b); }\n',
+                     'namespace { DEFINE_HELPERS(A) }\n'):
+            with self.subTest(text=text):
+                self.assertTrue(UnitySource('a.cc', text).exclusive)
+
+    def test_test_macros(self):
+        source = UnitySource('a.cc', '''
+            namespace {
+            TEST(Suite, First) {
+                EXPECT_EQ(1, 1);
+            }
+            SAFE_TEST_F(Fixture, Second) {
+            }
+            }  // namespace
+        ''')
+        self.assertFalse(source.exclusive)
+        self.assertEqual(source.internal_names, set())
+
+
+class GroupSourcesTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _write(self, name, text):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def _group(self, paths):
+        return [[source.path for source in group]
+                for group in group_sources(paths)]
+
+    def test_independent_sources_are_grouped(self):
+        a = self._write('a.cc', 'static int a_value = 1;\n')
+        b = self._write('b.cc', 'static int b_value = 2;\n')
+        self.assertEqual(self._group([a, b]), [[a, b]])
+
+    def test_internal_name_conflict(self):
+        a = self._write('a.cc', 'static int Count() { return 1; }\n')
+        b = self._write('b.cc', 'int Use() { return Count(); }\n')
+        c = self._write('c.cc', 'static int other = 3;\n')
+        self.assertEqual(self._group([a, b, c]), [[a, c], [b]])
+
+    def test_exclusive_source(self):
+        a = self._write('a.cc', '#define LIMIT 10\n')
+        b = self._write('b.cc', 'int b_value = 2;\n')
+        c = self._write('c.cc', 'int c_value = 3;\n')
+        self.assertEqual(self._group([a, b, c]), [[a], [b, c]])
+
+    def test_missing_source(self):
+        a = os.path.join(self.temp_dir, 'missing.cc')
+        b = self._write('b.cc', 'int b_value = 2;\n')
+        self.assertEqual(self._group([a, b]), [[a], [b]])
+
+
+if __name__ == '__main__':
+    unittest.main()
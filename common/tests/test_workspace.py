@@ -0,0 +1,93 @@
+# Copyright (c) 2019-2022 Andrei Ilyin. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#    * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#    * Changes made to the source code must be documented if this code is
+# published in a repository/storage with a public access.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'testerlib'))
+
+from workspace import Workspace
+
+TOKEN_FILENAME = 'token'
+
+
+class WorkspaceTest(unittest.TestCase):
+    def setUp(self):
+        self.scratch_root = tempfile.mkdtemp()
+        self.workspace = Workspace(self.scratch_root, preallocated_count=2)
+
+    def tearDown(self):
+        self.workspace.close()
+        shutil.rmtree(self.scratch_root)
+
+    def _list_dirs(self):
+        self.workspace.flush()
+        return sorted(os.listdir(self.workspace.root()))
+
+    def test_directories_are_preallocated(self):
+        self.assertEqual(len(self._list_dirs()), 2)
+        with self.workspace.acquire() as path:
+            self.assertEqual(os.listdir(path), [])
+        self.assertEqual(len(self._list_dirs()), 2)
+
+    def test_files_are_not_passed_to_next_execution(self):
+        with self.workspace.acquire() as path:
+            with open(os.path.join(path, TOKEN_FILENAME), 'w') as f:
+                f.write('secret')
+        self.assertNotIn(os.path.basename(path), self._list_dirs())
+        for i in range(3):
+            with self.workspace.acquire() as next_path:
+                self.assertNotEqual(next_path, path)
+                self.assertEqual(os.listdir(next_path), [])
+
+    @unittest.skipIf(platform.system() == 'Windows', 'POSIX shell is required')
+    def test_process_outliving_execution_cannot_write_token(self):
+        with self.workspace.acquire() as path:
+            process = subprocess.Popen(
+                ['sh', '-c', 'sleep 0.5; echo secret > ' + TOKEN_FILENAME],
+                cwd=path, stderr=subprocess.DEVNULL)
+        acquired = []
+        for i in range(2):
+            with self.workspace.acquire() as next_path:
+                acquired.append(next_path)
+        process.wait()
+        for name in self._list_dirs():
+            self.assertEqual(
+                os.listdir(os.path.join(self.workspace.root(), name)), [])
+        with self.workspace.acquire() as next_path:
+            self.assertNotIn(next_path, [path] + acquired)
+            self.assertEqual(os.listdir(next_path), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
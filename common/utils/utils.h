@@ -473,22 +473,25 @@ double RelativeDifference(double value, double answer);
 #define SAFE_TEST_V(Variant, SuitName, CaseName)                               \
   SAFE_TEST(SuitName##_##Variant, CaseName)
 
-// Speed tests should only be run in Release (OPT) edition of the binary
+// Speed tests should only be run in Release (OPT) edition of the binary.
+// The editions built with SKIP_SPEED_TESTS don't register them at all (the
+// body is still compiled), so the tester doesn't run them there.
 
 #ifdef SKIP_SPEED_TESTS
 constexpr bool kSkipSpeedTests = true;
+
+#define SPEED_TEST_A(SuitName, CaseName, timeout_millis, iters, seed)          \
+  void SuitName##CaseName##TestFn()
 #else
 constexpr bool kSkipSpeedTests = false;
-#endif
 
 #define SPEED_TEST_A(SuitName, CaseName, timeout_millis, iters, seed)          \
   void SuitName##CaseName##TestFn();                                           \
   SAFE_TEST_A(SuitName, CaseName, timeout_millis, iters, seed) {               \
-    if (!kSkipSpeedTests) {                                                    \
-      SuitName##CaseName##TestFn();                                            \
-    }                                                                          \
+    SuitName##CaseName##TestFn();                                              \
   }                                                                            \
   void SuitName##CaseName##TestFn()
+#endif
 
 #define SPEED_TEST(SuitName, CaseName)                                         \
   SPEED_TEST_A(SuitName, CaseName, 60'000, 2, 12345678)
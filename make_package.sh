@@ -35,13 +35,37 @@ echo "Tests files: $tests_files"
 
 rm $LAB_NAME/package.zip || true
 
-zip -j $LAB_NAME/package.zip $tests_files $LAB_NAME/tester_config.py
+# Declarative config (tester_config.json) is preferred over the script. Its
+# structure is validated here, the tests are resolved by build.sh.
+if [[ -f "$LAB_NAME/tester_config.json" ]]; then
+  tester_config=$LAB_NAME/tester_config.json
+  python3 common/testerlib/test_plan.py --check --config $tester_config
+else
+  tester_config=$LAB_NAME/tester_config.py
+fi
+
+zip -j $LAB_NAME/package.zip $tests_files $tester_config
 if [[ -d "$LAB_NAME/tests_src/data" ]]; then
   cd $LAB_NAME/tests_src
   zip ../package.zip ./data/*
   cd - &>/dev/null
 fi
 
+# Variants of the hidden namespace name. build.sh takes one of them for every
+# build instead of a fresh random name, so the test objects are precompiled
+# for each variant (see precompile_libs) and can be cached. More variants
+# make the name harder to guess.
+
+NAMESPACE_VARIANTS=${NAMESPACE_VARIANTS:-8}
+if (( NAMESPACE_VARIANTS > 0 )); then
+  for (( i = 0; i < NAMESPACE_VARIANTS; i++ )); do
+    tr -dc '[:alpha:]' < /dev/urandom | head -c 30 || true
+    echo
+  done > $LAB_NAME/namespace_variants.txt
+  zip -j $LAB_NAME/package.zip $LAB_NAME/namespace_variants.txt
+  rm $LAB_NAME/namespace_variants.txt
+fi
+
 # Add common files to the package
 
 cd common